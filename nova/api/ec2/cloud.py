@@ -1054,12 +1054,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType."""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_uuid):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1138,18 +1140,35 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+
+        # NOTE: Look up the ec2 ids and block device mappings of all the
+        # instances at once, and every image and host only once.
+        instance_uuids = [instance['uuid'] for instance in instances]
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids(instance_uuids)
+        bdms = db.block_device_mapping_get_all_by_instance_uuids(
+                context, instance_uuids)
+        image_ec2_ids = {}
+        zones = {}
+
+        def _image_ec2_id(image_uuid, image_type='ami'):
+            key = (image_uuid, image_type)
+            if key not in image_ec2_ids:
+                image_ec2_ids[key] = ec2utils.glance_id_to_ec2_id(
+                        context, image_uuid, image_type)
+            return image_ec2_ids[key]
+
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
-            i['instanceId'] = ec2_id
-            image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['instanceId'] = ec2_ids[instance_uuid]
+            i['imageId'] = _image_ec2_id(instance['image_ref'])
+            if instance['kernel_id']:
+                i['kernelId'] = _image_ec2_id(instance['kernel_id'], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = _image_ec2_id(instance['ramdisk_id'], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1172,8 +1191,15 @@ class CloudController(object):
             i['dnsName'] = i['publicDnsName'] or i['privateDnsName']
             i['keyName'] = instance['key_name']
             i['tagSet'] = []
-            for k, v in self.compute_api.get_instance_metadata(
-                    context, instance).iteritems():
+            if instance.get('metadata') is not None:
+                # NOTE: The metadata has been read along with the instance.
+                compute_api.check_policy(context, 'get_instance_metadata',
+                                         instance)
+                metadata = utils.metadata_to_dict(instance['metadata'])
+            else:
+                metadata = self.compute_api.get_instance_metadata(context,
+                                                                  instance)
+            for k, v in metadata.iteritems():
                 i['tagSet'].append({'key': k, 'value': v})
 
             if context.is_admin:
@@ -1187,10 +1213,12 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms[instance_uuid])
             host = instance['host']
-            zone = ec2utils.get_availability_zone_by_host(host)
-            i['placement'] = {'availabilityZone': zone}
+            if host not in zones:
+                zones[host] = ec2utils.get_availability_zone_by_host(host)
+            i['placement'] = {'availabilityZone': zones[host]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
@@ -185,6 +185,23 @@ def id_to_ec2_inst_id(instance_id):
         return id_to_ec2_id(instance_id)
 
 
+def ids_to_ec2_inst_ids(instance_uuids):
+    """Get or create the ec2 instance IDs of a list of instance uuids.
+
+    Returns a dict of the ec2 instance ID of each uuid.  The existing IDs
+    are read with a single query.
+    """
+    ctxt = context.get_admin_context()
+    int_ids = db.get_ec2_instance_ids_by_uuids(ctxt, instance_uuids)
+    ec2_ids = {}
+    for instance_uuid in instance_uuids:
+        int_id = int_ids.get(instance_uuid)
+        if int_id is None:
+            int_id = get_int_id_from_instance_uuid(ctxt, instance_uuid)
+        ec2_ids[instance_uuid] = id_to_ec2_id(int_id)
+    return ec2_ids
+
+
 def ec2_inst_id_to_uuid(context, ec2_id):
     """"Convert an instance id to uuid."""
     int_id = ec2_id_to_id(ec2_id)
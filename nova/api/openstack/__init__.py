@@ -20,6 +20,8 @@
 WSGI middleware for OpenStack API controllers.
 """
 
+import threading
+
 import routes
 import webob.dec
 import webob.exc
@@ -139,39 +141,52 @@ class APIRouter(base_wsgi.Router):
         self._setup_routes(mapper, ext_mgr, init_only)
         self._setup_ext_routes(mapper, ext_mgr, init_only)
         self._setup_extensions(ext_mgr)
+        self._setup_lazy_extensions(mapper, ext_mgr, init_only)
         super(APIRouter, self).__init__(mapper)
 
     def _setup_ext_routes(self, mapper, ext_mgr, init_only):
         for resource in ext_mgr.get_resources():
-            LOG.debug(_('Extended resource: %s'),
-                      resource.collection)
+            wsgi_resource = self._create_ext_resource(resource, init_only)
+            if wsgi_resource is not None:
+                self._connect_ext_resource(mapper, resource, wsgi_resource)
 
-            if init_only is not None and resource.collection not in init_only:
-                continue
+    def _create_ext_resource(self, resource, init_only):
+        LOG.debug(_('Extended resource: %s'),
+                  resource.collection)
+
+        if init_only is not None and resource.collection not in init_only:
+            return None
+
+        inherits = None
+        if resource.inherits:
+            inherits = self.resources.get(resource.inherits)
+            if not resource.controller:
+                resource.controller = inherits.controller
+        wsgi_resource = wsgi.Resource(resource.controller,
+                                      inherits=inherits)
+        self.resources[resource.collection] = wsgi_resource
+        return wsgi_resource
 
-            inherits = None
-            if resource.inherits:
-                inherits = self.resources.get(resource.inherits)
-                if not resource.controller:
-                    resource.controller = inherits.controller
-            wsgi_resource = wsgi.Resource(resource.controller,
-                                          inherits=inherits)
-            self.resources[resource.collection] = wsgi_resource
-            kargs = dict(
-                controller=wsgi_resource,
-                collection=resource.collection_actions,
-                member=resource.member_actions)
+    def _connect_ext_resource(self, mapper, resource, wsgi_resource):
+        kargs = dict(
+            controller=wsgi_resource,
+            collection=resource.collection_actions,
+            member=resource.member_actions)
 
-            if resource.parent:
-                kargs['parent_resource'] = resource.parent
+        if resource.parent:
+            kargs['parent_resource'] = resource.parent
 
-            mapper.resource(resource.collection, resource.collection, **kargs)
+        mapper.resource(resource.collection, resource.collection, **kargs)
 
-            if resource.custom_routes_fn:
-                resource.custom_routes_fn(mapper, wsgi_resource)
+        if resource.custom_routes_fn:
+            resource.custom_routes_fn(mapper, wsgi_resource)
 
     def _setup_extensions(self, ext_mgr):
-        for extension in ext_mgr.get_controller_extensions():
+        self._register_controller_extensions(
+                ext_mgr.get_controller_extensions())
+
+    def _register_controller_extensions(self, controller_exts):
+        for extension in controller_exts:
             ext_name = extension.extension.name
             collection = extension.collection
             controller = extension.controller
@@ -189,5 +204,111 @@ class APIRouter(base_wsgi.Router):
             resource.register_actions(controller)
             resource.register_extensions(controller)
 
+    def _setup_lazy_extensions(self, mapper, ext_mgr, init_only):
+        """Prepare to import the extensions which were registered without
+        importing them when the first request for their collections arrives.
+
+        Requests which no other route matches are handed to a separate
+        router for the resources of lazily imported extensions.  It is
+        rebuilt whenever extensions are imported.
+        """
+        self._ext_mgr = ext_mgr
+        self._init_only = init_only
+        self._lazy_extensions = getattr(ext_mgr, 'get_lazy_extensions',
+                                        list)()
+        self._lazy_collections = self._index_lazy_extensions(
+                self._lazy_extensions)
+        self._lazy_resources = []
+        self._lazy_router = base_wsgi.Router(ProjectMapper())
+        self._lazy_lock = threading.Lock()
+        if self._lazy_extensions:
+            mapper.connect('/{project_id}/{lazy_path:.*}',
+                           controller=self._route_lazy)
+
+    @staticmethod
+    def _index_lazy_extensions(lazy_exts):
+        """Returns a dict of the extensions adding or extending each
+        collection.
+        """
+        lazy_collections = {}
+        for ext in lazy_exts:
+            for collection in (ext.resource_collections |
+                               ext.controller_collections):
+                lazy_collections.setdefault(collection, []).append(ext)
+        return lazy_collections
+
+    def _lazy_extensions_in(self, collections):
+        lazy_exts = set()
+        for collection in collections:
+            lazy_exts.update(self._lazy_collections.get(collection, ()))
+        return lazy_exts
+
+    def _lazy_extensions_for(self, path):
+        """Returns the extensions not imported yet which are needed to
+        handle a request for path.
+        """
+        collections = set(segment.split('.')[0]
+                          for segment in path.split('/'))
+        pending = self._lazy_extensions_in(collections)
+        wanted = set()
+        while pending:
+            ext = pending.pop()
+            wanted.add(ext)
+            # The extensions extending the resources of this one and the
+            # resources it inherits, and those adding the resources it
+            # extends, are needed as well.
+            needed = (ext.resource_collections | ext.inherited_collections |
+                      (ext.controller_collections - set(self.resources)))
+            pending.update(self._lazy_extensions_in(needed) - wanted)
+        return wanted
+
+    def _import_lazy_extensions(self, path):
+        with self._lazy_lock:
+            lazy_exts = self._lazy_extensions_for(path)
+            if not lazy_exts:
+                return
+            self._lazy_extensions = [ext for ext in self._lazy_extensions
+                                     if ext not in lazy_exts]
+            self._lazy_collections = self._index_lazy_extensions(
+                    self._lazy_extensions)
+            descriptors = filter(None, [
+                    self._ext_mgr.import_lazy_extension(ext)
+                    for ext in sorted(lazy_exts, key=lambda ext: ext.alias)])
+
+            resources = []
+            controller_exts = []
+            for descriptor in descriptors:
+                resources.extend(getattr(descriptor, 'get_resources',
+                                         list)())
+                controller_exts.extend(getattr(
+                        descriptor, 'get_controller_extensions', list)())
+            for resource in resources:
+                wsgi_resource = self._create_ext_resource(resource,
+                                                          self._init_only)
+                if wsgi_resource is not None:
+                    self._lazy_resources.append((resource, wsgi_resource))
+            self._register_controller_extensions(controller_exts)
+
+            mapper = ProjectMapper()
+            for resource, wsgi_resource in self._lazy_resources:
+                self._connect_ext_resource(mapper, resource, wsgi_resource)
+            self._lazy_router = base_wsgi.Router(mapper)
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, req):
+        # NOTE: The lock is only taken when a segment of the path names a
+        # collection of an extension which is not imported yet.
+        lazy_collections = self._lazy_collections
+        if lazy_collections:
+            for segment in req.path_info.split('/'):
+                if segment.split('.')[0] in lazy_collections:
+                    self._import_lazy_extensions(req.path_info)
+                    break
+        return self._router
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def _route_lazy(self, req):
+        return self._lazy_router
+
     def _setup_routes(self, mapper, ext_mgr, init_only):
         raise NotImplementedError()
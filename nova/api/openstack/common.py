@@ -16,6 +16,7 @@
 #    under the License.
 
 import functools
+import hashlib
 import itertools
 import os
 import re
@@ -30,6 +31,7 @@ from nova.compute import task_states
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova import exception
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova import quota
 
@@ -46,6 +48,11 @@ osapi_opts = [
                default=None,
                help='Base URL that will be presented to users in links '
                     'to glance resources'),
+    cfg.BoolOpt('osapi_list_etags',
+                default=False,
+                help='Return ETags for servers, flavors and images listings '
+                     'and answer conditional requests for them with 304 Not '
+                     'Modified when the listing has not changed'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(osapi_opts)
@@ -350,6 +357,55 @@ def get_networks_for_instance(context, instance):
     return get_networks_for_instance_from_nw_info(nw_info)
 
 
+def get_cached_networks_for_instance(request, instance):
+    """Returns get_networks_for_instance() for an instance, hydrating its
+    network info only once per request.
+
+    The networks returned are shared by all the callers and must not be
+    modified.
+    """
+    get_networks = getattr(request, 'get_instance_networks', None)
+    if get_networks is None:
+        return get_networks_for_instance(request.environ['nova.context'],
+                                         instance)
+    networks = get_networks(instance['uuid'])
+    if networks is None:
+        networks = get_networks_for_instance(request.environ['nova.context'],
+                                             instance)
+        request.cache_instance_networks(instance['uuid'], networks)
+    return networks
+
+
+def conditional_list(request, get_version, build):
+    """Returns the listing built by build(), with an ETag derived from the
+    version returned by get_version().
+
+    If the request has a matching If-None-Match header, a 304 Not Modified
+    response is returned without building the listing.  The version must
+    be serializable to JSON and change whenever the listing would, or be
+    None if it cannot be determined, in which case no ETag is returned.
+    """
+    if not CONF.osapi_list_etags:
+        return build()
+    version = get_version()
+    if version is None:
+        return build()
+
+    context = request.environ['nova.context']
+    key = [version, request.path_qs, request.best_match_content_type(),
+           context.user_id, context.project_id, context.is_admin,
+           sorted(context.roles)]
+    etag = hashlib.md5(jsonutils.dumps(key, sort_keys=True)).hexdigest()
+    headers = {'ETag': '"%s"' % etag}
+    if etag in request.if_none_match:
+        # NOTE: Returned rather than raised, so that it isn't turned into
+        # a fault.
+        return webob.exc.HTTPNotModified(headers=headers)
+    resp_obj = wsgi.ResponseObject(build())
+    resp_obj['ETag'] = headers['ETag']
+    return resp_obj
+
+
 def raise_http_conflict_for_instance_invalid_state(exc, action):
     """Return a webob.exc.HTTPConflict instance containing a message
     appropriate to return via the API based on the original
@@ -464,6 +520,25 @@ class ViewBuilder(object):
                                             collection_name),
         }]
 
+    def _get_link_prefix(self, request, bookmark=False):
+        """Return the prefix of the href or bookmark links.
+
+        The prefix is the same for all the links of a request, so it is
+        computed once per request.
+        """
+        # NOTE: Only the script name of the application URL changes while
+        # a request is routed.
+        key = (bookmark, request.environ.get('SCRIPT_NAME'),
+               CONF.osapi_compute_link_prefix)
+        prefixes = request.environ.setdefault('nova.link_prefixes', {})
+        prefix = prefixes.get(key)
+        if prefix is None:
+            url = request.application_url
+            if bookmark:
+                url = remove_version_from_href(url)
+            prefix = prefixes[key] = self._update_compute_link_prefix(url)
+        return prefix
+
     def _get_next_link(self, request, identifier, collection_name):
         """Return href string with proper limit and marker params."""
         params = request.params.copy()
@@ -476,7 +551,7 @@ class ViewBuilder(object):
 
     def _get_href_link(self, request, identifier, collection_name):
         """Return an href string pointing to this object."""
-        prefix = self._update_compute_link_prefix(request.application_url)
+        prefix = self._get_link_prefix(request)
         return os.path.join(prefix,
                             request.environ["nova.context"].project_id,
                             collection_name,
@@ -484,8 +559,7 @@ class ViewBuilder(object):
 
     def _get_bookmark_link(self, request, identifier, collection_name):
         """Create a URL that refers to a specific resource."""
-        base_url = remove_version_from_href(request.application_url)
-        base_url = self._update_compute_link_prefix(base_url)
+        base_url = self._get_link_prefix(request, bookmark=True)
         return os.path.join(base_url,
                             request.environ["nova.context"].project_id,
                             collection_name,
@@ -33,9 +33,9 @@ class ExtendedIpsMacController(wsgi.Controller):
     def __init__(self, *args, **kwargs):
         super(ExtendedIpsMacController, self).__init__(*args, **kwargs)
 
-    def _extend_server(self, context, server, instance):
+    def _extend_server(self, req, server, instance):
         key = "%s:mac_addr" % Extended_ips_mac.alias
-        networks = common.get_networks_for_instance(context, instance)
+        networks = common.get_cached_networks_for_instance(req, instance)
         for label, network in networks.items():
             # NOTE(vish): ips are hidden in some states via the
             #             hide_server_addresses extension.
@@ -55,7 +55,7 @@ class ExtendedIpsMacController(wsgi.Controller):
             db_instance = req.get_db_instance(server['id'])
             # server['id'] is guaranteed to be in the cache due to
             # the core API adding it in its 'show' method.
-            self._extend_server(context, server, db_instance)
+            self._extend_server(req, server, db_instance)
 
     @wsgi.extends
     def detail(self, req, resp_obj):
@@ -68,7 +68,7 @@ class ExtendedIpsMacController(wsgi.Controller):
                 db_instance = req.get_db_instance(server['id'])
                 # server['id'] is guaranteed to be in the cache due to
                 # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+                self._extend_server(req, server, db_instance)
 
 
 class Extended_ips_mac(extensions.ExtensionDescriptor):
@@ -0,0 +1,143 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+import webob
+
+from nova.api.openstack import extensions
+from nova.api.openstack import wsgi
+from nova.api.openstack import xmlutil
+from nova import compute
+from nova import exception
+from nova.openstack.common import log as logging
+from nova.openstack.common import uuidutils
+
+CONF = cfg.CONF
+CONF.import_opt('osapi_max_limit', 'nova.api.openstack.common')
+
+LOG = logging.getLogger(__name__)
+authorize = extensions.extension_authorizer('compute', 'server_bulk_actions')
+
+ACTIONS = ('start', 'stop', 'reboot', 'delete')
+REBOOT_TYPES = ('SOFT', 'HARD')
+
+
+class ServerBulkActionsTemplate(xmlutil.TemplateBuilder):
+    def construct(self):
+        root = xmlutil.TemplateElement('servers')
+        elem = xmlutil.SubTemplateElement(root, 'server', selector='servers')
+        elem.set('id')
+        elem.set('status')
+        elem.set('message')
+        return xmlutil.MasterTemplate(root, 1)
+
+
+class ServerBulkActionXMLDeserializer(wsgi.MetadataXMLDeserializer):
+    def default(self, string):
+        dom = xmlutil.safe_minidom_parse_string(string)
+        node = self.find_first_child_named(dom, 'bulk_action')
+        bulk_action = {}
+        if node is not None:
+            for attr in ('action', 'type'):
+                if node.hasAttribute(attr):
+                    bulk_action[attr] = node.getAttribute(attr)
+            bulk_action['servers'] = [
+                    server_node.getAttribute('id') for server_node in
+                    self.find_children_named(node, 'server')]
+        return {'body': {'bulk_action': bulk_action}}
+
+
+def _status_for(error):
+    if error is None:
+        return 202
+    if isinstance(error, (exception.InstanceInvalidState,
+                          exception.InstanceNotReady)):
+        return 409
+    return error.code
+
+
+class ServerBulkActionsController(wsgi.Controller):
+    def __init__(self, *args, **kwargs):
+        super(ServerBulkActionsController, self).__init__(*args, **kwargs)
+        self.compute_api = compute.API()
+
+    def _get_bulk_action(self, body):
+        try:
+            bulk_action = body['bulk_action']
+            action = bulk_action['action']
+            instance_uuids = bulk_action['servers']
+        except (KeyError, TypeError):
+            msg = _("bulk_action requires an action and a list of servers")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+
+        if action not in ACTIONS:
+            msg = _("Action must be one of %s") % ', '.join(ACTIONS)
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        if (not isinstance(instance_uuids, list) or
+                not all(uuidutils.is_uuid_like(instance_uuid)
+                        for instance_uuid in instance_uuids)):
+            msg = _("servers must be a list of server uuids")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        if len(instance_uuids) > CONF.osapi_max_limit:
+            msg = (_("No more than %d servers can be acted on at once") %
+                   CONF.osapi_max_limit)
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+
+        args = ()
+        if action == 'reboot':
+            reboot_type = str(bulk_action.get('type', '')).upper()
+            if reboot_type not in REBOOT_TYPES:
+                msg = _("Argument 'type' for reboot is not HARD or SOFT")
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+            args = (reboot_type,)
+        return action, instance_uuids, args
+
+    @wsgi.serializers(xml=ServerBulkActionsTemplate)
+    @wsgi.deserializers(xml=ServerBulkActionXMLDeserializer)
+    def create(self, req, body):
+        """Start, stop, reboot or delete a list of servers."""
+        context = req.environ['nova.context']
+        authorize(context)
+        action, instance_uuids, args = self._get_bulk_action(body)
+        LOG.debug(_("Bulk %(action)s of %(count)d servers"),
+                  {'action': action, 'count': len(instance_uuids)})
+
+        errors = self.compute_api.bulk_action(context, instance_uuids,
+                                              action, *args)
+        servers = []
+        for instance_uuid in instance_uuids:
+            error = errors[instance_uuid]
+            server = {'id': instance_uuid, 'status': _status_for(error)}
+            if error is not None:
+                server['message'] = error.format_message()
+            servers.append(server)
+        return {'servers': servers}
+
+
+class Server_bulk_actions(extensions.ExtensionDescriptor):
+    """Start, stop, reboot or delete many servers with one request."""
+
+    name = "ServerBulkActions"
+    alias = "os-server-bulk-actions"
+    namespace = ("http://docs.openstack.org/compute/ext/"
+                 "server-bulk-actions/api/v2")
+    updated = "2013-06-01T00:00:00+00:00"
+
+    def get_resources(self):
+        resource = extensions.ResourceExtension('os-server-bulk-actions',
+                                                ServerBulkActionsController())
+        return [resource]
@@ -16,8 +16,10 @@
 #    under the License.
 
 import datetime
+import hashlib
 import urlparse
 
+from oslo.config import cfg
 from webob import exc
 
 from nova.api.openstack import extensions
@@ -26,7 +28,24 @@ from nova.api.openstack import xmlutil
 from nova.compute import api
 from nova.compute import flavors
 from nova import exception
+from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
+from nova import utils
+
+usage_opts = [
+    cfg.IntOpt('simple_tenant_usage_cache_time',
+               default=0,
+               help='Number of seconds the usage of periods which ended in '
+                    'the past is cached for.  0 disables caching'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(usage_opts)
+
+# Usage of a period is only cached once the launches and terminations
+# within it have been recorded, allowing for the clocks of the compute
+# hosts to differ by this many seconds.
+USAGE_SETTLE_TIME = 60
 
 authorize_show = extensions.extension_authorizer('compute',
                                                  'simple_tenant_usage:show')
@@ -68,6 +87,11 @@ class SimpleTenantUsagesTemplate(xmlutil.TemplateBuilder):
 
 
 class SimpleTenantUsageController(object):
+    KEY_PREFIX = 'nova-tenant-usage'
+
+    def __init__(self):
+        self._cache = memorycache.get_client()
+
     def _hours_for(self, instance, period_start, period_stop):
         launched_at = instance['launched_at']
         terminated_at = instance['terminated_at']
@@ -128,17 +152,18 @@ class SimpleTenantUsageController(object):
 
         return it_ref
 
-    def _tenant_usages_for_period(self, context, period_start,
-                                  period_stop, tenant_id=None, detailed=True):
-
+    def _get_usages(self, context, period_start, period_stop, tenant_id,
+                    detailed):
         compute_api = api.API()
-        instances = compute_api.get_active_by_window(context,
-                                                     period_start,
-                                                     period_stop,
-                                                     tenant_id)
-        rval = {}
+        instances = compute_api.get_usage_by_window(context,
+                                                    period_start,
+                                                    period_stop,
+                                                    tenant_id)
+        usages = []
         flavors = {}
 
+        # NOTE: The instances arrive in order of tenant, so the usage of
+        # each tenant is complete once the next one shows up.
         for instance in instances:
             info = {}
             info['hours'] = self._hours_for(instance,
@@ -168,16 +193,7 @@ class SimpleTenantUsageController(object):
             else:
                 info['state'] = instance['vm_state']
 
-            now = timeutils.utcnow()
-
-            if info['state'] == 'terminated':
-                delta = info['ended_at'] - info['started_at']
-            else:
-                delta = now - info['started_at']
-
-            info['uptime'] = delta.days * 24 * 3600 + delta.seconds
-
-            if info['tenant_id'] not in rval:
+            if not usages or usages[-1]['tenant_id'] != info['tenant_id']:
                 summary = {}
                 summary['tenant_id'] = info['tenant_id']
                 if detailed:
@@ -188,9 +204,9 @@ class SimpleTenantUsageController(object):
                 summary['total_hours'] = 0
                 summary['start'] = period_start
                 summary['stop'] = period_stop
-                rval[info['tenant_id']] = summary
+                usages.append(summary)
 
-            summary = rval[info['tenant_id']]
+            summary = usages[-1]
             summary['total_local_gb_usage'] += info['local_gb'] * info['hours']
             summary['total_vcpus_usage'] += info['vcpus'] * info['hours']
             summary['total_memory_mb_usage'] += (info['memory_mb'] *
@@ -200,7 +216,48 @@ class SimpleTenantUsageController(object):
             if detailed:
                 summary['server_usages'].append(info)
 
-        return rval.values()
+        return usages
+
+    def _set_uptimes(self, usages):
+        now = timeutils.utcnow()
+        for summary in usages:
+            for info in summary.get('server_usages', []):
+                if info['state'] == 'terminated':
+                    delta = info['ended_at'] - info['started_at']
+                else:
+                    delta = now - info['started_at']
+
+                info['uptime'] = delta.days * 24 * 3600 + delta.seconds
+
+    def _cache_key(self, period_start, period_stop, tenant_id, detailed):
+        name = '%s %s %s %s' % (utils.utf8(tenant_id or ''),
+                                period_start.isoformat(),
+                                period_stop.isoformat(), detailed)
+        return '%s-%s' % (self.KEY_PREFIX, hashlib.md5(name).hexdigest())
+
+    def _tenant_usages_for_period(self, context, period_start,
+                                  period_stop, tenant_id=None, detailed=True):
+        """Return the usage of each tenant over a period.
+
+        The usage of a period which ended in the past does not change any
+        more, so it is cached for simple_tenant_usage_cache_time seconds.
+        Only the uptime of running servers is brought up to date.
+        """
+        cache_key = None
+        if (CONF.simple_tenant_usage_cache_time and
+                timeutils.is_older_than(period_stop, USAGE_SETTLE_TIME)):
+            cache_key = self._cache_key(period_start, period_stop,
+                                        tenant_id, detailed)
+            usages = self._cache.get(cache_key)
+        if cache_key is None or usages is None:
+            usages = self._get_usages(context, period_start, period_stop,
+                                      tenant_id, detailed)
+            if cache_key is not None:
+                self._cache.set(cache_key, usages,
+                                time=CONF.simple_tenant_usage_cache_time)
+
+        self._set_uptimes(usages)
+        return usages
 
     def _parse_datetime(self, dtstr):
         if not dtstr:
@@ -27,6 +27,11 @@ ext_opts = [
                       'nova.api.openstack.compute.contrib.standard_extensions'
                       ],
                     help='osapi compute extension to load'),
+    cfg.BoolOpt('osapi_compute_lazy_extensions',
+                default=False,
+                help='Import the standard extensions when the first request '
+                     'for one of their resources arrives rather than at '
+                     'startup'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(ext_opts)
@@ -38,6 +43,7 @@ class ExtensionManager(base_extensions.ExtensionManager):
     def __init__(self):
         LOG.audit(_('Initializing extension manager.'))
         self.cls_list = CONF.osapi_compute_extension
+        self.lazy = CONF.osapi_compute_lazy_extensions
         self.PluginManager = pluginmanager.PluginManager('nova',
                                                          'compute-extensions')
         self.PluginManager.load_plugins()
@@ -71,14 +71,20 @@ class Controller(wsgi.Controller):
     def index(self, req):
         """Return all flavors in brief."""
         limited_flavors = self._get_flavors(req)
-        return self._view_builder.index(req, limited_flavors)
+        return common.conditional_list(
+                req, lambda: limited_flavors,
+                lambda: self._view_builder.index(req, limited_flavors))
 
     @wsgi.serializers(xml=FlavorsTemplate)
     def detail(self, req):
         """Return all flavors in detail."""
         limited_flavors = self._get_flavors(req)
-        req.cache_db_flavors(limited_flavors)
-        return self._view_builder.detail(req, limited_flavors)
+
+        def build():
+            req.cache_db_flavors(limited_flavors)
+            return self._view_builder.detail(req, limited_flavors)
+
+        return common.conditional_list(req, lambda: limited_flavors, build)
 
     @wsgi.serializers(xml=FlavorTemplate)
     def show(self, req, id):
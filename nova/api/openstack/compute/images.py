@@ -182,7 +182,9 @@ class Controller(wsgi.Controller):
                                                 **page_params)
         except exception.Invalid as e:
             raise webob.exc.HTTPBadRequest(explanation=str(e))
-        return self._view_builder.index(req, images)
+        return common.conditional_list(
+                req, lambda: images,
+                lambda: self._view_builder.index(req, images))
 
     @wsgi.serializers(xml=ImagesTemplate)
     def detail(self, req):
@@ -203,8 +205,11 @@ class Controller(wsgi.Controller):
         except exception.Invalid as e:
             raise webob.exc.HTTPBadRequest(explanation=str(e))
 
-        req.cache_db_items('images', images, 'id')
-        return self._view_builder.detail(req, images)
+        def build():
+            req.cache_db_items('images', images, 'id')
+            return self._view_builder.detail(req, images)
+
+        return common.conditional_list(req, lambda: images, build)
 
     def create(self, *args, **kwargs):
         raise webob.exc.HTTPMethodNotAllowed()
@@ -19,6 +19,7 @@ Module dedicated functions/classes dealing with rate limiting requests.
 
 import collections
 import copy
+import hashlib
 import httplib
 import math
 import re
@@ -32,7 +33,9 @@ from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
+from nova.openstack.common import memorycache
 from nova import quota
+from nova import utils
 from nova import wsgi as base_wsgi
 
 
@@ -400,6 +403,173 @@ class Limiter(object):
         return result
 
 
+class MemcacheLimiter(Limiter):
+    """
+    Rate-limit checking class which keeps its counters in memcached, so
+    that the limits are shared by all the API workers and nodes using the
+    same memcached_servers.  Without memcached_servers, the counters are
+    kept in the memory of the process.
+
+    Each limit counts the requests made in fixed windows of its unit.  The
+    number of requests made during the last unit is estimated from the
+    counts of the current and the previous window, the previous one being
+    weighted by the part of it which is still within the last unit.
+    Requests which are rejected are not counted.
+
+    To use it, set "limiter" in the ratelimit filter of api-paste.ini to
+    nova.api.openstack.compute.limits.MemcacheLimiter.
+    """
+
+    KEY_PREFIX = 'nova-ratelimit'
+
+    def __init__(self, limits, **kwargs):
+        """
+        Initialize the new `MemcacheLimiter`.
+
+        @param limits: List of `Limit` objects
+        """
+        super(MemcacheLimiter, self).__init__(limits, **kwargs)
+        self._cache = memorycache.get_client()
+
+    def _get_time(self):
+        """Retrieve the current time. Broken out for testability."""
+        return time.time()
+
+    def _get_rules(self, username):
+        if username in self.levels:
+            return self.levels[username]
+        return self.limits
+
+    def _get_windows(self, limits, username, now):
+        """Return the keys of the current and previous window of each
+        limit, and the seconds elapsed in the current window.
+        """
+        windows = []
+        for limit in limits:
+            name = '%s %s %s %d' % (utils.utf8(username or ''),
+                                    utils.utf8(limit.verb),
+                                    utils.utf8(limit.regex), limit.unit)
+            name = hashlib.md5(name).hexdigest()
+            window = int(now // limit.unit)
+            windows.append(('%s-%s-%d' % (self.KEY_PREFIX, name, window),
+                            '%s-%s-%d' % (self.KEY_PREFIX, name, window - 1),
+                            now - window * limit.unit))
+        return windows
+
+    def _get_counts(self, windows):
+        keys = []
+        for current_key, previous_key, elapsed in windows:
+            keys.extend([current_key, previous_key])
+        get_multi = getattr(self._cache, 'get_multi', None)
+        if get_multi is not None:
+            values = get_multi(keys)
+        else:
+            values = dict((key, self._cache.get(key)) for key in keys)
+        return dict((key, int(values.get(key) or 0)) for key in keys)
+
+    def _increment(self, key, unit):
+        count = self._cache.incr(key)
+        if count is None:
+            # NOTE: A window is still needed as the previous window of the
+            # next one, so the counters expire after two units.
+            if self._cache.add(key, '1', time=2 * unit):
+                return 1
+            count = self._cache.incr(key)
+        return int(count or 1)
+
+    @staticmethod
+    def _estimate(limit, current, previous, elapsed):
+        """Estimate the number of requests made during the last unit."""
+        return current + previous * (1 - elapsed / float(limit.unit))
+
+    @staticmethod
+    def _delay(limit, current, previous, elapsed):
+        """Return the seconds until one more request is allowed."""
+        allowed = limit.value - 1
+        unit = float(limit.unit)
+        if current <= allowed:
+            return unit * (1 - float(allowed - current) / previous) - elapsed
+        return unit - elapsed + unit * (1 - float(allowed) / current)
+
+    def get_limits(self, username=None):
+        """
+        Return the limits for a given user.
+        """
+        now = self._get_time()
+        limits = self._get_rules(username)
+        windows = self._get_windows(limits, username, now)
+        counts = self._get_counts(windows)
+
+        result = []
+        for limit, (current_key, previous_key, elapsed) in zip(limits,
+                                                               windows):
+            current = counts[current_key]
+            previous = counts[previous_key]
+            remaining = limit.value - self._estimate(limit, current,
+                                                     previous, elapsed)
+            remaining = max(int(math.floor(remaining)), 0)
+            next_request = now
+            if not remaining:
+                next_request += self._delay(limit, current, previous,
+                                            elapsed)
+            result.append({
+                "verb": limit.verb,
+                "URI": limit.uri,
+                "regex": limit.regex,
+                "value": limit.value,
+                "remaining": remaining,
+                "unit": limit.display_unit(),
+                "resetTime": int(next_request),
+            })
+        return result
+
+    def check_for_delay(self, verb, url, username=None):
+        """
+        Check the given verb/user/user triplet for limit.
+
+        @return: Tuple of delay (in seconds) and error message (or None, None)
+        """
+        limits = [limit for limit in self._get_rules(username)
+                  if limit.verb == verb and re.match(limit.regex, url)]
+        if not limits:
+            return None, None
+
+        now = self._get_time()
+        windows = self._get_windows(limits, username, now)
+        counts = self._get_counts(windows)
+
+        delays = []
+        for limit, (current_key, previous_key, elapsed) in zip(limits,
+                                                               windows):
+            current = counts[current_key]
+            previous = counts[previous_key]
+            estimate = self._estimate(limit, current, previous, elapsed)
+            if estimate + 1 > limit.value:
+                delays.append((self._delay(limit, current, previous,
+                                           elapsed),
+                               limit.error_message))
+
+        if not delays:
+            for limit, (current_key, previous_key, elapsed) in zip(limits,
+                                                                   windows):
+                # NOTE: Concurrent requests may have been counted since
+                # the counts were read.  If so, this request is rejected
+                # even though it has been counted.
+                current = self._increment(current_key, limit.unit) - 1
+                previous = counts[previous_key]
+                estimate = self._estimate(limit, current, previous, elapsed)
+                if estimate + 1 > limit.value:
+                    delays.append((self._delay(limit, current, previous,
+                                               elapsed),
+                                   limit.error_message))
+
+        if delays:
+            delays.sort()
+            return delays[0]
+
+        return None, None
+
+
 class WsgiLimiter(object):
     """
     Rate-limit checking from a WSGI application. Uses an in-memory `Limiter`.
@@ -495,7 +495,24 @@ class Controller(wsgi.Controller):
 
     def _get_servers(self, req, is_detail):
         """Returns a list of servers, based on any search options specified."""
+        search_opts = self._get_search_opts(req)
+        if search_opts is None:
+            return {'servers': []}
 
+        context = req.environ['nova.context']
+
+        def get_version():
+            return self._get_servers_version(context, search_opts)
+
+        def build():
+            return self._build_servers(req, context, search_opts, is_detail)
+
+        return common.conditional_list(req, get_version, build)
+
+    def _get_search_opts(self, req):
+        """Returns the search options for compute_api.get_all(), or None if
+        no server can match them.
+        """
         search_opts = {}
         search_opts.update(req.GET)
 
@@ -509,7 +526,7 @@ class Controller(wsgi.Controller):
         if status is not None:
             state = common.vm_state_from_status(status)
             if state is None:
-                return {'servers': []}
+                return None
             search_opts['vm_state'] = state
 
         if 'changes-since' in search_opts:
@@ -544,12 +561,31 @@ class Controller(wsgi.Controller):
             else:
                 search_opts['user_id'] = context.user_id
 
+        return search_opts
+
+    def _get_servers_version(self, context, search_opts):
+        try:
+            version = self.compute_api.get_all_version(
+                    context, search_opts=search_opts)
+        except exception.FlavorNotFound:
+            return None
+        # NOTE: Timestamps are stored with a precision of one second, so
+        # further changes made within the second of the latest one would
+        # not change the version.
+        updated_at = version['updated_at']
+        if updated_at is not None and not timeutils.is_older_than(updated_at,
+                                                                  1):
+            return None
+        return version
+
+    def _build_servers(self, req, context, search_opts, is_detail):
         limit, marker = common.get_limit_and_marker(req)
         try:
             instance_list = self.compute_api.get_all(context,
                                                      search_opts=search_opts,
                                                      limit=limit,
-                                                     marker=marker)
+                                                     marker=marker,
+                                                     use_slave=True)
         except exception.MarkerNotFound as e:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
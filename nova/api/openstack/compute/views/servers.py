@@ -159,8 +159,7 @@ class ViewBuilder(common.ViewBuilder):
             return sha_hash.hexdigest()
 
     def _get_addresses(self, request, instance):
-        context = request.environ["nova.context"]
-        networks = common.get_networks_for_instance(context, instance)
+        networks = common.get_cached_networks_for_instance(request, instance)
         return self._address_builder.index(networks)["addresses"]
 
     def _get_image(self, request, instance):
@@ -16,7 +16,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import ast
 import os
+import resource
+import time
 
 import webob.dec
 import webob.exc
@@ -169,6 +172,98 @@ class ExtensionsResource(wsgi.Resource):
         raise webob.exc.HTTPNotFound()
 
 
+class LazyExtension(object):
+    """Stands in for an extension whose module has not been imported yet.
+
+    It carries the attributes of the extension descriptor, read from the
+    source of its module, and the names of the collections the extension
+    adds or extends, so that the API router can import it when the first
+    request for one of them arrives.  Until then it has neither resources
+    nor controller extensions.
+    """
+
+    def __init__(self, classpath, info):
+        self.classpath = classpath
+        self.name = info['name']
+        self.alias = info['alias']
+        self.namespace = info['namespace']
+        self.updated = info['updated']
+        self.__doc__ = info['description']
+        self.resource_collections = info['resource_collections']
+        self.controller_collections = info['controller_collections']
+        self.inherited_collections = info['inherited_collections']
+
+
+def describe_extension(filename, classname):
+    """Describe the extension classname of the module in filename without
+    importing it.
+
+    Returns the information LazyExtension needs, or None if the descriptor
+    attributes or the collection names are not string literals or module
+    level constants, or if resources or controller extensions are created
+    outside of the descriptor class.
+    """
+    with open(filename) as f:
+        source = f.read()
+    tree = ast.parse(source, filename)
+
+    constants = {}
+    descriptor = None
+    for stmt in tree.body:
+        if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and
+                isinstance(stmt.targets[0], ast.Name) and
+                isinstance(stmt.value, ast.Str)):
+            constants[stmt.targets[0].id] = stmt.value.s
+        elif isinstance(stmt, ast.ClassDef) and stmt.name == classname:
+            descriptor = stmt
+    if descriptor is None:
+        return None
+
+    def literal(node):
+        if isinstance(node, ast.Str):
+            return node.s
+        if isinstance(node, ast.Name) and node.id in constants:
+            return constants[node.id]
+        raise ValueError(_('Not a string literal'))
+
+    info = dict(description=ast.get_docstring(descriptor, clean=False),
+                resource_collections=set(), controller_collections=set(),
+                inherited_collections=set())
+    attrs = ('name', 'alias', 'namespace', 'updated')
+    calls = 0
+    try:
+        for stmt in descriptor.body:
+            if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and
+                    getattr(stmt.targets[0], 'id', None) in attrs):
+                info[stmt.targets[0].id] = literal(stmt.value)
+        for node in ast.walk(descriptor):
+            if isinstance(node, ast.Call):
+                func = getattr(node.func, 'attr',
+                               getattr(node.func, 'id', None))
+                if func == 'ResourceExtension':
+                    calls += 1
+                    info['resource_collections'].add(literal(node.args[0]))
+                    for keyword in node.keywords:
+                        if keyword.arg == 'inherits':
+                            info['inherited_collections'].add(
+                                    literal(keyword.value))
+                elif func == 'ControllerExtension':
+                    calls += 1
+                    info['controller_collections'].add(
+                            literal(node.args[1]))
+    except (ValueError, IndexError):
+        return None
+
+    if calls != (source.count('ResourceExtension(') +
+                 source.count('ControllerExtension(')):
+        return None
+
+    for key in attrs + ('description',):
+        if not isinstance(info.get(key), basestring):
+            return None
+    return info
+
+
 class ExtensionManager(object):
     """Load extensions from the configured extension path.
 
@@ -176,6 +271,9 @@ class ExtensionManager(object):
     example extension implementation.
 
     """
+    # Whether standard extensions are described without importing them
+    lazy = False
+
     def sorted_extensions(self):
         if self.sorted_ext_list is None:
             self.sorted_ext_list = sorted(self.extensions.iteritems())
@@ -192,9 +290,15 @@ class ExtensionManager(object):
             return
 
         alias = ext.alias
-        LOG.audit(_('Loaded extension: %s'), alias)
+        if isinstance(ext, LazyExtension):
+            LOG.audit(_('Found extension: %s'), alias)
+        else:
+            LOG.audit(_('Loaded extension: %s'), alias)
 
-        if alias in self.extensions:
+        # NOTE: A lazily loaded extension replaces its stand-in.
+        if alias in self.extensions and (
+                isinstance(ext, LazyExtension) or
+                not isinstance(self.extensions[alias], LazyExtension)):
             raise exception.NovaException("Found duplicate extension: %s"
                                           % alias)
         self.extensions[alias] = ext
@@ -253,6 +357,8 @@ class ExtensionManager(object):
         """
 
         LOG.debug(_("Loading extension %s"), ext_factory)
+        start = time.time()
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
         if isinstance(ext_factory, basestring):
             # Load the factory
@@ -264,6 +370,48 @@ class ExtensionManager(object):
         LOG.debug(_("Calling extension factory %s"), ext_factory)
         factory(self)
 
+        seconds = time.time() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+        LOG.info(_('Loaded extension %(ext_factory)s in %(seconds).3f '
+                   'seconds, maximum resident set size grew by %(rss)d KB')
+                 % locals())
+
+    def load_lazy_extension(self, classpath, filename):
+        """Register the extension classpath defined in filename without
+        importing it, if it can be described from its source.
+        """
+        classname = classpath.rsplit('.', 1)[1]
+        info = describe_extension(filename, classname)
+        if info is None:
+            LOG.debug(_("Extension %s cannot be loaded lazily"), classpath)
+            self.load_extension(classpath)
+        else:
+            self.register(LazyExtension(classpath, info))
+
+    def get_lazy_extensions(self):
+        """Returns the extensions which have not been imported yet."""
+        return [ext for ext in self.sorted_extensions()
+                if isinstance(ext, LazyExtension)]
+
+    def import_lazy_extension(self, lazy_ext):
+        """Import an extension registered by load_lazy_extension().
+
+        Returns the extension descriptor, or None if it fails to load, in
+        which case the extension is unregistered.
+        """
+        try:
+            self.load_extension(lazy_ext.classpath)
+        except Exception as exc:
+            LOG.warn(_('Failed to load extension %(classpath)s: %(exc)s') %
+                     {'classpath': lazy_ext.classpath, 'exc': exc})
+
+        ext = self.extensions.get(lazy_ext.alias)
+        if ext is lazy_ext:
+            del self.extensions[lazy_ext.alias]
+            self.sorted_ext_list = None
+            return None
+        return ext
+
     def _load_extensions(self):
         """Load extensions specified on the command line."""
 
@@ -340,7 +488,11 @@ def load_standard_extensions(ext_mgr, logger, path, package, ext_list=None):
                 continue
 
             try:
-                ext_mgr.load_extension(classpath)
+                if getattr(ext_mgr, 'lazy', False):
+                    ext_mgr.load_lazy_extension(classpath,
+                                                os.path.join(dirpath, fname))
+                else:
+                    ext_mgr.load_extension(classpath)
             except Exception as exc:
                 logger.warn(_('Failed to load extension %(classpath)s: '
                               '%(exc)s') % locals())
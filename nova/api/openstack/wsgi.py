@@ -75,7 +75,7 @@ class Request(webob.Request):
 
     def __init__(self, *args, **kwargs):
         super(Request, self).__init__(*args, **kwargs)
-        self._extension_data = {'db_items': {}}
+        self._extension_data = {'db_items': {}, 'networks': {}}
 
     def cache_db_items(self, key, items, item_key='id'):
         """
@@ -132,6 +132,21 @@ class Request(webob.Request):
     def get_db_flavor(self, flavorid):
         return self.get_db_item('flavors', flavorid)
 
+    def cache_instance_networks(self, instance_uuid, networks):
+        """
+        Allow API methods to store the networks of an instance, as
+        returned by common.get_networks_for_instance(), to be used by
+        API extensions within the same API request.
+        """
+        self._extension_data['networks'][instance_uuid] = networks
+
+    def get_instance_networks(self, instance_uuid):
+        """
+        Allow an API extension to get the previously stored networks of an
+        instance within the same API request, or None.
+        """
+        return self._extension_data['networks'].get(instance_uuid)
+
     def best_match_content_type(self):
         """Determine the requested response content-type."""
         if 'nova.best_content_type' not in self.environ:
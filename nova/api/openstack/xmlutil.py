@@ -32,6 +32,10 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Incremented whenever a template element is changed, so that compiled
+# templates are rebuilt
+_generation = 0
+
 
 def validate_schema(xml, schema_name):
     if isinstance(xml, str):
@@ -136,6 +140,11 @@ class ConstantSelector(object):
         return self.value
 
 
+def _changed():
+    global _generation
+    _generation += 1
+
+
 class TemplateElement(object):
     """Represent an element in the template."""
 
@@ -177,6 +186,7 @@ class TemplateElement(object):
         self._text = None
         self._children = []
         self._childmap = {}
+        self._compiled = {}
 
         # Run the incoming attributes through set() so that they
         # become selectorized
@@ -224,6 +234,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        _changed()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -245,6 +256,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        _changed()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -258,6 +270,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        _changed()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -271,6 +284,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        _changed()
 
     def get(self, key):
         """Get an attribute.
@@ -301,6 +315,7 @@ class TemplateElement(object):
             value = Selector(value)
 
         self.attrib[key] = value
+        _changed()
 
     def keys(self):
         """Return the attribute names."""
@@ -458,9 +473,11 @@ class TemplateElement(object):
             value = Selector(value)
 
         self._text = value
+        _changed()
 
     def _text_del(self):
         self._text = None
+        _changed()
 
     text = property(_text_get, _text_set, _text_del)
 
@@ -517,6 +534,150 @@ def SubTemplateElement(parent, tag, attrib=None, selector=None,
     return elem
 
 
+def _compilable(elem):
+    """Determine whether a template element can be compiled.
+
+    Elements whose class changes how they are rendered, other than
+    through will_render(), must be rendered by the element itself.
+    """
+
+    cls = elem.__class__
+    return (cls.render.im_func is TemplateElement.render.im_func and
+            cls._render.im_func is TemplateElement._render.im_func and
+            cls.apply.im_func is TemplateElement.apply.im_func)
+
+
+class CompiledElement(object):
+    """Represent a compiled template element.
+
+    A compiled element merges a template element with the elements
+    patching it in slave templates.  The text and attribute selectors
+    of all of them are flattened into a list of operations applied in
+    order, and the children are merged the same way, so rendering
+    does not need to look the siblings of each element up again.
+    """
+
+    def __init__(self, siblings):
+        """Compile a template element.
+
+        :param siblings: The template element followed by the
+                         template elements patching it.
+        """
+
+        elem = siblings[0]
+        self.tag = elem.tag
+        self.selector = elem.selector
+        self.subselector = elem.subselector
+        self.will_render = elem.will_render
+
+        # Flatten the text and attributes; a key of None sets the text
+        self.ops = []
+        for sibling in siblings:
+            if sibling.text is not None:
+                self.ops.append((None, sibling.text))
+            self.ops.extend(sibling.attrib.items())
+
+        # Merge the children, exactly as Template._serialize() does
+        self.children = []
+        seen = set()
+        for idx, sibling in enumerate(siblings):
+            for child in sibling:
+                if child.tag in seen:
+                    continue
+                seen.add(child.tag)
+
+                nieces = [child]
+                for sib in siblings[idx + 1:]:
+                    if child.tag in sib:
+                        nieces.append(sib[child.tag])
+                self.children.append(CompiledElement(nieces))
+
+    def render(self, parent, obj, nsmap=None):
+        """Render an object.
+
+        Renders an object against the compiled element and its
+        children.  Returns the first etree.Element instance rendered,
+        or None.
+
+        :param parent: The parent etree.Element instance.  Can be
+                       None.
+        :param obj: The object to render.
+        :param nsmap: An optional namespace dictionary to be
+                      associated with the etree.Element instance
+                      rendered.
+        """
+
+        data = None if obj is None else self.selector(obj)
+        if not self.will_render(data):
+            return None
+        elif data is None:
+            data = [None]
+        else:
+            if not isinstance(data, list):
+                data = [data]
+            elif parent is None:
+                raise ValueError(_('root element selecting a list'))
+            if self.subselector is not None:
+                data = [self.subselector(datum) for datum in data]
+
+        first = None
+        for datum in data:
+            tagname = self.tag(datum) if callable(self.tag) else self.tag
+            if parent is None:
+                elem = etree.Element(tagname, nsmap=nsmap)
+            else:
+                elem = etree.SubElement(parent, tagname)
+            if first is None:
+                first = elem
+
+            if datum is not None:
+                for key, value in self.ops:
+                    if key is None:
+                        elem.text = unicode(value(datum))
+                        continue
+                    try:
+                        elem.set(key, unicode(value(datum, True)))
+                    except KeyError:
+                        # Attribute has no value, so don't include it
+                        pass
+
+            for child in self.children:
+                child.render(elem, datum)
+
+        return first
+
+
+def compile_template(siblings):
+    """Compile the root siblings of a template.
+
+    The compiled element is cached on the root element for each set of
+    slave template roots, and is rebuilt when any template element is
+    changed.  Returns None if an element of the template cannot be
+    compiled.
+
+    :param siblings: The root element of the template followed by the
+                     root elements of the slave templates.
+    """
+
+    key = tuple(siblings[1:])
+    cached = siblings[0]._compiled.get(key)
+    if cached is not None and cached[0] == _generation:
+        return cached[1]
+
+    compiled = None
+    if all(_compilable(elem) for elem in _iter_elements(siblings)):
+        compiled = CompiledElement(siblings)
+    siblings[0]._compiled[key] = (_generation, compiled)
+    return compiled
+
+
+def _iter_elements(elems):
+    for elem in elems:
+        yield elem
+        for child in _iter_elements(elem):
+            yield child
+
+
 class Template(object):
     """Represent a template."""
 
@@ -615,7 +776,10 @@ class Template(object):
         nsmap = self._nsmap()
 
         # Form the element tree
-        return self._serialize(None, obj, siblings, nsmap)
+        compiled = compile_template(siblings)
+        if compiled is None:
+            return self._serialize(None, obj, siblings, nsmap)
+        return compiled.render(None, obj, nsmap)
 
     def _siblings(self):
         """Hook method for computing root siblings.
@@ -28,6 +28,7 @@ from nova import utils
 
 CONF = cfg.CONF
 CONF.import_opt('topic', 'nova.conductor.api', group='conductor')
+CONF.import_opt('workers', 'nova.conductor.api', group='conductor')
 
 
 def main():
@@ -37,5 +38,5 @@ def main():
     server = service.Service.create(binary='nova-conductor',
                                     topic=CONF.conductor.topic,
                                     manager=CONF.conductor.manager)
-    service.serve(server)
+    service.serve(server, workers=CONF.conductor.workers)
     service.wait()
@@ -55,6 +55,7 @@
 """
 
 import gettext
+import itertools
 import netaddr
 import os
 import sys
@@ -280,20 +281,28 @@ class FixedIpCommands(object):
         """Lists all fixed ips (optionally by host)."""
         ctxt = context.get_admin_context()
 
-        try:
-            if host is None:
-                fixed_ips = db.fixed_ip_get_all(ctxt)
-            else:
+        if host is None:
+            # NOTE: Iterate so that large deployments do not need to
+            # hold every fixed ip in memory at once.
+            fixed_ips = db.fixed_ip_get_all_iter(ctxt)
+            try:
+                first_fixed_ip = fixed_ips.next()
+            except StopIteration:
+                print _("error: %s") % exception.NoFixedIpsDefined()
+                return(2)
+            fixed_ips = itertools.chain([first_fixed_ip], fixed_ips)
+        else:
+            try:
                 fixed_ips = db.fixed_ip_get_by_host(ctxt, host)
+            except exception.NotFound as ex:
+                print _("error: %s") % ex
+                return(2)
 
-        except exception.NotFound as ex:
-            print _("error: %s") % ex
-            return(2)
-
-        instances = db.instance_get_all(context.get_admin_context())
+        # Only the hostname and host of each instance are needed
         instances_by_uuid = {}
-        for instance in instances:
-            instances_by_uuid[instance['uuid']] = instance
+        for instance in db.instance_get_all_iter(ctxt, columns_to_join=[]):
+            instances_by_uuid[instance['uuid']] = (instance['hostname'],
+                                                   instance['host'])
 
         print "%-18s\t%-15s\t%-15s\t%s" % (_('network'),
                                               _('IP address'),
@@ -323,8 +332,7 @@ class FixedIpCommands(object):
                 if fixed_ip.get('instance_uuid'):
                     instance = instances_by_uuid.get(fixed_ip['instance_uuid'])
                     if instance:
-                        hostname = instance['hostname']
-                        host = instance['host']
+                        hostname, host = instance
                     else:
                         print _('WARNING: fixed ip %s allocated to missing'
                                 ' instance') % str(fixed_ip['address'])
@@ -614,11 +622,8 @@ class VmCommands(object):
                                              _('zone'),
                                              _('index')))
 
-        if host is None:
-            instances = db.instance_get_all(context.get_admin_context())
-        else:
-            instances = db.instance_get_all_by_host(
-                           context.get_admin_context(), host)
+        instances = db.instance_get_all_iter(context.get_admin_context(),
+                                             host=host)
 
         for instance in instances:
             instance_type = flavors.extract_instance_type(instance)
@@ -848,9 +853,20 @@ class DbCommands(object):
 
     @args('--max_rows', metavar='<number>',
             help='Maximum number of deleted rows to archive')
-    def archive_deleted_rows(self, max_rows):
+    @args('--continuous', action='store_true', dest='continuous',
+            default=False,
+            help='Keep archiving batches of max_rows rows until no deleted '
+                 'rows are left')
+    @args('--throttle', metavar='<seconds>', default=0,
+            help='Number of seconds to sleep between batches when '
+                 'archiving continuously')
+    @args('--time_limit', metavar='<seconds>', default=None,
+            help='Number of seconds after which no new batch is started '
+                 'when archiving continuously')
+    def archive_deleted_rows(self, max_rows, continuous=False, throttle=0,
+                             time_limit=None):
         """Move up to max_rows deleted rows from production tables to shadow
-        tables.
+        tables.  Run it with --continuous from cron to archive regularly.
         """
         if max_rows is not None:
             max_rows = int(max_rows)
@@ -858,7 +874,18 @@ class DbCommands(object):
                 print _("Must supply a positive value for max_rows")
                 return(1)
         admin_context = context.get_admin_context()
-        db.archive_deleted_rows(admin_context, max_rows)
+        if continuous:
+            if max_rows is None:
+                max_rows = 1000
+            if time_limit is not None:
+                time_limit = int(time_limit)
+            rows = db.archive_deleted_rows_in_batches(admin_context,
+                                                      max_rows,
+                                                      time_limit=time_limit,
+                                                      throttle=float(throttle))
+            print _("Archived %d deleted rows") % rows
+        else:
+            db.archive_deleted_rows(admin_context, max_rows)
 
 
 class InstanceTypeCommands(object):
@@ -22,6 +22,8 @@
 networking and storage of VMs, and compute hosts on which they run)."""
 
 import base64
+import collections
+import copy
 import functools
 import re
 import string
@@ -179,6 +181,44 @@ def check_policy(context, action, target, scope='compute'):
     nova.policy.enforce(context, _action, target)
 
 
+class _BatchedComputeRPCAPI(object):
+    """Collects the stop, start and reboot casts made during a bulk action,
+    so that they can be sent with one cast per compute host.  All other
+    methods go to the compute RPC API right away.
+    """
+
+    def __init__(self, compute_rpcapi):
+        self.compute_rpcapi = compute_rpcapi
+        self._casts = collections.defaultdict(list)
+
+    def __getattr__(self, key):
+        return getattr(self.compute_rpcapi, key)
+
+    def _add(self, method, instance, **kwargs):
+        if not instance['host']:
+            raise exception.InstanceNotReady(instance_id=instance['uuid'])
+        key = (method, instance['host'], tuple(sorted(kwargs.items())))
+        self._casts[key].append(instance)
+
+    def stop_instance(self, ctxt, instance, cast=True):
+        self._add('stop_instances', instance)
+
+    def start_instance(self, ctxt, instance):
+        self._add('start_instances', instance)
+
+    def reboot_instance(self, ctxt, instance, block_device_info,
+                        reboot_type):
+        # NOTE: The compute manager looks the block devices up itself.
+        self._add('reboot_instances', instance, reboot_type=reboot_type)
+
+    def send(self, ctxt):
+        """Send the collected casts."""
+        for (method, host, kwargs), instances in self._casts.iteritems():
+            getattr(self.compute_rpcapi, method)(ctxt, instances, host=host,
+                                                 **dict(kwargs))
+        self._casts.clear()
+
+
 class API(base.Base):
     """API for interacting with the compute manager."""
 
@@ -455,7 +495,7 @@ class API(base.Base):
         options_from_image['auto_disk_config'] = auto_disk_config
         return options_from_image
 
-    def _apply_instance_name_template(self, context, instance, index):
+    def _apply_instance_name_template(self, instance, index):
         params = {
             'uuid': instance['uuid'],
             'name': instance['display_name'],
@@ -468,12 +508,9 @@ class API(base.Base):
             LOG.exception(_('Failed to set instance name using '
                             'multi_instance_display_name_template.'))
             new_name = instance['display_name']
-        updates = {'display_name': new_name}
+        instance['display_name'] = new_name
         if not instance.get('hostname'):
-            updates['hostname'] = utils.sanitize_hostname(new_name)
-        instance = self.db.instance_update(context,
-                instance['uuid'], updates)
-        return instance
+            instance['hostname'] = utils.sanitize_hostname(new_name)
 
     def _validate_and_provision_instance(self, context, instance_type,
                                          image_href, kernel_id, ramdisk_id,
@@ -629,15 +666,12 @@ class API(base.Base):
                 check_policy(context, 'create:forced_host', {})
                 filter_properties['force_nodes'] = [forced_node]
 
-            for i in xrange(num_instances):
-                options = base_options.copy()
-                instance = self.create_db_entry_for_new_instance(
-                        context, instance_type, image, options,
-                        security_groups, block_device_mapping,
-                        num_instances, i)
+            instances = self.create_db_entries_for_new_instances(
+                    context, instance_type, image, base_options,
+                    security_groups, block_device_mapping, num_instances)
+            instance_uuids = [instance['uuid'] for instance in instances]
 
-                instances.append(instance)
-                instance_uuids.append(instance['uuid'])
+            for instance in instances:
                 self._validate_bdm(context, instance)
                 # send a state update notification for the initial create to
                 # show it going from non-existent to BUILDING
@@ -734,6 +768,16 @@ class API(base.Base):
         """tell vm driver to create ephemeral/swap device at boot time by
         updating BlockDeviceMapping
         """
+        for values in self._image_block_device_mapping_values(
+                instance_type, instance_uuid, mappings):
+            self.db.block_device_mapping_update_or_create(elevated_context,
+                                                          values)
+
+    def _image_block_device_mapping_values(self, instance_type,
+                                           instance_uuid, mappings):
+        """Yield the BlockDeviceMapping values of the ephemeral/swap
+        devices in the mappings of an image.
+        """
         for bdm in block_device.mappings_prepend_dev(mappings):
             LOG.debug(_("bdm %s"), bdm, instance_uuid=instance_uuid)
 
@@ -748,13 +792,11 @@ class API(base.Base):
             if size == 0:
                 continue
 
-            values = {
+            yield {
                 'instance_uuid': instance_uuid,
                 'device_name': bdm['device'],
                 'virtual_name': virtual_name,
                 'volume_size': size}
-            self.db.block_device_mapping_update_or_create(elevated_context,
-                                                          values)
 
     def _update_block_device_mapping(self, elevated_context,
                                      instance_type, instance_uuid,
@@ -762,6 +804,16 @@ class API(base.Base):
         """tell vm driver to attach volume at boot time by updating
         BlockDeviceMapping
         """
+        for values in self._block_device_mapping_values(
+                instance_type, instance_uuid, block_device_mapping):
+            self.db.block_device_mapping_update_or_create(elevated_context,
+                                                          values)
+
+    def _block_device_mapping_values(self, instance_type, instance_uuid,
+                                     block_device_mapping):
+        """Yield the BlockDeviceMapping values of the devices in a
+        requested block device mapping.
+        """
         LOG.debug(_("block_device_mapping %s"), block_device_mapping,
                   instance_uuid=instance_uuid)
         for bdm in block_device_mapping:
@@ -790,8 +842,7 @@ class API(base.Base):
                           'snapshot_id', 'volume_id', 'volume_size'):
                     values[k] = None
 
-            self.db.block_device_mapping_update_or_create(elevated_context,
-                                                          values)
+            yield values
 
     def _validate_bdm(self, context, instance):
         for bdm in self.db.block_device_mapping_get_all_by_instance(
@@ -815,22 +866,28 @@ class API(base.Base):
                 except Exception:
                     raise exception.InvalidBDMSnapshot(id=snapshot_id)
 
-    def _populate_instance_for_bdm(self, context, instance, instance_type,
-            image, block_device_mapping):
-        """Populate instance block device mapping information."""
+    def _populate_instance_for_bdm(self, instance, instance_type, image,
+                                   block_device_mapping):
+        """Populate instance block device mapping information.
+
+        The mappings of the image come first, so that the requested block
+        device mapping overrides them when the instance is created.
+        """
         instance_uuid = instance['uuid']
         image_properties = image.get('properties', {})
+        bdms = []
         mappings = image_properties.get('mappings', [])
         if mappings:
-            self._update_image_block_device_mapping(context,
-                    instance_type, instance_uuid, mappings)
+            bdms.extend(self._image_block_device_mapping_values(
+                    instance_type, instance_uuid, mappings))
 
         image_bdm = image_properties.get('block_device_mapping', [])
         for mapping in (image_bdm, block_device_mapping):
             if not mapping:
                 continue
-            self._update_block_device_mapping(context,
-                    instance_type, instance_uuid, mapping)
+            bdms.extend(self._block_device_mapping_values(
+                    instance_type, instance_uuid, mapping))
+        instance['block_device_mapping'] = bdms
 
     def _populate_instance_shutdown_terminate(self, instance, image,
                                               block_device_mapping):
@@ -900,17 +957,11 @@ class API(base.Base):
                                                          security_groups)
         return instance
 
-    #NOTE(bcwaldon): No policy check since this is only used by scheduler and
-    # the compute api. That should probably be cleaned up, though.
-    def create_db_entry_for_new_instance(self, context, instance_type, image,
-            base_options, security_group, block_device_mapping, num_instances,
-            index):
-        """Create an entry in the DB for this new instance,
-        including any related table updates (such as security group,
-        etc).
-
-        This is called by the scheduler after a location for the
-        instance has been determined.
+    def _populate_instance_for_db_entry(self, instance_type, image,
+            base_options, security_group, block_device_mapping,
+            num_instances, index):
+        """Build the values of the DB entry of a new instance, including
+        its names and block device mappings.
         """
         instance = self._populate_instance_for_create(base_options,
                 image, security_group)
@@ -920,21 +971,53 @@ class API(base.Base):
         self._populate_instance_shutdown_terminate(instance, image,
                                                    block_device_mapping)
 
-        self.security_group_api.ensure_default(context)
-        instance = self.db.instance_create(context, instance)
-
+        # NOTE: The cells scheduler passes the same base_options for each
+        # instance, so the per-instance values below go into a copy.
+        instance = instance.copy()
         if num_instances > 1:
             # NOTE(russellb) We wait until this spot to handle
             # multi_instance_display_name_template, because we need
             # the UUID from the instance.
-            instance = self._apply_instance_name_template(context, instance,
-                                                          index)
+            self._apply_instance_name_template(instance, index)
 
-        self._populate_instance_for_bdm(context, instance,
-                instance_type, image, block_device_mapping)
+        self._populate_instance_for_bdm(instance, instance_type, image,
+                                        block_device_mapping)
 
         return instance
 
+    #NOTE(bcwaldon): No policy check since this is only used by scheduler and
+    # the compute api. That should probably be cleaned up, though.
+    def create_db_entry_for_new_instance(self, context, instance_type, image,
+            base_options, security_group, block_device_mapping, num_instances,
+            index):
+        """Create an entry in the DB for this new instance,
+        including any related table updates (such as security group,
+        etc).
+
+        This is called by the scheduler after a location for the
+        instance has been determined.
+        """
+        instance = self._populate_instance_for_db_entry(instance_type,
+                image, base_options, security_group, block_device_mapping,
+                num_instances, index)
+
+        self.security_group_api.ensure_default(context)
+        return self.db.instance_create_bulk(context, [instance])[0]
+
+    def create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options, security_group, block_device_mapping,
+            num_instances):
+        """Create the entries in the DB for num_instances new instances,
+        including their related table updates, in a single transaction.
+        """
+        instances = [self._populate_instance_for_db_entry(instance_type,
+                             image, base_options.copy(), security_group,
+                             block_device_mapping, num_instances, i)
+                     for i in xrange(num_instances)]
+
+        self.security_group_api.ensure_default(context)
+        return self.db.instance_create_bulk(context, instances)
+
     def _check_create_policies(self, context, availability_zone,
             requested_networks, block_device_mapping):
         """Check policies for create()."""
@@ -1332,12 +1415,59 @@ class API(base.Base):
         #                 availability_zone isn't used by run_instance.
         self.compute_rpcapi.start_instance(context, instance)
 
+    def bulk_action(self, context, instance_uuids, action, *args, **kwargs):
+        """Start, stop, reboot or delete a number of instances.
+
+        The instances are read with one query, and the instances to start,
+        stop or reboot are sent to each compute host with one cast.
+        Returns a dict of the exception raised for each instance uuid, or
+        None if the action was begun.
+        """
+        results = dict((instance_uuid,
+                        exception.InstanceNotFound(instance_id=instance_uuid))
+                       for instance_uuid in instance_uuids)
+        filters = {'uuid': list(results), 'deleted': False}
+        inst_models = self.db.instance_get_all_by_filters(context, filters,
+                                                          'created_at',
+                                                          'desc')
+
+        # NOTE: Run the actions with a copy of this API whose casts are
+        # collected rather than sent.
+        batch = _BatchedComputeRPCAPI(self.compute_rpcapi)
+        api = copy.copy(self)
+        api.compute_rpcapi = batch
+        try:
+            for inst_model in inst_models:
+                instance = dict(inst_model.iteritems())
+                # NOTE(comstud): Doesn't get returned by iteritems
+                instance['name'] = inst_model['name']
+                try:
+                    check_policy(context, 'get', instance)
+                    getattr(api, action)(context, instance, *args, **kwargs)
+                    results[instance['uuid']] = None
+                except exception.NovaException as e:
+                    results[instance['uuid']] = e
+        finally:
+            # NOTE: The actions begun so far have set a task_state, so
+            # they are cast even if a later instance fails unexpectedly.
+            batch.send(context)
+        return results
+
     #NOTE(bcwaldon): no policy check here since it should be rolled in to
     # search_opts in get_all
     def get_active_by_window(self, context, begin, end=None, project_id=None):
         """Get instances that were continuously active over a window."""
         return self.db.instance_get_active_by_window_joined(context, begin,
-                                                     end, project_id)
+                                                     end, project_id,
+                                                     use_slave=True)
+
+    def get_usage_by_window(self, context, begin, end=None, project_id=None):
+        """Iterate over the billing details of the instances that were
+        active over a window, in order of project.
+        """
+        return self.db.instance_get_usage_by_window(context, begin, end,
+                                                    project_id,
+                                                    use_slave=True)
 
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
@@ -1365,7 +1495,7 @@ class API(base.Base):
         return inst
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc', limit=None, marker=None):
+                sort_dir='desc', limit=None, marker=None, use_slave=False):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1377,8 +1507,48 @@ class API(base.Base):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        If use_slave is True, the instances may be read from the slave
+        database, which can lag behind the master.
         """
+        filters = self._get_search_filters(context, search_opts)
+        if filters is None:
+            return []
 
+        inst_models = self._get_instances_by_filters(context, filters,
+                                                     sort_key, sort_dir,
+                                                     limit=limit,
+                                                     marker=marker,
+                                                     use_slave=use_slave)
+
+        # Convert the models to dictionaries
+        instances = []
+        for inst_model in inst_models:
+            instance = dict(inst_model.iteritems())
+            # NOTE(comstud): Doesn't get returned by iteritems
+            instance['name'] = inst_model['name']
+            instances.append(instance)
+
+        return instances
+
+    def get_all_version(self, context, search_opts=None):
+        """Get the number of instances get_all would return for the given
+        search options, and the last time one of them changed.
+
+        Returns a dict with 'count' and 'updated_at' keys, which can be
+        used to tell whether a listing of the instances is still current.
+        """
+        filters = self._get_search_filters(context, search_opts)
+        if filters is None:
+            return {'count': 0, 'updated_at': None}
+        self._resolve_ip_filters(context, filters)
+        return self.db.instance_get_version_by_filters(context, filters,
+                                                       use_slave=True)
+
+    def _get_search_filters(self, context, search_opts):
+        """Check the policy for listing instances and turn the search
+        options into DB filters.  Returns None if no instance can match.
+        """
         #TODO(bcwaldon): determine the best argument for target here
         target = {
             'project_id': context.project_id,
@@ -1437,29 +1607,13 @@ class API(base.Base):
                         remap_object(value)
 
                     # We already know we can't match the filter, so
-                    # return an empty list
+                    # return None
                     except ValueError:
-                        return []
-
-        inst_models = self._get_instances_by_filters(context, filters,
-                                                     sort_key, sort_dir,
-                                                     limit=limit,
-                                                     marker=marker)
-
-        # Convert the models to dictionaries
-        instances = []
-        for inst_model in inst_models:
-            instance = dict(inst_model.iteritems())
-            # NOTE(comstud): Doesn't get returned by iteritems
-            instance['name'] = inst_model['name']
-            instances.append(instance)
+                        return None
 
-        return instances
+        return filters
 
-    def _get_instances_by_filters(self, context, filters,
-                                  sort_key, sort_dir,
-                                  limit=None,
-                                  marker=None):
+    def _resolve_ip_filters(self, context, filters):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1468,9 +1622,16 @@ class API(base.Base):
             uuids = set([r['instance_uuid'] for r in res])
             filters['uuid'] = uuids
 
+    def _get_instances_by_filters(self, context, filters,
+                                  sort_key, sort_dir,
+                                  limit=None,
+                                  marker=None,
+                                  use_slave=False):
+        self._resolve_ip_filters(context, filters)
         return self.db.instance_get_all_by_filters(context, filters,
                                                    sort_key, sort_dir,
-                                                   limit=limit, marker=marker)
+                                                   limit=limit, marker=marker,
+                                                   use_slave=use_slave)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.STOPPED])
@@ -2614,7 +2775,7 @@ class HostAPI(base.Base):
         return self.db.compute_node_get(context, int(compute_id))
 
     def compute_node_get_all(self, context):
-        return self.db.compute_node_get_all(context)
+        return self.db.compute_node_get_all(context, use_slave=True)
 
     def compute_node_search_by_hypervisor(self, context, hypervisor_match):
         return self.db.compute_node_search_by_hypervisor(context,
@@ -36,6 +36,7 @@ import time
 import traceback
 import uuid
 
+from eventlet import greenpool
 from eventlet import greenthread
 from oslo.config import cfg
 
@@ -180,12 +181,16 @@ CONF.import_opt('allow_resize_to_same_host', 'nova.compute.api')
 CONF.import_opt('console_topic', 'nova.console.rpcapi')
 CONF.import_opt('host', 'nova.netconf')
 CONF.import_opt('my_ip', 'nova.netconf')
+CONF.import_opt('rpc_thread_pool_size', 'nova.openstack.common.rpc')
 CONF.import_opt('vnc_enabled', 'nova.vnc')
 CONF.import_opt('enabled', 'nova.spice', group='spice')
 CONF.import_opt('enable', 'nova.cells.opts', group='cells')
 
 LOG = logging.getLogger(__name__)
 
+# Number of instances fetched at a time by the instance usage audit
+_AUDIT_PAGE_SIZE = 1000
+
 
 def publisher_id(host=None):
     return notifier.publisher_id("compute", host)
@@ -329,7 +334,7 @@ class ComputeVirtAPI(virtapi.VirtAPI):
 class ComputeManager(manager.SchedulerDependentManager):
     """Manages the running instances from creation to destruction."""
 
-    RPC_API_VERSION = '2.28'
+    RPC_API_VERSION = '2.29'
 
     def __init__(self, compute_driver=None, *args, **kwargs):
         """Load configuration options and connect to the hypervisor."""
@@ -348,6 +353,10 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.consoleauth_rpcapi = consoleauth.rpcapi.ConsoleAuthAPI()
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
         self._resource_tracker_dict = {}
+        # Runs the per instance actions of bulk casts, no more of them at
+        # once than the RPC consumer runs casts.
+        self._bulk_action_pool = greenpool.GreenPool(
+                CONF.rpc_thread_pool_size)
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -1519,6 +1528,33 @@ class ComputeManager(manager.SchedulerDependentManager):
                                      task_states.STARTING))
         self._notify_about_instance_usage(context, instance, "power_on.end")
 
+    def _spawn_per_instance(self, method, context, instances, **kwargs):
+        """Run method for each instance in a greenthread of its own.
+
+        The greenthreads come from a pool of rpc_thread_pool_size, so as
+        with separate casts no more than that many run at once; this
+        blocks while the pool is full.
+        """
+        def _run(instance):
+            try:
+                method(context, instance=instance, **kwargs)
+            except Exception:
+                # NOTE: The fault has been recorded and the task_state
+                # reverted, the other instances carry on regardless.
+                LOG.exception(_('%s failed') % method.__name__,
+                              instance=instance)
+
+        for instance in instances:
+            self._bulk_action_pool.spawn_n(_run, instance)
+
+    def stop_instances(self, context, instances):
+        """Stopping a number of instances on this host."""
+        self._spawn_per_instance(self.stop_instance, context, instances)
+
+    def start_instances(self, context, instances):
+        """Starting a number of instances on this host."""
+        self._spawn_per_instance(self.start_instance, context, instances)
+
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @reverts_task_state
     @wrap_instance_event
@@ -1837,6 +1873,11 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         self._notify_about_instance_usage(context, instance, "reboot.end")
 
+    def reboot_instances(self, context, instances, reboot_type="SOFT"):
+        """Reboot a number of instances on this host."""
+        self._spawn_per_instance(self.reboot_instance, context, instances,
+                                 reboot_type=reboot_type)
+
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @reverts_task_state
     @wrap_instance_fault
@@ -3579,16 +3620,21 @@ class ComputeManager(manager.SchedulerDependentManager):
                 self.conductor_api.migration_update(context, migration,
                                                     'error')
 
+            instances = {}
+            if migrations:
+                instance_uuids = [m['instance_uuid'] for m in migrations]
+                for instance in self.conductor_api.instance_get_by_uuids(
+                        context, instance_uuids):
+                    instances[instance['uuid']] = instance
+
             for migration in migrations:
                 migration_id = migration['id']
                 instance_uuid = migration['instance_uuid']
                 LOG.info(_("Automatically confirming migration "
                            "%(migration_id)s for instance %(instance_uuid)s"),
                            locals())
-                try:
-                    instance = self.conductor_api.instance_get_by_uuid(
-                        context, instance_uuid)
-                except exception.InstanceNotFound:
+                instance = instances.get(instance_uuid)
+                if instance is None:
                     reason = _("Instance %(instance_uuid)s not found")
                     _set_migration_to_error(migration, reason % locals())
                     continue
@@ -3613,6 +3659,24 @@ class ComputeManager(manager.SchedulerDependentManager):
                             "Will retry later.")
                     LOG.error(msg % locals(), instance=instance)
 
+    def _iter_active_instances(self, context, begin, end):
+        """Yield the instances on this host active during a window.
+
+        The instances are fetched a page at a time so that a host with many
+        instances does not have to hold them all in memory at once.
+        """
+        capi = self.conductor_api
+        marker = None
+        while True:
+            instances = capi.instance_get_active_by_window_joined(
+                context, begin, end, host=self.host,
+                limit=_AUDIT_PAGE_SIZE, marker=marker)
+            for instance in instances:
+                yield instance
+            if len(instances) < _AUDIT_PAGE_SIZE:
+                return
+            marker = instances[-1]['uuid']
+
     @periodic_task.periodic_task
     def _instance_usage_audit(self, context):
         if CONF.instance_usage_audit:
@@ -3621,9 +3685,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                                                     self.host):
                 begin, end = utils.last_completed_audit_period()
                 capi = self.conductor_api
-                instances = capi.instance_get_active_by_window_joined(
+                num_instances = capi.instance_count_active_by_window(
                     context, begin, end, host=self.host)
-                num_instances = len(instances)
                 errors = 0
                 successes = 0
                 LOG.info(_("Running instance usage audit for"
@@ -3638,7 +3701,8 @@ class ComputeManager(manager.SchedulerDependentManager):
                                               self.conductor_api,
                                               begin, end,
                                               self.host, num_instances)
-                for instance in instances:
+                for instance in self._iter_active_instances(context,
+                                                            begin, end):
                     try:
                         self.conductor_api.notify_usage_exists(
                             context, instance,
@@ -3981,8 +4045,10 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.debug(_("CONF.reclaim_instance_interval <= 0, skipping..."))
             return
 
-        instances = self.conductor_api.instance_get_all_by_host(
+        capi = self.conductor_api
+        instances = capi.instance_get_all_by_host(
             context, self.host, columns_to_join=[])
+        reclaim_uuids = []
         for instance in instances:
             old_enough = (not instance['deleted_at'] or
                           timeutils.is_older_than(instance['deleted_at'],
@@ -3990,19 +4056,23 @@ class ComputeManager(manager.SchedulerDependentManager):
             soft_deleted = instance['vm_state'] == vm_states.SOFT_DELETED
 
             if soft_deleted and old_enough:
-                capi = self.conductor_api
-                bdms = capi.block_device_mapping_get_all_by_instance(
-                    context, instance)
-                # NOTE(danms): We fetched instances above without the
-                # system_metadata for efficiency. If we get here, we need
-                # to re-fetch with it so that _delete_instace() can extract
-                # instance_type information.
-                instance = capi.instance_get_by_uuid(context, instance['uuid'])
-                LOG.info(_('Reclaiming deleted instance'), instance=instance)
-                # NOTE(comstud): Quotas were already accounted for when
-                # the instance was soft deleted, so there's no need to
-                # pass reservations here.
-                self._delete_instance(context, instance, bdms)
+                reclaim_uuids.append(instance['uuid'])
+
+        if not reclaim_uuids:
+            return
+
+        # NOTE(danms): We fetched instances above without the
+        # system_metadata for efficiency. We need to re-fetch the ones
+        # to reclaim with it so that _delete_instace() can extract
+        # instance_type information.
+        for instance in capi.instance_get_by_uuids(context, reclaim_uuids):
+            bdms = capi.block_device_mapping_get_all_by_instance(
+                context, instance)
+            LOG.info(_('Reclaiming deleted instance'), instance=instance)
+            # NOTE(comstud): Quotas were already accounted for when
+            # the instance was soft deleted, so there's no need to
+            # pass reservations here.
+            self._delete_instance(context, instance, bdms)
 
     @periodic_task.periodic_task
     def update_available_resource(self, context):
@@ -19,6 +19,8 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 
+import copy
+
 from oslo.config import cfg
 
 from nova.compute import claims
@@ -32,6 +34,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import lockutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 
 resource_tracker_opts = [
     cfg.IntOpt('reserved_host_disk_mb', default=0,
@@ -40,7 +43,14 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('compute_node_refresh_interval',
+               default=600,
+               help='Maximum number of seconds between writes of the '
+                    'full compute node record.  In between, only changed '
+                    'fields are sent to the conductor, though the record '
+                    'is still updated on every run.  Set to 0 to write '
+                    'the full record on every update'),
 ]
 
 CONF = cfg.CONF
@@ -49,6 +59,11 @@ CONF.register_opts(resource_tracker_opts)
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# Compute node fields which are maintained by the database and never need
+# to be sent back as part of an update:
+_UNTRACKED_FIELDS = ('id', 'created_at', 'updated_at', 'deleted_at',
+                     'deleted', 'service')
+
 
 class ResourceTracker(object):
     """Compute helper class for keeping track of resource usage as instances
@@ -60,6 +75,8 @@ class ResourceTracker(object):
         self.driver = driver
         self.nodename = nodename
         self.compute_node = None
+        self.written_values = {}
+        self.last_refreshed_at = None
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
         self.tracked_migrations = {}
@@ -249,6 +266,7 @@ class ResourceTracker(object):
             LOG.audit(_("Virt driver does not support "
                  "'get_available_resource'  Compute tracking is disabled."))
             self.compute_node = None
+            self._reset_written_values()
             return
 
         self._verify_resources(resources)
@@ -310,8 +328,10 @@ class ResourceTracker(object):
     def _create(self, context, values):
         """Create the compute node in the DB."""
         # initialize load stats from existing instances:
+        written = copy.deepcopy(values)
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self._record_written_values(written)
 
     def _get_service(self, context):
         try:
@@ -354,11 +374,63 @@ class ResourceTracker(object):
             LOG.audit(_("Free VCPU information unavailable"))
 
     def _update(self, context, values, prune_stats=False):
-        """Persist the compute node updates to the DB."""
+        """Persist the compute node updates to the DB.
+
+        Only the fields which changed since the last write are sent, and
+        the full record every CONF.compute_node_refresh_interval seconds.
+        The write is made even when nothing changed, so that updated_at
+        keeps telling the scheduler the host is alive.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
+
+        if prune_stats and 'stats' not in values:
+            # A pruning update carries the complete set of stats:
+            values = dict(values, stats={})
+
+        refresh = self._refresh_needed()
+        changes = self._get_changed_values(values, refresh)
+        if 'stats' not in changes:
+            # Pruning with no stats in the update would remove all of them.
+            prune_stats = False
+        # The update may consume the values passed to it, so take a copy
+        # to compare against next time:
+        written = copy.deepcopy(changes)
         self.compute_node = self.conductor_api.compute_node_update(
-            context, self.compute_node, values, prune_stats)
+            context, self.compute_node, changes, prune_stats)
+        self._record_written_values(written)
+        if refresh:
+            self.last_refreshed_at = timeutils.utcnow()
+
+    def _get_changed_values(self, values, refresh):
+        """Return the subset of values differing from the last write."""
+        if refresh:
+            return dict((k, v) for k, v in values.iteritems()
+                        if k not in _UNTRACKED_FIELDS)
+
+        changes = {}
+        for key, value in values.iteritems():
+            if key in _UNTRACKED_FIELDS:
+                continue
+            if (key not in self.written_values or
+                    self.written_values[key] != value):
+                changes[key] = value
+        return changes
+
+    def _record_written_values(self, values):
+        for key, value in values.iteritems():
+            if key not in _UNTRACKED_FIELDS:
+                self.written_values[key] = value
+
+    def _reset_written_values(self):
+        self.written_values = {}
+        self.last_refreshed_at = None
+
+    def _refresh_needed(self):
+        return (not CONF.compute_node_refresh_interval or
+                self.last_refreshed_at is None or
+                timeutils.is_older_than(self.last_refreshed_at,
+                                        CONF.compute_node_refresh_interval))
 
     def _update_usage(self, resources, usage, sign=1):
         resources['memory_mb_used'] += sign * usage['memory_mb']
@@ -21,9 +21,9 @@ Client side of the compute RPC API.
 from oslo.config import cfg
 
 from nova import exception
-from nova.openstack.common import jsonutils
 from nova.openstack.common import rpc
 import nova.openstack.common.rpc.proxy
+from nova import utils
 
 rpcapi_opts = [
     cfg.StrOpt('compute_topic',
@@ -166,6 +166,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         2.27 - Adds 'reservations' to terminate_instance() and
                soft_delete_instance()
         2.28 - Adds check_instance_shared_storage()
+        2.29 - Adds stop_instances(), start_instances() and
+               reboot_instances()
     '''
 
     #
@@ -194,7 +196,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         :param host: This is the host to send the message to.
         '''
 
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = utils.to_primitive(aggregate)
         self.cast(ctxt, self.make_msg('add_aggregate_host',
                 aggregate=aggregate_p, host=host_param,
                 slave_info=slave_info),
@@ -202,14 +204,14 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.14')
 
     def add_fixed_ip_to_instance(self, ctxt, instance, network_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('add_fixed_ip_to_instance',
                 instance=instance_p, network_id=network_id),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def attach_interface(self, ctxt, instance, network_id, port_id,
                          requested_ip):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('attach_interface',
                  instance=instance_p, network_id=network_id,
                  port_id=port_id, requested_ip=requested_ip),
@@ -217,21 +219,21 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                  version='2.25')
 
     def attach_volume(self, ctxt, instance, volume_id, mountpoint):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('attach_volume',
                 instance=instance_p, volume_id=volume_id,
                 mountpoint=mountpoint),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def change_instance_metadata(self, ctxt, instance, diff):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('change_instance_metadata',
                   instance=instance_p, diff=diff),
                   topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def check_can_live_migrate_destination(self, ctxt, instance, destination,
                                            block_migration, disk_over_commit):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt,
                          self.make_msg('check_can_live_migrate_destination',
                                        instance=instance_p,
@@ -241,7 +243,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                                               ctxt, destination, None))
 
     def check_can_live_migrate_source(self, ctxt, instance, dest_check_data):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('check_can_live_migrate_source',
                                              instance=instance_p,
                                              dest_check_data=dest_check_data),
@@ -249,7 +251,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                                               instance))
 
     def check_instance_shared_storage(self, ctxt, instance, data):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('check_instance_shared_storage',
                                              instance=instance_p,
                                              data=data),
@@ -260,8 +262,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def confirm_resize(self, ctxt, instance, migration, host,
             reservations=None, cast=True):
         rpc_method = self.cast if cast else self.call
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
         return rpc_method(ctxt, self.make_msg('confirm_resize',
                 instance=instance_p, migration=migration_p,
                 reservations=reservations),
@@ -269,22 +271,22 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.7')
 
     def detach_interface(self, ctxt, instance, port_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('detach_interface',
                  instance=instance_p, port_id=port_id),
                  topic=_compute_topic(self.topic, ctxt, None, instance),
                  version='2.25')
 
     def detach_volume(self, ctxt, instance, volume_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('detach_volume',
                 instance=instance_p, volume_id=volume_id),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def finish_resize(self, ctxt, instance, migration, image, disk_info,
             host, reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
         self.cast(ctxt, self.make_msg('finish_resize',
                 instance=instance_p, migration=migration_p,
                 image=image, disk_info=disk_info, reservations=reservations),
@@ -293,8 +295,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def finish_revert_resize(self, ctxt, instance, migration, host,
                              reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
         self.cast(ctxt, self.make_msg('finish_revert_resize',
                 instance=instance_p, migration=migration_p,
                 reservations=reservations),
@@ -302,7 +304,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.13')
 
     def get_console_output(self, ctxt, instance, tail_length):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_console_output',
                 instance=instance_p, tail_length=tail_length),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -317,26 +319,26 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def get_diagnostics(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_diagnostics',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def get_vnc_console(self, ctxt, instance, console_type):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_vnc_console',
                 instance=instance_p, console_type=console_type),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def get_spice_console(self, ctxt, instance, console_type):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('get_spice_console',
                 instance=instance_p, console_type=console_type),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
                          version='2.24')
 
     def validate_console_port(self, ctxt, instance, port, console_type):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('validate_console_port',
                 instance=instance_p, port=port, console_type=console_type),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -361,55 +363,55 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 action=action), topic)
 
     def inject_file(self, ctxt, instance, path, file_contents):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('inject_file',
                 instance=instance_p, path=path,
                 file_contents=file_contents),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def inject_network_info(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('inject_network_info',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def live_migration(self, ctxt, instance, dest, block_migration, host,
                        migrate_data=None):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('live_migration', instance=instance_p,
                 dest=dest, block_migration=block_migration,
                 migrate_data=migrate_data),
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def pause_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('pause_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def post_live_migration_at_destination(self, ctxt, instance,
             block_migration, host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt,
                 self.make_msg('post_live_migration_at_destination',
                 instance=instance_p, block_migration=block_migration),
                 _compute_topic(self.topic, ctxt, host, None))
 
     def power_off_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('power_off_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def power_on_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('power_on_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def pre_live_migration(self, ctxt, instance, block_migration, disk,
             host, migrate_data=None):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('pre_live_migration',
                         instance=instance_p,
                         block_migration=block_migration,
@@ -420,8 +422,8 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def prep_resize(self, ctxt, image, instance, instance_type, host,
                     reservations=None, request_spec=None,
                     filter_properties=None, node=None):
-        instance_p = jsonutils.to_primitive(instance)
-        instance_type_p = jsonutils.to_primitive(instance_type)
+        instance_p = utils.to_primitive(instance)
+        instance_type_p = utils.to_primitive(instance_type)
         self.cast(ctxt, self.make_msg('prep_resize',
                 instance=instance_p, instance_type=instance_type_p,
                 image=image, reservations=reservations,
@@ -433,7 +435,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def reboot_instance(self, ctxt, instance, block_device_info,
                         reboot_type):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('reboot_instance',
                 instance=instance_p,
                 block_device_info=block_device_info,
@@ -441,11 +443,18 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, None, instance),
                 version='2.23')
 
+    def reboot_instances(self, ctxt, instances, reboot_type, host):
+        instances_p = utils.to_primitive(instances)
+        self.cast(ctxt, self.make_msg('reboot_instances',
+                instances=instances_p, reboot_type=reboot_type),
+                topic=_compute_topic(self.topic, ctxt, host, None),
+                version='2.29')
+
     def rebuild_instance(self, ctxt, instance, new_pass, injected_files,
             image_ref, orig_image_ref, orig_sys_metadata, bdms,
             recreate=False, on_shared_storage=False, host=None):
-        instance_p = jsonutils.to_primitive(instance)
-        bdms_p = jsonutils.to_primitive(bdms)
+        instance_p = utils.to_primitive(instance)
+        bdms_p = utils.to_primitive(bdms)
         self.cast(ctxt, self.make_msg('rebuild_instance',
                 instance=instance_p, new_pass=new_pass,
                 injected_files=injected_files, image_ref=image_ref,
@@ -470,7 +479,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         :param host: This is the host to send the message to.
         '''
 
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = utils.to_primitive(aggregate)
         self.cast(ctxt, self.make_msg('remove_aggregate_host',
                 aggregate=aggregate_p, host=host_param,
                 slave_info=slave_info),
@@ -478,26 +487,26 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.15')
 
     def remove_fixed_ip_from_instance(self, ctxt, instance, address):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('remove_fixed_ip_from_instance',
                 instance=instance_p, address=address),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def remove_volume_connection(self, ctxt, instance, volume_id, host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('remove_volume_connection',
                 instance=instance_p, volume_id=volume_id),
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def rescue_instance(self, ctxt, instance, rescue_password):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('rescue_instance',
                 instance=instance_p,
                 rescue_password=rescue_password),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def reset_network(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('reset_network',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -505,9 +514,9 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def resize_instance(self, ctxt, instance, migration, image, instance_type,
                         reservations=None):
         topic = _compute_topic(self.topic, ctxt, None, instance)
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
-        instance_type_p = jsonutils.to_primitive(instance_type)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
+        instance_type_p = utils.to_primitive(instance_type)
         self.cast(ctxt, self.make_msg('resize_instance',
                 instance=instance_p, migration=migration_p,
                 image=image, reservations=reservations,
@@ -515,15 +524,15 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.16')
 
     def resume_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('resume_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def revert_resize(self, ctxt, instance, migration, host,
                       reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
         self.cast(ctxt, self.make_msg('revert_resize',
                 instance=instance_p, migration=migration_p,
                 reservations=reservations),
@@ -531,7 +540,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.12')
 
     def rollback_live_migration_at_destination(self, ctxt, instance, host):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('rollback_live_migration_at_destination',
             instance=instance_p),
             topic=_compute_topic(self.topic, ctxt, host, None))
@@ -540,7 +549,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                      filter_properties, requested_networks,
                      injected_files, admin_password,
                      is_first_time, node=None):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('run_instance', instance=instance_p,
                 request_spec=request_spec, filter_properties=filter_properties,
                 requested_networks=requested_networks,
@@ -550,7 +559,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.19')
 
     def set_admin_password(self, ctxt, instance, new_pass):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('set_admin_password',
                 instance=instance_p, new_pass=new_pass),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -565,7 +574,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(ctxt, self.make_msg('get_host_uptime'), topic)
 
     def reserve_block_device_name(self, ctxt, instance, device, volume_id):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return self.call(ctxt, self.make_msg('reserve_block_device_name',
                 instance=instance_p, device=device, volume_id=volume_id),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
@@ -573,7 +582,7 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def snapshot_instance(self, ctxt, instance, image_id, image_type,
             backup_type=None, rotation=None):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('snapshot_instance',
                 instance=instance_p, image_id=image_id,
                 image_type=image_type, backup_type=backup_type,
@@ -581,27 +590,41 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def start_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('start_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
+    def start_instances(self, ctxt, instances, host):
+        instances_p = utils.to_primitive(instances)
+        self.cast(ctxt, self.make_msg('start_instances',
+                instances=instances_p),
+                topic=_compute_topic(self.topic, ctxt, host, None),
+                version='2.29')
+
     def stop_instance(self, ctxt, instance, cast=True):
         rpc_method = self.cast if cast else self.call
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         return rpc_method(ctxt, self.make_msg('stop_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
+    def stop_instances(self, ctxt, instances, host):
+        instances_p = utils.to_primitive(instances)
+        self.cast(ctxt, self.make_msg('stop_instances',
+                instances=instances_p),
+                topic=_compute_topic(self.topic, ctxt, host, None),
+                version='2.29')
+
     def suspend_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('suspend_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def terminate_instance(self, ctxt, instance, bdms, reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
-        bdms_p = jsonutils.to_primitive(bdms)
+        instance_p = utils.to_primitive(instance)
+        bdms_p = utils.to_primitive(bdms)
         self.cast(ctxt, self.make_msg('terminate_instance',
                 instance=instance_p, bdms=bdms_p,
                 reservations=reservations),
@@ -609,13 +632,13 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 version='2.27')
 
     def unpause_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('unpause_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
 
     def unrescue_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('unrescue_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -624,14 +647,14 @@ class ComputeAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         self.fanout_cast(ctxt, self.make_msg('publish_service_capabilities'))
 
     def soft_delete_instance(self, ctxt, instance, reservations=None):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('soft_delete_instance',
                 instance=instance_p, reservations=reservations),
                 topic=_compute_topic(self.topic, ctxt, None, instance),
                 version='2.27')
 
     def restore_instance(self, ctxt, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('restore_instance',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, None, instance))
@@ -675,7 +698,7 @@ class SecurityGroupAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                 topic=_compute_topic(self.topic, ctxt, host, None))
 
     def refresh_instance_security_rules(self, ctxt, host, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         self.cast(ctxt, self.make_msg('refresh_instance_security_rules',
                 instance=instance_p),
                 topic=_compute_topic(self.topic, ctxt, instance['host'],
@@ -14,9 +14,12 @@
 
 """Handles all requests to the conductor service."""
 
+import functools
+
 from oslo.config import cfg
 
 from nova import baserpc
+from nova.conductor import coalescer
 from nova.conductor import manager
 from nova.conductor import rpcapi
 from nova.openstack.common import log as logging
@@ -33,6 +36,23 @@ conductor_opts = [
     cfg.StrOpt('manager',
                default='nova.conductor.manager.ConductorManager',
                help='full class name for the Manager for conductor'),
+    cfg.IntOpt('workers',
+               default=None,
+               help='Number of worker processes for conductor service'),
+    cfg.IntOpt('cache_ttl',
+               default=0,
+               help='Number of seconds conductor caches agent builds, '
+                    'provider firewall rules and security group rules.  '
+                    'Flavors are cached by the DB API, see '
+                    'flavor_cache_ttl.  Writes through the DB API '
+                    'invalidate the cache; set memcached_servers to share '
+                    'invalidations between processes.  0 disables the '
+                    'cache'),
+    cfg.FloatOpt('update_coalesce_window',
+                 default=0.0,
+                 help='Number of seconds in which successive updates of an '
+                      'instance are merged into a single database write. '
+                      '0 writes every update immediately'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -43,6 +63,37 @@ CONF.register_opts(conductor_opts, conductor_group)
 LOG = logging.getLogger(__name__)
 
 
+# The update coalescers of this process, by kind of conductor API
+_UPDATE_COALESCERS = {}
+
+
+def _get_update_coalescer(kind, update):
+    """Return the update coalescer shared by the conductor APIs of a kind.
+
+    Sharing it keeps the updates of an instance made through different
+    conductor API objects of the process in order.
+    """
+    window = CONF.conductor.update_coalesce_window
+    if window <= 0:
+        return None
+    if kind not in _UPDATE_COALESCERS:
+        _UPDATE_COALESCERS[kind] = coalescer.InstanceUpdateCoalescer(update,
+                                                                     window)
+    return _UPDATE_COALESCERS[kind]
+
+
+def _flushes_updates(f):
+    """Decorator for instance reads which must see the pending updates of
+    every instance.
+    """
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        if self._update_coalescer:
+            self._update_coalescer.flush()
+        return f(self, *args, **kwargs)
+    return wrapper
+
+
 class LocalAPI(object):
     """A local version of the conductor API that does database updates
     locally instead of via RPC"""
@@ -51,37 +102,67 @@ class LocalAPI(object):
         # TODO(danms): This needs to be something more generic for
         # other/future users of this sort of functionality.
         self._manager = utils.ExceptionHelper(manager.ConductorManager())
+        self._update_coalescer = _get_update_coalescer('local',
+                                                       self._instance_update)
 
     def wait_until_ready(self, context, *args, **kwargs):
         # nothing to wait for in the local case.
         pass
 
-    def instance_update(self, context, instance_uuid, **updates):
-        """Perform an instance update in the database."""
+    def _instance_update(self, context, instance_uuid, updates):
         return self._manager.instance_update(context, instance_uuid,
                                              updates, 'compute')
 
+    def flush_updates(self):
+        """Write the instance updates which are waiting to be merged."""
+        if self._update_coalescer:
+            self._update_coalescer.flush()
+
+    def instance_update(self, context, instance_uuid, **updates):
+        """Perform an instance update in the database."""
+        if self._update_coalescer:
+            return self._update_coalescer.update(context, instance_uuid,
+                                                 updates)
+        return self._instance_update(context, instance_uuid, updates)
+
+    @_flushes_updates
     def instance_get(self, context, instance_id):
         return self._manager.instance_get(context, instance_id)
 
     def instance_get_by_uuid(self, context, instance_uuid,
                              columns_to_join=None):
+        if self._update_coalescer:
+            self._update_coalescer.flush(instance_uuid)
         return self._manager.instance_get_by_uuid(context, instance_uuid,
                 columns_to_join)
 
+    @_flushes_updates
+    def instance_get_by_uuids(self, context, instance_uuids,
+                              columns_to_join=None):
+        return self._manager.instance_get_by_uuids(context, instance_uuids,
+                columns_to_join)
+
     def instance_destroy(self, context, instance):
+        if self._update_coalescer:
+            self._update_coalescer.flush(instance['uuid'])
         return self._manager.instance_destroy(context, instance)
 
+    @_flushes_updates
     def instance_get_all(self, context):
         return self._manager.instance_get_all(context)
 
-    def instance_get_all_by_host(self, context, host, columns_to_join=None):
+    @_flushes_updates
+    def instance_get_all_by_host(self, context, host, columns_to_join=None,
+                                 limit=None, marker=None):
         return self._manager.instance_get_all_by_host(
-            context, host, columns_to_join=columns_to_join)
+            context, host, columns_to_join=columns_to_join, limit=limit,
+            marker=marker)
 
+    @_flushes_updates
     def instance_get_all_by_host_and_node(self, context, host, node):
         return self._manager.instance_get_all_by_host(context, host, node)
 
+    @_flushes_updates
     def instance_get_all_by_filters(self, context, filters,
                                     sort_key='created_at',
                                     sort_dir='desc',
@@ -92,13 +173,23 @@ class LocalAPI(object):
                                                          sort_dir,
                                                          columns_to_join)
 
+    @_flushes_updates
     def instance_get_all_hung_in_rebooting(self, context, timeout):
         return self._manager.instance_get_all_hung_in_rebooting(context,
                                                                 timeout)
 
+    @_flushes_updates
     def instance_get_active_by_window_joined(self, context, begin, end=None,
-                                             project_id=None, host=None):
+                                             project_id=None, host=None,
+                                             limit=None, marker=None):
         return self._manager.instance_get_active_by_window_joined(
+            context, begin, end, project_id, host, limit=limit,
+            marker=marker)
+
+    @_flushes_updates
+    def instance_count_active_by_window(self, context, begin, end=None,
+                                        project_id=None, host=None):
+        return self._manager.instance_count_active_by_window(
             context, begin, end, project_id, host)
 
     def instance_info_cache_update(self, context, instance, values):
@@ -350,6 +441,8 @@ class API(object):
     def __init__(self):
         self.conductor_rpcapi = rpcapi.ConductorAPI()
         self.base_rpcapi = baserpc.BaseAPI(topic=CONF.conductor.topic)
+        self._update_coalescer = _get_update_coalescer('rpc',
+                                                       self._instance_update)
 
     def wait_until_ready(self, context, early_timeout=10, early_attempts=10):
         '''Wait until a conductor service is up and running.
@@ -381,34 +474,63 @@ class API(object):
                                 'Is it running? Or did this service start '
                                 'before nova-conductor?'))
 
-    def instance_update(self, context, instance_uuid, **updates):
-        """Perform an instance update in the database."""
+    def _instance_update(self, context, instance_uuid, updates):
         return self.conductor_rpcapi.instance_update(context, instance_uuid,
                                                      updates, 'conductor')
 
+    def flush_updates(self):
+        """Write the instance updates which are waiting to be merged."""
+        if self._update_coalescer:
+            self._update_coalescer.flush()
+
+    def instance_update(self, context, instance_uuid, **updates):
+        """Perform an instance update in the database."""
+        if self._update_coalescer:
+            return self._update_coalescer.update(context, instance_uuid,
+                                                 updates)
+        return self._instance_update(context, instance_uuid, updates)
+
     def instance_destroy(self, context, instance):
+        if self._update_coalescer:
+            self._update_coalescer.flush(instance['uuid'])
         return self.conductor_rpcapi.instance_destroy(context, instance)
 
+    @_flushes_updates
     def instance_get(self, context, instance_id):
         return self.conductor_rpcapi.instance_get(context, instance_id)
 
     def instance_get_by_uuid(self, context, instance_uuid,
                              columns_to_join=None):
+        if self._update_coalescer:
+            self._update_coalescer.flush(instance_uuid)
         return self.conductor_rpcapi.instance_get_by_uuid(context,
                                                           instance_uuid,
                                                           columns_to_join)
 
+    @_flushes_updates
+    def instance_get_by_uuids(self, context, instance_uuids,
+                              columns_to_join=None):
+        return self.conductor_rpcapi.instance_get_by_uuids(context,
+                                                           instance_uuids,
+                                                           columns_to_join)
+
+    @_flushes_updates
     def instance_get_all(self, context):
         return self.conductor_rpcapi.instance_get_all(context)
 
-    def instance_get_all_by_host(self, context, host, columns_to_join=None):
+    @_flushes_updates
+    def instance_get_all_by_host(self, context, host, columns_to_join=None,
+                                 limit=None, marker=None):
         return self.conductor_rpcapi.instance_get_all_by_host(
-            context, host, columns_to_join=columns_to_join)
+            context, host, columns_to_join=columns_to_join, limit=limit,
+            marker=marker)
 
+    @_flushes_updates
     def instance_get_all_by_host_and_node(self, context, host, node):
         return self.conductor_rpcapi.instance_get_all_by_host(context,
                                                               host, node)
 
+    @_flushes_updates
     def instance_get_all_by_filters(self, context, filters,
                                     sort_key='created_at',
                                     sort_dir='desc',
@@ -416,13 +538,23 @@ class API(object):
         return self.conductor_rpcapi.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, columns_to_join)
 
+    @_flushes_updates
     def instance_get_all_hung_in_rebooting(self, context, timeout):
         return self.conductor_rpcapi.instance_get_all_hung_in_rebooting(
             context, timeout)
 
+    @_flushes_updates
     def instance_get_active_by_window_joined(self, context, begin, end=None,
-                                             project_id=None, host=None):
+                                             project_id=None, host=None,
+                                             limit=None, marker=None):
         return self.conductor_rpcapi.instance_get_active_by_window_joined(
+            context, begin, end, project_id, host, limit=limit,
+            marker=marker)
+
+    @_flushes_updates
+    def instance_count_active_by_window(self, context, begin, end=None,
+                                        project_id=None, host=None):
+        return self.conductor_rpcapi.instance_count_active_by_window(
             context, begin, end, project_id, host)
 
     def instance_info_cache_update(self, context, instance, values):
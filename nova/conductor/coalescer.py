@@ -0,0 +1,220 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Coalesces rapid successive updates of an instance into fewer writes."""
+
+import copy
+import sys
+
+from eventlet import greenthread
+from eventlet import semaphore
+
+from nova import exception
+from nova.openstack.common import excutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+
+LOG = logging.getLogger(__name__)
+
+# Only updates limited to these keys are merged into a pending write.
+_COALESCED_KEYS = frozenset(['task_state', 'vm_state', 'power_state',
+                             'progress', 'launched_at', 'terminated_at',
+                             'access_ip_v4', 'access_ip_v6',
+                             'expected_task_state'])
+
+
+class _InstanceState(object):
+    def __init__(self, context, instance):
+        self.context = context
+        self.instance = copy.deepcopy(instance)
+        self.written_at = timeutils.utcnow()
+        self.pending = {}
+        # The expected_task_state the merged write is made with, if any
+        self.expects_task_state = False
+        self.expected_task_state = None
+        # Whether the last write of the pending updates failed
+        self.failed = False
+        self.timer = None
+        self.lock = semaphore.Semaphore()
+
+
+class InstanceUpdateCoalescer(object):
+    """Merges updates of the same instance made within a time window.
+
+    The first update of an instance is written immediately.  Updates made
+    within window seconds of it are merged and written together when the
+    window closes, or as soon as an update which cannot be merged arrives,
+    so updates are always written in the order they were made.
+
+    Updates with keys other than the ones in _COALESCED_KEYS are not
+    merged; the pending updates are written first and then the update
+    itself, before the call returns.  An update with an expected_task_state
+    is only merged if it matches the task_state the instance has once the
+    pending updates are applied.  If no pending update has changed the
+    task_state yet, the expectation is about the database, so the merged
+    write is made with it and fails if another writer changed the
+    task_state in the meantime.
+
+    If the merged write fails in the background the pending updates are
+    kept and written again when the next window closes.  Until that
+    succeeds nothing more is merged: the next update or flush of the
+    instance writes the pending updates itself and raises if that fails.
+    Pending updates of an instance which no longer exists, or whose
+    task_state is not the expected one, are dropped.
+    """
+
+    def __init__(self, update, window):
+        """:param update: function(context, instance_uuid, updates) which
+                          writes the updates and returns the instance
+        :param window: number of seconds in which updates are merged
+        """
+        self._update = update
+        self.window = window
+        self._states = {}
+
+    def update(self, context, instance_uuid, updates):
+        """Update an instance, possibly merging with pending updates."""
+        state = self._states.get(instance_uuid)
+        if state is not None:
+            with state.lock:
+                if (self._states.get(instance_uuid) is state and
+                        self._can_merge(state, updates)):
+                    return self._merge(state, updates)
+                self._flush_state(instance_uuid, state)
+
+        instance = self._update(context, instance_uuid, updates)
+        state = _InstanceState(context, instance)
+        state.timer = greenthread.spawn_after(self.window, self._expire,
+                                              instance_uuid, state)
+        self._states[instance_uuid] = state
+        return instance
+
+    def flush(self, instance_uuid=None):
+        """Write the pending updates of an instance now, or of every
+        instance if no instance_uuid is given.
+
+        Raises the error of the first write which failed; the pending
+        updates of every instance are still attempted.
+        """
+        if instance_uuid is None:
+            instance_uuids = self._states.keys()
+        else:
+            instance_uuids = [instance_uuid]
+        exc_info = None
+        for instance_uuid in instance_uuids:
+            state = self._states.get(instance_uuid)
+            if state is not None:
+                with state.lock:
+                    try:
+                        self._flush_state(instance_uuid, state)
+                    except Exception:
+                        if exc_info is None:
+                            exc_info = sys.exc_info()
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _can_merge(self, state, updates):
+        if state.failed:
+            return False
+        if timeutils.is_older_than(state.written_at, self.window):
+            return False
+        if not _COALESCED_KEYS.issuperset(updates):
+            return False
+        if 'expected_task_state' in updates:
+            expected = updates['expected_task_state']
+            if not isinstance(expected, (tuple, list, set)):
+                expected = (expected,)
+            return state.instance['task_state'] in expected
+        return True
+
+    def _merge(self, state, updates):
+        updates = dict(updates)
+        if 'expected_task_state' in updates:
+            expected = updates.pop('expected_task_state')
+            if not state.expects_task_state and (
+                    'task_state' not in state.pending):
+                state.expects_task_state = True
+                state.expected_task_state = expected
+        state.pending.update(updates)
+        state.instance.update(updates)
+        return copy.deepcopy(state.instance)
+
+    def _clear_pending(self, state):
+        state.pending = {}
+        state.expects_task_state = False
+        state.expected_task_state = None
+        state.failed = False
+
+    def _write_pending(self, instance_uuid, state):
+        """Write the pending updates.  On failure they stay pending, unless
+        the instance is gone or its task_state is not the expected one, and
+        the error is raised.
+        """
+        if state.pending:
+            updates = dict(state.pending)
+            if state.expects_task_state:
+                updates['expected_task_state'] = state.expected_task_state
+            try:
+                self._update(state.context, instance_uuid, updates)
+            except exception.InstanceNotFound:
+                LOG.warn(_('Dropping coalesced updates of a deleted '
+                           'instance'), instance_uuid=instance_uuid)
+            except exception.UnexpectedTaskStateError:
+                self._clear_pending(state)
+                raise
+            except Exception:
+                state.failed = True
+                raise
+        self._clear_pending(state)
+
+    def _retry_later(self, instance_uuid, state):
+        state.timer = greenthread.spawn_after(self.window, self._expire,
+                                              instance_uuid, state)
+
+    def _flush_state(self, instance_uuid, state):
+        state.timer.cancel()
+        try:
+            self._write_pending(instance_uuid, state)
+        except exception.UnexpectedTaskStateError:
+            with excutils.save_and_reraise_exception():
+                self._forget(instance_uuid, state)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._retry_later(instance_uuid, state)
+        self._forget(instance_uuid, state)
+
+    def _forget(self, instance_uuid, state):
+        if self._states.get(instance_uuid) is state:
+            del self._states[instance_uuid]
+
+    def _expire(self, instance_uuid, state):
+        with state.lock:
+            if self._states.get(instance_uuid) is not state:
+                return
+            try:
+                self._write_pending(instance_uuid, state)
+            except exception.UnexpectedTaskStateError as e:
+                LOG.warn(_('Dropping coalesced instance update: %s'), e,
+                         instance_uuid=instance_uuid)
+                del self._states[instance_uuid]
+            except Exception:
+                LOG.exception(_('Failed to write coalesced instance '
+                                'update, retrying in %s seconds'),
+                              self.window, instance_uuid=instance_uuid)
+                self._retry_later(instance_uuid, state)
+            else:
+                del self._states[instance_uuid]
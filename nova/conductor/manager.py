@@ -14,22 +14,30 @@
 
 """Handles database requests from other nova services."""
 
+from oslo.config import cfg
+
 from nova.api.ec2 import ec2utils
 from nova.compute import api as compute_api
 from nova.compute import utils as compute_utils
+from nova.db import cache as db_cache
 from nova import exception
 from nova import manager
 from nova import network
 from nova.network.security_group import openstack_driver
 from nova import notifications
-from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import periodic_task
 from nova.openstack.common.rpc import common as rpc_common
 from nova.openstack.common import timeutils
 from nova import quota
+from nova import utils
 
 LOG = logging.getLogger(__name__)
 
+# NOTE: the conductor options are registered by nova.conductor.api, which
+# imports this module, so they cannot be imported here.
+CONF = cfg.CONF
+
 # Instead of having a huge list of arguments to instance_update(), we just
 # accept a dict of fields to update and use this whitelist to validate it.
 allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
@@ -49,7 +57,7 @@ datetime_fields = ['launched_at', 'terminated_at', 'updated_at']
 class ConductorManager(manager.Manager):
     """Mission: TBD."""
 
-    RPC_API_VERSION = '1.49'
+    RPC_API_VERSION = '1.51'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -59,6 +67,7 @@ class ConductorManager(manager.Manager):
         self._network_api = None
         self._compute_api = None
         self.quotas = quota.QUOTAS
+        self.cache = db_cache.Cache(CONF.conductor.cache_ttl)
 
     @property
     def network_api(self):
@@ -78,7 +87,7 @@ class ConductorManager(manager.Manager):
     def ping(self, context, arg):
         # NOTE(russellb) This method can be removed in 2.0 of this API.  It is
         # now a part of the base rpc API.
-        return jsonutils.to_primitive({'service': 'conductor', 'arg': arg})
+        return utils.to_primitive({'service': 'conductor', 'arg': arg})
 
     @rpc_common.client_exceptions(KeyError, ValueError,
                                   exception.InvalidUUID,
@@ -97,72 +106,82 @@ class ConductorManager(manager.Manager):
         old_ref, instance_ref = self.db.instance_update_and_get_original(
             context, instance_uuid, updates)
         notifications.send_update(context, old_ref, instance_ref, service)
-        return jsonutils.to_primitive(instance_ref)
+        return utils.to_primitive(instance_ref)
 
     @rpc_common.client_exceptions(exception.InstanceNotFound)
     def instance_get(self, context, instance_id):
-        return jsonutils.to_primitive(
+        return utils.to_primitive(
             self.db.instance_get(context, instance_id))
 
     @rpc_common.client_exceptions(exception.InstanceNotFound)
     def instance_get_by_uuid(self, context, instance_uuid,
                              columns_to_join=None):
-        return jsonutils.to_primitive(
+        return utils.to_primitive(
             self.db.instance_get_by_uuid(context, instance_uuid,
                 columns_to_join))
 
+    def instance_get_by_uuids(self, context, instance_uuids,
+                              columns_to_join=None):
+        return utils.to_primitive(
+            self.db.instance_get_by_uuids(context, instance_uuids,
+                columns_to_join))
+
     def instance_get_all(self, context):
-        return jsonutils.to_primitive(self.db.instance_get_all(context))
+        return utils.to_primitive(self.db.instance_get_all(context))
 
+    @rpc_common.client_exceptions(exception.MarkerNotFound)
     def instance_get_all_by_host(self, context, host, node=None,
-                                 columns_to_join=None):
+                                 columns_to_join=None, limit=None,
+                                 marker=None):
         if node is not None:
             result = self.db.instance_get_all_by_host_and_node(
                 context.elevated(), host, node)
         else:
             result = self.db.instance_get_all_by_host(context.elevated(), host,
-                                                      columns_to_join)
-        return jsonutils.to_primitive(result)
+                                                      columns_to_join,
+                                                      limit=limit,
+                                                      marker=marker)
+        return utils.to_primitive(result)
 
     @rpc_common.client_exceptions(exception.MigrationNotFound)
     def migration_get(self, context, migration_id):
         migration_ref = self.db.migration_get(context.elevated(),
                                               migration_id)
-        return jsonutils.to_primitive(migration_ref)
+        return utils.to_primitive(migration_ref)
 
     def migration_get_unconfirmed_by_dest_compute(self, context,
                                                   confirm_window,
                                                   dest_compute):
         migrations = self.db.migration_get_unconfirmed_by_dest_compute(
             context, confirm_window, dest_compute)
-        return jsonutils.to_primitive(migrations)
+        return utils.to_primitive(migrations)
 
     def migration_get_in_progress_by_host_and_node(self, context,
                                                    host, node):
         migrations = self.db.migration_get_in_progress_by_host_and_node(
             context, host, node)
-        return jsonutils.to_primitive(migrations)
+        return utils.to_primitive(migrations)
 
     def migration_create(self, context, instance, values):
         values.update({'instance_uuid': instance['uuid'],
                        'source_compute': instance['host'],
                        'source_node': instance['node']})
         migration_ref = self.db.migration_create(context.elevated(), values)
-        return jsonutils.to_primitive(migration_ref)
+        return utils.to_primitive(migration_ref)
 
     @rpc_common.client_exceptions(exception.MigrationNotFound)
     def migration_update(self, context, migration, status):
         migration_ref = self.db.migration_update(context.elevated(),
                                                  migration['id'],
                                                  {'status': status})
-        return jsonutils.to_primitive(migration_ref)
+        return utils.to_primitive(migration_ref)
 
     @rpc_common.client_exceptions(exception.AggregateHostExists)
     def aggregate_host_add(self, context, aggregate, host):
         host_ref = self.db.aggregate_host_add(context.elevated(),
                 aggregate['id'], host)
 
-        return jsonutils.to_primitive(host_ref)
+        return utils.to_primitive(host_ref)
 
     @rpc_common.client_exceptions(exception.AggregateHostNotFound)
     def aggregate_host_delete(self, context, aggregate, host):
@@ -172,19 +191,19 @@ class ConductorManager(manager.Manager):
     @rpc_common.client_exceptions(exception.AggregateNotFound)
     def aggregate_get(self, context, aggregate_id):
         aggregate = self.db.aggregate_get(context.elevated(), aggregate_id)
-        return jsonutils.to_primitive(aggregate)
+        return utils.to_primitive(aggregate)
 
     def aggregate_get_by_host(self, context, host, key=None):
         aggregates = self.db.aggregate_get_by_host(context.elevated(),
                                                    host, key)
-        return jsonutils.to_primitive(aggregates)
+        return utils.to_primitive(aggregates)
 
     def aggregate_metadata_add(self, context, aggregate, metadata,
                                set_delete=False):
         new_metadata = self.db.aggregate_metadata_add(context.elevated(),
                                                       aggregate['id'],
                                                       metadata, set_delete)
-        return jsonutils.to_primitive(new_metadata)
+        return utils.to_primitive(new_metadata)
 
     @rpc_common.client_exceptions(exception.AggregateMetadataNotFound)
     def aggregate_metadata_delete(self, context, aggregate, key):
@@ -194,7 +213,7 @@ class ConductorManager(manager.Manager):
     def aggregate_metadata_get_by_host(self, context, host,
                                        key='availability_zone'):
         result = self.db.aggregate_metadata_get_by_host(context, host, key)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def bw_usage_update(self, context, uuid, mac, start_period,
                         bw_in=None, bw_out=None,
@@ -205,7 +224,7 @@ class ConductorManager(manager.Manager):
                                     bw_in, bw_out, last_ctr_in, last_ctr_out,
                                     last_refreshed)
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
-        return jsonutils.to_primitive(usage)
+        return utils.to_primitive(usage)
 
     # NOTE(russellb) This method can be removed in 2.0 of this API.  It is
     # deprecated in favor of the method in the base API.
@@ -215,21 +234,30 @@ class ConductorManager(manager.Manager):
     def security_group_get_by_instance(self, context, instance):
         group = self.db.security_group_get_by_instance(context,
                                                        instance['id'])
-        return jsonutils.to_primitive(group)
+        return utils.to_primitive(group)
 
     def security_group_rule_get_by_security_group(self, context, secgroup):
-        rules = self.db.security_group_rule_get_by_security_group(
-            context, secgroup['id'])
-        return jsonutils.to_primitive(rules, max_depth=4)
+        def _get():
+            rules = self.db.security_group_rule_get_by_security_group(
+                context, secgroup['id'])
+            return utils.to_primitive(rules, max_depth=4)
+        return self.cache.get(db_cache.SECURITY_GROUP_RULE,
+                              (context.read_deleted, secgroup['id']), _get)
 
     def provider_fw_rule_get_all(self, context):
-        rules = self.db.provider_fw_rule_get_all(context)
-        return jsonutils.to_primitive(rules)
+        def _get():
+            rules = self.db.provider_fw_rule_get_all(context)
+            return utils.to_primitive(rules)
+        return self.cache.get(db_cache.PROVIDER_FW_RULE,
+                              (context.read_deleted,), _get)
 
     def agent_build_get_by_triple(self, context, hypervisor, os, architecture):
-        info = self.db.agent_build_get_by_triple(context, hypervisor, os,
-                                                 architecture)
-        return jsonutils.to_primitive(info)
+        def _get():
+            info = self.db.agent_build_get_by_triple(context, hypervisor, os,
+                                                     architecture)
+            return utils.to_primitive(info)
+        return self.cache.get(db_cache.AGENT_BUILD,
+                              (hypervisor, os, architecture), _get)
 
     def block_device_mapping_update_or_create(self, context, values,
                                               create=None):
@@ -243,7 +271,7 @@ class ConductorManager(manager.Manager):
     def block_device_mapping_get_all_by_instance(self, context, instance):
         bdms = self.db.block_device_mapping_get_all_by_instance(
             context, instance['uuid'])
-        return jsonutils.to_primitive(bdms)
+        return utils.to_primitive(bdms)
 
     def block_device_mapping_destroy(self, context, bdms=None,
                                      instance=None, volume_id=None,
@@ -267,24 +295,31 @@ class ConductorManager(manager.Manager):
         result = self.db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir,
             columns_to_join=columns_to_join)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def instance_get_all_hung_in_rebooting(self, context, timeout):
         result = self.db.instance_get_all_hung_in_rebooting(context, timeout)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def instance_get_active_by_window(self, context, begin, end=None,
                                       project_id=None, host=None):
         # Unused, but cannot remove until major RPC version bump
         result = self.db.instance_get_active_by_window(context, begin, end,
                                                        project_id, host)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def instance_get_active_by_window_joined(self, context, begin, end=None,
-                                             project_id=None, host=None):
+                                             project_id=None, host=None,
+                                             limit=None, marker=None):
         result = self.db.instance_get_active_by_window_joined(
-            context, begin, end, project_id, host)
-        return jsonutils.to_primitive(result)
+            context, begin, end, project_id, host, limit=limit,
+            marker=marker)
+        return utils.to_primitive(result)
+
+    def instance_count_active_by_window(self, context, begin, end=None,
+                                        project_id=None, host=None):
+        return self.db.instance_count_active_by_window(context, begin, end,
+                                                       project_id, host)
 
     def instance_destroy(self, context, instance):
         self.db.instance_destroy(context, instance['uuid'])
@@ -298,15 +333,15 @@ class ConductorManager(manager.Manager):
 
     def instance_type_get(self, context, instance_type_id):
         result = self.db.instance_type_get(context, instance_type_id)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def instance_fault_create(self, context, values):
         result = self.db.instance_fault_create(context, values)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def vol_get_usage_by_time(self, context, start_time):
         result = self.db.vol_get_usage_by_time(context, start_time)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def vol_usage_update(self, context, vol_id, rd_req, rd_bytes, wr_req,
                          wr_bytes, instance, last_refreshed=None,
@@ -337,19 +372,19 @@ class ConductorManager(manager.Manager):
         elif host:
             result = self.db.service_get_all_by_host(context, host)
 
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def action_event_start(self, context, values):
         evt = self.db.action_event_start(context, values)
-        return jsonutils.to_primitive(evt)
+        return utils.to_primitive(evt)
 
     def action_event_finish(self, context, values):
         evt = self.db.action_event_finish(context, values)
-        return jsonutils.to_primitive(evt)
+        return utils.to_primitive(evt)
 
     def service_create(self, context, values):
         svc = self.db.service_create(context, values)
-        return jsonutils.to_primitive(svc)
+        return utils.to_primitive(svc)
 
     @rpc_common.client_exceptions(exception.ServiceNotFound)
     def service_destroy(self, context, service_id):
@@ -357,39 +392,39 @@ class ConductorManager(manager.Manager):
 
     def compute_node_create(self, context, values):
         result = self.db.compute_node_create(context, values)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def compute_node_update(self, context, node, values, prune_stats=False):
         result = self.db.compute_node_update(context, node['id'], values,
                                              prune_stats)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def compute_node_delete(self, context, node):
         result = self.db.compute_node_delete(context, node['id'])
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     @rpc_common.client_exceptions(exception.ServiceNotFound)
     def service_update(self, context, service, values):
         svc = self.db.service_update(context, service['id'], values)
-        return jsonutils.to_primitive(svc)
+        return utils.to_primitive(svc)
 
     def task_log_get(self, context, task_name, begin, end, host, state=None):
         result = self.db.task_log_get(context, task_name, begin, end, host,
                                       state)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def task_log_begin_task(self, context, task_name, begin, end, host,
                             task_items=None, message=None):
         result = self.db.task_log_begin_task(context.elevated(), task_name,
                                              begin, end, host, task_items,
                                              message)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def task_log_end_task(self, context, task_name, begin, end, host,
                           errors, message=None):
         result = self.db.task_log_end_task(context.elevated(), task_name,
                                            begin, end, host, errors, message)
-        return jsonutils.to_primitive(result)
+        return utils.to_primitive(result)
 
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
@@ -440,3 +475,13 @@ class ConductorManager(manager.Manager):
 
     def compute_unrescue(self, context, instance):
         self.compute_api.unrescue(context, instance)
+
+    @periodic_task.periodic_task
+    def _report_cache_stats(self, context):
+        stats = self.cache.get_stats()
+        stats.update(self.db.instance_type_cache_get_stats())
+        for namespace, counts in sorted(stats.items()):
+            LOG.debug(_("DB cache of %(namespace)s: %(hits)d hits, "
+                        "%(misses)d misses"),
+                      {'namespace': namespace, 'hits': counts['hits'],
+                       'misses': counts['misses']})
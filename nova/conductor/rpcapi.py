@@ -16,8 +16,8 @@
 
 from oslo.config import cfg
 
-from nova.openstack.common import jsonutils
 import nova.openstack.common.rpc.proxy
+from nova import utils
 
 CONF = cfg.CONF
 
@@ -88,6 +88,10 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                  instance_get_all_by_filters
     1.48 - Added compute_unrescue
     1.49 - Added columns_to_join to instance_get_by_uuid
+    1.50 - Added instance_get_by_uuids, and limit and marker to
+                 instance_get_all_by_host
+    1.51 - Added limit and marker to instance_get_active_by_window_joined,
+                 and instance_count_active_by_window
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -99,7 +103,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def instance_update(self, context, instance_uuid, updates,
                         service=None):
-        updates_p = jsonutils.to_primitive(updates)
+        updates_p = utils.to_primitive(updates)
         return self.call(context,
                          self.make_msg('instance_update',
                                        instance_uuid=instance_uuid,
@@ -119,6 +123,13 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             columns_to_join=columns_to_join)
         return self.call(context, msg, version='1.49')
 
+    def instance_get_by_uuids(self, context, instance_uuids,
+                              columns_to_join=None):
+        msg = self.make_msg('instance_get_by_uuids',
+                            instance_uuids=instance_uuids,
+                            columns_to_join=columns_to_join)
+        return self.call(context, msg, version='1.50')
+
     def migration_get(self, context, migration_id):
         msg = self.make_msg('migration_get', migration_id=migration_id)
         return self.call(context, msg, version='1.4')
@@ -138,25 +149,25 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.31')
 
     def migration_create(self, context, instance, values):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('migration_create', instance=instance_p,
                             values=values)
         return self.call(context, msg, version='1.30')
 
     def migration_update(self, context, migration, status):
-        migration_p = jsonutils.to_primitive(migration)
+        migration_p = utils.to_primitive(migration)
         msg = self.make_msg('migration_update', migration=migration_p,
                             status=status)
         return self.call(context, msg, version='1.1')
 
     def aggregate_host_add(self, context, aggregate, host):
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = utils.to_primitive(aggregate)
         msg = self.make_msg('aggregate_host_add', aggregate=aggregate_p,
                             host=host)
         return self.call(context, msg, version='1.3')
 
     def aggregate_host_delete(self, context, aggregate, host):
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = utils.to_primitive(aggregate)
         msg = self.make_msg('aggregate_host_delete', aggregate=aggregate_p,
                             host=host)
         return self.call(context, msg, version='1.3')
@@ -171,14 +182,14 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
 
     def aggregate_metadata_add(self, context, aggregate, metadata,
                                set_delete=False):
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = utils.to_primitive(aggregate)
         msg = self.make_msg('aggregate_metadata_add', aggregate=aggregate_p,
                             metadata=metadata,
                             set_delete=set_delete)
         return self.call(context, msg, version='1.7')
 
     def aggregate_metadata_delete(self, context, aggregate, key):
-        aggregate_p = jsonutils.to_primitive(aggregate)
+        aggregate_p = utils.to_primitive(aggregate)
         msg = self.make_msg('aggregate_metadata_delete', aggregate=aggregate_p,
                             key=key)
         return self.call(context, msg, version='1.7')
@@ -200,13 +211,13 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.5')
 
     def security_group_get_by_instance(self, context, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('security_group_get_by_instance',
                             instance=instance_p)
         return self.call(context, msg, version='1.8')
 
     def security_group_rule_get_by_security_group(self, context, secgroup):
-        secgroup_p = jsonutils.to_primitive(secgroup)
+        secgroup_p = utils.to_primitive(secgroup)
         msg = self.make_msg('security_group_rule_get_by_security_group',
                             secgroup=secgroup_p)
         return self.call(context, msg, version='1.8')
@@ -228,7 +239,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.12')
 
     def block_device_mapping_get_all_by_instance(self, context, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('block_device_mapping_get_all_by_instance',
                             instance=instance_p)
         return self.call(context, msg, version='1.13')
@@ -236,8 +247,8 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def block_device_mapping_destroy(self, context, bdms=None,
                                      instance=None, volume_id=None,
                                      device_name=None):
-        bdms_p = jsonutils.to_primitive(bdms)
-        instance_p = jsonutils.to_primitive(instance)
+        bdms_p = utils.to_primitive(bdms)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('block_device_mapping_destroy',
                             bdms=bdms_p,
                             instance=instance_p, volume_id=volume_id,
@@ -257,19 +268,32 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.15')
 
     def instance_get_active_by_window_joined(self, context, begin, end=None,
-                                             project_id=None, host=None):
+                                             project_id=None, host=None,
+                                             limit=None, marker=None):
+        if limit is None and marker is None:
+            msg = self.make_msg('instance_get_active_by_window_joined',
+                                begin=begin, end=end, project_id=project_id,
+                                host=host)
+            return self.call(context, msg, version='1.35')
         msg = self.make_msg('instance_get_active_by_window_joined',
+                            begin=begin, end=end, project_id=project_id,
+                            host=host, limit=limit, marker=marker)
+        return self.call(context, msg, version='1.51')
+
+    def instance_count_active_by_window(self, context, begin, end=None,
+                                        project_id=None, host=None):
+        msg = self.make_msg('instance_count_active_by_window',
                             begin=begin, end=end, project_id=project_id,
                             host=host)
-        return self.call(context, msg, version='1.35')
+        return self.call(context, msg, version='1.51')
 
     def instance_destroy(self, context, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('instance_destroy', instance=instance_p)
         self.call(context, msg, version='1.16')
 
     def instance_info_cache_delete(self, context, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('instance_info_cache_delete', instance=instance_p)
         self.call(context, msg, version='1.17')
 
@@ -279,14 +303,14 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.18')
 
     def vol_get_usage_by_time(self, context, start_time):
-        start_time_p = jsonutils.to_primitive(start_time)
+        start_time_p = utils.to_primitive(start_time)
         msg = self.make_msg('vol_get_usage_by_time', start_time=start_time_p)
         return self.call(context, msg, version='1.19')
 
     def vol_usage_update(self, context, vol_id, rd_req, rd_bytes, wr_req,
                          wr_bytes, instance, last_refreshed=None,
                          update_totals=False):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('vol_usage_update', vol_id=vol_id, rd_req=rd_req,
                             rd_bytes=rd_bytes, wr_req=wr_req,
                             wr_bytes=wr_bytes,
@@ -304,27 +328,33 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.23')
 
     def instance_get_all_by_host(self, context, host, node=None,
-                                 columns_to_join=None):
+                                 columns_to_join=None, limit=None,
+                                 marker=None):
+        if limit is None and marker is None:
+            msg = self.make_msg('instance_get_all_by_host', host=host,
+                                node=node, columns_to_join=columns_to_join)
+            return self.call(context, msg, version='1.47')
         msg = self.make_msg('instance_get_all_by_host', host=host, node=node,
-                            columns_to_join=columns_to_join)
-        return self.call(context, msg, version='1.47')
+                            columns_to_join=columns_to_join, limit=limit,
+                            marker=marker)
+        return self.call(context, msg, version='1.50')
 
     def instance_fault_create(self, context, values):
         msg = self.make_msg('instance_fault_create', values=values)
         return self.call(context, msg, version='1.36')
 
     def action_event_start(self, context, values):
-        values_p = jsonutils.to_primitive(values)
+        values_p = utils.to_primitive(values)
         msg = self.make_msg('action_event_start', values=values_p)
         return self.call(context, msg, version='1.25')
 
     def action_event_finish(self, context, values):
-        values_p = jsonutils.to_primitive(values)
+        values_p = utils.to_primitive(values)
         msg = self.make_msg('action_event_finish', values=values_p)
         return self.call(context, msg, version='1.25')
 
     def instance_info_cache_update(self, context, instance, values):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('instance_info_cache_update',
                             instance=instance_p,
                             values=values)
@@ -343,18 +373,18 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.33')
 
     def compute_node_update(self, context, node, values, prune_stats=False):
-        node_p = jsonutils.to_primitive(node)
+        node_p = utils.to_primitive(node)
         msg = self.make_msg('compute_node_update', node=node_p, values=values,
                             prune_stats=prune_stats)
         return self.call(context, msg, version='1.33')
 
     def compute_node_delete(self, context, node):
-        node_p = jsonutils.to_primitive(node)
+        node_p = utils.to_primitive(node)
         msg = self.make_msg('compute_node_delete', node=node_p)
         return self.call(context, msg, version='1.44')
 
     def service_update(self, context, service, values):
-        service_p = jsonutils.to_primitive(service)
+        service_p = utils.to_primitive(service)
         msg = self.make_msg('service_update', service=service_p, values=values)
         return self.call(context, msg, version='1.34')
 
@@ -380,9 +410,9 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
-        instance_p = jsonutils.to_primitive(instance)
-        system_metadata_p = jsonutils.to_primitive(system_metadata)
-        extra_usage_info_p = jsonutils.to_primitive(extra_usage_info)
+        instance_p = utils.to_primitive(instance)
+        system_metadata_p = utils.to_primitive(system_metadata)
+        extra_usage_info_p = utils.to_primitive(extra_usage_info)
         msg = self.make_msg('notify_usage_exists', instance=instance_p,
                   current_period=current_period,
                   ignore_missing_network_data=ignore_missing_network_data,
@@ -391,7 +421,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.39')
 
     def security_groups_trigger_handler(self, context, event, args):
-        args_p = jsonutils.to_primitive(args)
+        args_p = utils.to_primitive(args)
         msg = self.make_msg('security_groups_trigger_handler', event=event,
                             args=args_p)
         return self.call(context, msg, version='1.40')
@@ -402,50 +432,50 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.40')
 
     def network_migrate_instance_start(self, context, instance, migration):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
         msg = self.make_msg('network_migrate_instance_start',
                             instance=instance_p, migration=migration_p)
         return self.call(context, msg, version='1.41')
 
     def network_migrate_instance_finish(self, context, instance, migration):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration)
         msg = self.make_msg('network_migrate_instance_finish',
                             instance=instance_p, migration=migration_p)
         return self.call(context, msg, version='1.41')
 
     def quota_commit(self, context, reservations, project_id=None):
-        reservations_p = jsonutils.to_primitive(reservations)
+        reservations_p = utils.to_primitive(reservations)
         msg = self.make_msg('quota_commit', reservations=reservations_p,
                             project_id=project_id)
         return self.call(context, msg, version='1.45')
 
     def quota_rollback(self, context, reservations, project_id=None):
-        reservations_p = jsonutils.to_primitive(reservations)
+        reservations_p = utils.to_primitive(reservations)
         msg = self.make_msg('quota_rollback', reservations=reservations_p,
                             project_id=project_id)
         return self.call(context, msg, version='1.45')
 
     def get_ec2_ids(self, context, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('get_ec2_ids', instance=instance_p)
         return self.call(context, msg, version='1.42')
 
     def compute_stop(self, context, instance, do_cast=True):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('compute_stop', instance=instance_p,
                             do_cast=do_cast)
         return self.call(context, msg, version='1.43')
 
     def compute_confirm_resize(self, context, instance, migration_ref):
-        instance_p = jsonutils.to_primitive(instance)
-        migration_p = jsonutils.to_primitive(migration_ref)
+        instance_p = utils.to_primitive(instance)
+        migration_p = utils.to_primitive(migration_ref)
         msg = self.make_msg('compute_confirm_resize', instance=instance_p,
                             migration_ref=migration_p)
         return self.call(context, msg, version='1.46')
 
     def compute_unrescue(self, context, instance):
-        instance_p = jsonutils.to_primitive(instance)
+        instance_p = utils.to_primitive(instance)
         msg = self.make_msg('compute_unrescue', instance=instance_p)
         return self.call(context, msg, version='1.48')
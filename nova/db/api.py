@@ -46,6 +46,7 @@ these objects be simple dictionaries.
 from oslo.config import cfg
 
 from nova.cells import rpcapi as cells_rpcapi
+from nova.db import cache
 from nova import exception
 from nova.openstack.common.db import api as db_api
 from nova.openstack.common import log as logging
@@ -61,6 +62,17 @@ db_opts = [
     cfg.StrOpt('snapshot_name_template',
                default='snapshot-%s',
                help='Template string to be used to generate snapshot names'),
+    cfg.IntOpt('flavor_cache_ttl',
+               default=0,
+               help='Number of seconds flavors looked up by id, name or '
+                    'flavor id are cached in each process.  Changes made '
+                    'by other processes are only seen after this time '
+                    'unless memcached_servers is set.  0 disables the '
+                    'cache'),
+    cfg.IntOpt('flavor_cache_size',
+               default=1000,
+               help='Maximum number of flavor lookups cached in each '
+                    'process'),
     ]
 
 CONF = cfg.CONF
@@ -72,6 +84,28 @@ _BACKEND_MAPPING = {'sqlalchemy': 'nova.db.sqlalchemy.api'}
 IMPL = db_api.DBAPI(backend_mapping=_BACKEND_MAPPING)
 LOG = logging.getLogger(__name__)
 
+_FLAVOR_CACHE = None
+
+
+def _get_flavor_cache():
+    global _FLAVOR_CACHE
+    if (_FLAVOR_CACHE is None or
+            _FLAVOR_CACHE.ttl != CONF.flavor_cache_ttl or
+            _FLAVOR_CACHE.size != CONF.flavor_cache_size):
+        _FLAVOR_CACHE = cache.Cache(CONF.flavor_cache_ttl,
+                                    size=CONF.flavor_cache_size)
+    return _FLAVOR_CACHE
+
+
+def _get_cached_flavor(context, lookup, value):
+    """Look up a flavor through the flavor cache.  The read_deleted mode
+    of the context is part of the key, as it changes the result.
+    """
+    loader = getattr(IMPL, lookup)
+    return _get_flavor_cache().get(cache.INSTANCE_TYPE,
+                                   (lookup, context.read_deleted, value),
+                                   loader, context, value)
+
 
 class NoMoreNetworks(exception.NovaException):
     """No more available networks."""
@@ -112,6 +146,14 @@ def not_equal(*values):
 ###################
 
 
+def dispose_engine():
+    """Close all database connections pooled by this process."""
+    return IMPL.dispose_engine()
+
+
+###################
+
+
 def service_destroy(context, instance_id):
     """Destroy the service or raise if it does not exist."""
     return IMPL.service_destroy(context, instance_id)
@@ -177,9 +219,12 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
-    """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+def compute_node_get_all(context, use_slave=False):
+    """Get all computeNodes.
+
+    If use_slave is True, the slave database is used if one is configured.
+    """
+    return IMPL.compute_node_get_all(context, use_slave=use_slave)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -476,6 +521,11 @@ def fixed_ip_get_all(context):
     return IMPL.fixed_ip_get_all(context)
 
 
+def fixed_ip_get_all_iter(context, chunk_size=1000):
+    """Iterate over all fixed ips, reading chunk_size of them at a time."""
+    return IMPL.fixed_ip_get_all_iter(context, chunk_size=chunk_size)
+
+
 def fixed_ip_get_by_address(context, address):
     """Get a fixed ip by address or raise if it does not exist."""
     return IMPL.fixed_ip_get_by_address(context, address)
@@ -572,7 +622,20 @@ def virtual_interface_get_all(context):
 
 def instance_create(context, values):
     """Create an instance from the values dictionary."""
-    return IMPL.instance_create(context, values)
+    rv = IMPL.instance_create(context, values)
+    # Security group rules are returned along with the instances of
+    # their grantee groups.
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
+
+
+def instance_create_bulk(context, values_list):
+    """Create several instances from a list of values dictionaries, with
+    a few multi-row inserts in a single transaction.
+    """
+    rv = IMPL.instance_create_bulk(context, values_list)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
 
 
 def instance_data_get_for_project(context, project_id, session=None):
@@ -585,6 +648,7 @@ def instance_destroy(context, instance_uuid, constraint=None,
         update_cells=True):
     """Destroy the instance or raise if it does not exist."""
     rv = IMPL.instance_destroy(context, instance_uuid, constraint)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
     if update_cells:
         try:
             cells_rpcapi.CellsAPI().instance_destroy_at_top(context, rv)
@@ -598,6 +662,14 @@ def instance_get_by_uuid(context, uuid, columns_to_join=None):
     return IMPL.instance_get_by_uuid(context, uuid, columns_to_join)
 
 
+def instance_get_by_uuids(context, uuids, columns_to_join=None):
+    """Get the instances matching a list of uuids.
+
+    Instances which do not exist are left out of the result.
+    """
+    return IMPL.instance_get_by_uuids(context, uuids, columns_to_join)
+
+
 def instance_get(context, instance_id):
     """Get an instance or raise if it does not exist."""
     return IMPL.instance_get(context, instance_id)
@@ -608,30 +680,92 @@ def instance_get_all(context, columns_to_join=None):
     return IMPL.instance_get_all(context, columns_to_join=columns_to_join)
 
 
+def instance_get_all_iter(context, host=None, columns_to_join=None,
+                          chunk_size=1000):
+    """Iterate over all instances, reading chunk_size of them at a time.
+
+    Specifying a host will only return the instances on that host.
+    """
+    return IMPL.instance_get_all_iter(context, host=host,
+                                      columns_to_join=columns_to_join,
+                                      chunk_size=chunk_size)
+
+
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, use_slave=False):
+    """Get all instances that match all filters.
+
+    If use_slave is True, the slave database is used if one is configured.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            use_slave=use_slave)
+
+
+def instance_get_version_by_filters(context, filters, use_slave=False):
+    """Get the number of instances that match all filters, and the last
+    time one of them, its network info or its metadata changed.
+
+    Returns a dict with 'count' and 'updated_at' keys.  If use_slave is
+    True, the slave database is used if one is configured.
+    """
+    return IMPL.instance_get_version_by_filters(context, filters,
+                                                use_slave=use_slave)
+
+
+def instance_get_usage_by_window(context, begin, end=None, project_id=None,
+                                 use_slave=False, chunk_size=1000):
+    """Iterate over the usage of the instances active during a time window.
+
+    Only the columns needed for billing and the instance_type_* system
+    metadata are read, chunk_size instances at a time.  Instances are
+    returned in order of project_id and id.
+    If use_slave is True, the slave database is used if one is configured.
+    """
+    return IMPL.instance_get_usage_by_window(context, begin, end=end,
+                                             project_id=project_id,
+                                             use_slave=use_slave,
+                                             chunk_size=chunk_size)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False, limit=None,
+                                         marker=None):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
+    If use_slave is True, the slave database is used if one is configured.
+    Specifying a limit and/or the uuid of a marker instance returns a page
+    of the instances, in order of id.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave,
+                                              limit=limit, marker=marker)
+
+
+def instance_count_active_by_window(context, begin, end=None,
+                                    project_id=None, host=None):
+    """Count the instances active during a certain time window."""
+    return IMPL.instance_count_active_by_window(context, begin, end,
+                                                project_id, host)
 
 
-def instance_get_all_by_host(context, host, columns_to_join=None):
-    """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host, columns_to_join)
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             limit=None, marker=None):
+    """Get all instances belonging to a host.
+
+    If limit or marker are given, the instances are returned ordered by id,
+    at most limit at a time and starting after the instance whose uuid
+    is marker.
+    """
+    return IMPL.instance_get_all_by_host(context, host, columns_to_join,
+                                         limit=limit, marker=marker)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -697,14 +831,18 @@ def instance_update_and_get_original(context, instance_uuid, values):
 
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
-    return IMPL.instance_add_security_group(context, instance_id,
-                                            security_group_id)
+    rv = IMPL.instance_add_security_group(context, instance_id,
+                                          security_group_id)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
 
 
 def instance_remove_security_group(context, instance_id, security_group_id):
     """Disassociate the given security group from the given instance."""
-    return IMPL.instance_remove_security_group(context, instance_id,
-                                            security_group_id)
+    rv = IMPL.instance_remove_security_group(context, instance_id,
+                                             security_group_id)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
 
 
 ###################
@@ -976,6 +1114,28 @@ def reservation_rollback(context, reservations, project_id=None):
                                      project_id=project_id)
 
 
+def quota_reserve_optimistic(context, resources, quotas, deltas, expire,
+                             until_refresh, max_age, project_id=None):
+    """Check quotas and create appropriate reservations without locking
+    all of the usages of the project.
+    """
+    return IMPL.quota_reserve_optimistic(context, resources, quotas, deltas,
+                                         expire, until_refresh, max_age,
+                                         project_id=project_id)
+
+
+def reservation_commit_optimistic(context, reservations, project_id=None):
+    """Commit quota reservations made by quota_reserve_optimistic."""
+    return IMPL.reservation_commit_optimistic(context, reservations,
+                                              project_id=project_id)
+
+
+def reservation_rollback_optimistic(context, reservations, project_id=None):
+    """Roll back quota reservations made by quota_reserve_optimistic."""
+    return IMPL.reservation_rollback_optimistic(context, reservations,
+                                                project_id=project_id)
+
+
 def quota_destroy_all_by_project(context, project_id):
     """Destroy all quotas associated with a given project."""
     return IMPL.quota_destroy_all_by_project(context, project_id)
@@ -1038,6 +1198,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get a dict of the block device mappings of each instance uuid."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(
+            context, instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1112,7 +1278,9 @@ def security_group_ensure_default(context):
 
 def security_group_destroy(context, security_group_id):
     """Deletes a security group."""
-    return IMPL.security_group_destroy(context, security_group_id)
+    rv = IMPL.security_group_destroy(context, security_group_id)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
 
 
 def security_group_count_by_project(context, project_id, session=None):
@@ -1126,7 +1294,9 @@ def security_group_count_by_project(context, project_id, session=None):
 
 def security_group_rule_create(context, values):
     """Create a new security group."""
-    return IMPL.security_group_rule_create(context, values)
+    rv = IMPL.security_group_rule_create(context, values)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
 
 
 def security_group_rule_get_by_security_group(context, security_group_id):
@@ -1144,7 +1314,9 @@ def security_group_rule_get_by_security_group_grantee(context,
 
 def security_group_rule_destroy(context, security_group_rule_id):
     """Deletes a security group rule."""
-    return IMPL.security_group_rule_destroy(context, security_group_rule_id)
+    rv = IMPL.security_group_rule_destroy(context, security_group_rule_id)
+    cache.invalidate(cache.SECURITY_GROUP_RULE)
+    return rv
 
 
 def security_group_rule_get(context, security_group_rule_id):
@@ -1184,7 +1356,9 @@ def security_group_default_rule_list(context):
 
 def provider_fw_rule_create(context, rule):
     """Add a firewall rule at the provider level (all hosts & instances)."""
-    return IMPL.provider_fw_rule_create(context, rule)
+    rv = IMPL.provider_fw_rule_create(context, rule)
+    cache.invalidate(cache.PROVIDER_FW_RULE)
+    return rv
 
 
 def provider_fw_rule_get_all(context):
@@ -1194,7 +1368,9 @@ def provider_fw_rule_get_all(context):
 
 def provider_fw_rule_destroy(context, rule_id):
     """Delete a provider firewall rule from the database."""
-    return IMPL.provider_fw_rule_destroy(context, rule_id)
+    rv = IMPL.provider_fw_rule_destroy(context, rule_id)
+    cache.invalidate(cache.PROVIDER_FW_RULE)
+    return rv
 
 
 ###################
@@ -1264,7 +1440,9 @@ def console_get(context, console_id, instance_uuid=None):
 
 def instance_type_create(context, values):
     """Create a new instance type."""
-    return IMPL.instance_type_create(context, values)
+    rv = IMPL.instance_type_create(context, values)
+    cache.invalidate(cache.INSTANCE_TYPE)
+    return rv
 
 
 def instance_type_get_all(context, inactive=False, filters=None):
@@ -1275,22 +1453,29 @@ def instance_type_get_all(context, inactive=False, filters=None):
 
 def instance_type_get(context, id):
     """Get instance type by id."""
-    return IMPL.instance_type_get(context, id)
+    return _get_cached_flavor(context, 'instance_type_get', id)
 
 
 def instance_type_get_by_name(context, name):
     """Get instance type by name."""
-    return IMPL.instance_type_get_by_name(context, name)
+    return _get_cached_flavor(context, 'instance_type_get_by_name', name)
 
 
 def instance_type_get_by_flavor_id(context, id):
     """Get instance type by flavor id."""
-    return IMPL.instance_type_get_by_flavor_id(context, id)
+    return _get_cached_flavor(context, 'instance_type_get_by_flavor_id', id)
+
+
+def instance_type_cache_get_stats():
+    """Get the hits and misses of the flavor cache of this process."""
+    return _get_flavor_cache().get_stats()
 
 
 def instance_type_destroy(context, name):
     """Delete an instance type."""
-    return IMPL.instance_type_destroy(context, name)
+    rv = IMPL.instance_type_destroy(context, name)
+    cache.invalidate(cache.INSTANCE_TYPE)
+    return rv
 
 
 def instance_type_access_get_by_flavor_id(context, flavor_id):
@@ -1321,6 +1506,7 @@ def instance_type_extra_specs_get_item(context, flavor_id, key):
 def instance_type_extra_specs_delete(context, flavor_id, key):
     """Delete the given extra specs item."""
     IMPL.instance_type_extra_specs_delete(context, flavor_id, key)
+    cache.invalidate(cache.INSTANCE_TYPE)
 
 
 def instance_type_extra_specs_update_or_create(context, flavor_id,
@@ -1329,6 +1515,7 @@ def instance_type_extra_specs_update_or_create(context, flavor_id,
     key/value pairs specified in the extra specs dict argument"""
     IMPL.instance_type_extra_specs_update_or_create(context, flavor_id,
                                                     extra_specs)
+    cache.invalidate(cache.INSTANCE_TYPE)
 
 
 ####################
@@ -1402,7 +1589,9 @@ def instance_system_metadata_update(context, instance_uuid, metadata, delete):
 
 def agent_build_create(context, values):
     """Create a new agent build entry."""
-    return IMPL.agent_build_create(context, values)
+    rv = IMPL.agent_build_create(context, values)
+    cache.invalidate(cache.AGENT_BUILD)
+    return rv
 
 
 def agent_build_get_by_triple(context, hypervisor, os, architecture):
@@ -1419,11 +1608,13 @@ def agent_build_get_all(context, hypervisor=None):
 def agent_build_destroy(context, agent_update_id):
     """Destroy agent build entry."""
     IMPL.agent_build_destroy(context, agent_update_id)
+    cache.invalidate(cache.AGENT_BUILD)
 
 
 def agent_build_update(context, agent_build_id, values):
     """Update agent build entry."""
     IMPL.agent_build_update(context, agent_build_id, values)
+    cache.invalidate(cache.AGENT_BUILD)
 
 
 ####################
@@ -1434,9 +1625,13 @@ def bw_usage_get(context, uuid, start_period, mac):
     return IMPL.bw_usage_get(context, uuid, start_period, mac)
 
 
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    """Return bw usages for instance(s) in a given audit period."""
-    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period)
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    """Return bw usages for instance(s) in a given audit period.
+
+    If use_slave is True, the slave database is used if one is configured.
+    """
+    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period,
+                                      use_slave=use_slave)
 
 
 def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
@@ -1647,6 +1842,13 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get a dict of the ec2 ids of instance uuids from the
+    instance_id_mappings table.  Uuids without an ec2 id are left out.
+    """
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
@@ -1722,3 +1924,16 @@ def archive_deleted_rows_for_table(context, tablename, max_rows=None):
     """
     return IMPL.archive_deleted_rows_for_table(context, tablename,
                                                max_rows=max_rows)
+
+
+def archive_deleted_rows_in_batches(context, batch_size, time_limit=None,
+                                    throttle=0):
+    """Move deleted rows to the shadow tables batch_size rows at a time,
+    sleeping throttle seconds between batches, until none are left or
+    time_limit seconds have passed.
+
+    :returns: number of rows archived.
+    """
+    return IMPL.archive_deleted_rows_in_batches(context, batch_size,
+                                                time_limit=time_limit,
+                                                throttle=throttle)
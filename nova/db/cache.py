@@ -0,0 +1,174 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-through cache for slow-changing database records.
+
+Cached records are grouped into namespaces.  The DB API functions which
+write records of a namespace call :func:`invalidate`, which drops every
+cached entry of that namespace.  Entries are kept in the memorycache
+client, so invalidations are only seen by other processes when
+memcached_servers is configured; otherwise entries in other processes
+expire after their TTL.
+
+A cache created with a size keeps its entries in the memory of the
+process instead, evicting the least recently used ones beyond that size.
+Only the namespace generations are then kept in the memorycache client.
+"""
+
+import collections
+import copy
+import hashlib
+
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
+from nova.openstack.common import uuidutils
+
+INSTANCE_TYPE = 'instance_type'
+AGENT_BUILD = 'agent_build'
+PROVIDER_FW_RULE = 'provider_fw_rule'
+SECURITY_GROUP_RULE = 'security_group_rule'
+
+_CLIENT = None
+
+
+def _get_client():
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = memorycache.get_client()
+    return _CLIENT
+
+
+def reset():
+    """Forget all cached entries of this process."""
+    global _CLIENT
+    _CLIENT = None
+
+
+def _generation_key(namespace):
+    return str('nova-db-cache:%s:generation' % namespace)
+
+
+def _get_generation(namespace):
+    client = _get_client()
+    key = _generation_key(namespace)
+    generation = client.get(key)
+    if generation is None:
+        client.add(key, uuidutils.generate_uuid())
+        generation = client.get(key)
+    return generation
+
+
+def invalidate(namespace):
+    """Drop all cached entries of a namespace."""
+    _get_client().set(_generation_key(namespace), uuidutils.generate_uuid())
+
+
+class Cache(object):
+    """Caches the results of DB API calls for up to ttl seconds.
+
+    A ttl of 0 disables caching.  When size is given, at most size entries
+    are kept in the memory of this process.  Hits and misses are counted
+    per namespace and can be retrieved with :meth:`get_stats`.
+    """
+
+    def __init__(self, ttl, size=None):
+        self.ttl = ttl
+        self.size = size
+        self.hits = collections.defaultdict(int)
+        self.misses = collections.defaultdict(int)
+        # NOTE: The entries are kept in a doubly linked list of
+        # [previous, next, key, entry] links, least recently used first,
+        # so that using and evicting an entry take constant time.
+        self._entries = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def _unlink(self, link):
+        previous_link, next_link = link[0], link[1]
+        previous_link[1] = next_link
+        next_link[0] = previous_link
+
+    def _append(self, link):
+        last = self._root[0]
+        link[0] = last
+        link[1] = self._root
+        last[1] = link
+        self._root[0] = link
+
+    def _get_entry(self, cache_key):
+        if self.size is None:
+            return _get_client().get(cache_key)
+
+        link = self._entries.get(cache_key)
+        if link is None:
+            return None
+        self._unlink(link)
+        expires, value = link[3]
+        if timeutils.utcnow_ts() >= expires:
+            del self._entries[cache_key]
+            return None
+        self._append(link)
+        return value
+
+    def _set_entry(self, cache_key, value):
+        if self.size is None:
+            _get_client().set(cache_key, value, time=self.ttl)
+            return
+
+        link = self._entries.pop(cache_key, None)
+        if link is not None:
+            self._unlink(link)
+        while self._entries and len(self._entries) >= self.size:
+            oldest = self._root[1]
+            self._unlink(oldest)
+            del self._entries[oldest[2]]
+        link = [None, None, cache_key, (timeutils.utcnow_ts() + self.ttl,
+                                        value)]
+        self._append(link)
+        self._entries[cache_key] = link
+
+    def get(self, namespace, key, loader, *args, **kwargs):
+        """Return the cached result for key, or call the loader to get it.
+
+        :param namespace: namespace of the record, used for invalidation
+        :param key: tuple identifying the record within the namespace
+        :param loader: function called with args and kwargs on a miss
+        """
+        if self.ttl <= 0:
+            return loader(*args, **kwargs)
+
+        cache_key = str('nova-db-cache:%s:%s:%s' % (
+                namespace, _get_generation(namespace),
+                hashlib.md5(repr(key)).hexdigest()))
+        cached = self._get_entry(cache_key)
+        if cached is not None:
+            self.hits[namespace] += 1
+            return copy.deepcopy(cached[0])
+
+        self.misses[namespace] += 1
+        value = loader(*args, **kwargs)
+        # NOTE: The value is wrapped so that a cached None can be told
+        # apart from a miss.
+        self._set_entry(cache_key, (copy.deepcopy(value),))
+        return value
+
+    def get_stats(self):
+        """Return a dict of hits and misses for each namespace."""
+        namespaces = set(self.hits.keys()) | set(self.misses.keys())
+        return dict((namespace, {'hits': self.hits[namespace],
+                                 'misses': self.misses[namespace]})
+                    for namespace in namespaces)
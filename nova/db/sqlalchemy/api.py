@@ -23,14 +23,19 @@ import collections
 import copy
 import datetime
 import functools
+import inspect
+import random
 import sys
 import time
 import uuid
 
 from oslo.config import cfg
+import sqlalchemy
 from sqlalchemy import and_
 from sqlalchemy import Boolean
+from sqlalchemy import distinct
 from sqlalchemy.exc import DataError
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy import Integer
@@ -39,6 +44,8 @@ from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
+from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
@@ -51,7 +58,9 @@ from nova.compute import task_states
 from nova.compute import vm_states
 import nova.context
 from nova import db
+from nova.db.sqlalchemy import instrument
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import utils as db_utils
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common.db.sqlalchemy import session as db_session
@@ -66,6 +75,11 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.StrOpt('slave_connection',
+               default='',
+               help='The SQLAlchemy connection string used to connect to a '
+                    'read-only slave database, if one is available',
+               secret=True),
 ]
 
 CONF = cfg.CONF
@@ -73,16 +87,97 @@ CONF.register_opts(db_opts)
 CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
 CONF.import_opt('sql_connection',
                 'nova.openstack.common.db.sqlalchemy.session')
+CONF.import_opt('sql_retry_interval',
+                'nova.openstack.common.db.sqlalchemy.session')
 
 LOG = logging.getLogger(__name__)
 
 get_engine = db_session.get_engine
-get_session = db_session.get_session
+
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
+
+# When the slave database last failed a read
+_SLAVE_FAILED_AT = None
+
+
+def get_slave_engine():
+    """Return the engine of the slave database."""
+    global _SLAVE_ENGINE
+    if _SLAVE_ENGINE is None:
+        _SLAVE_ENGINE = _create_slave_engine(CONF.slave_connection)
+    return _SLAVE_ENGINE
+
+
+def _create_slave_engine(sql_connection):
+    """Return a new SQLAlchemy engine for the slave database.
+
+    This is set up like db_session.create_engine() but, unlike the master
+    engine, it does not wait for the database to come up: it connects
+    lazily, so reads fail at once while the slave is down and
+    _fallback_to_master sends them to the master.
+    """
+    connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
+
+    engine_args = {
+        "pool_recycle": CONF.sql_idle_timeout,
+        "echo": False,
+        'convert_unicode': True,
+    }
+
+    if CONF.sql_connection_debug >= 100:
+        engine_args['echo'] = 'debug'
+    elif CONF.sql_connection_debug >= 50:
+        engine_args['echo'] = True
+
+    if "sqlite" in connection_dict.drivername:
+        engine_args["poolclass"] = NullPool
+        if sql_connection == "sqlite://":
+            engine_args["poolclass"] = StaticPool
+            engine_args["connect_args"] = {'check_same_thread': False}
+    else:
+        engine_args['pool_size'] = CONF.sql_max_pool_size
+        if CONF.sql_max_overflow is not None:
+            engine_args['max_overflow'] = CONF.sql_max_overflow
+
+    engine = sqlalchemy.create_engine(sql_connection, **engine_args)
+
+    sqlalchemy.event.listen(engine, 'checkin', db_session._greenthread_yield)
+
+    if 'mysql' in connection_dict.drivername:
+        sqlalchemy.event.listen(engine, 'checkout',
+                                db_session._ping_listener)
+    elif 'sqlite' in connection_dict.drivername:
+        if not CONF.sqlite_synchronous:
+            sqlalchemy.event.listen(engine, 'connect',
+                                    db_session._synchronous_switch_listener)
+        sqlalchemy.event.listen(engine, 'connect',
+                                db_session._add_regexp_listener)
+    return engine
+
+
+def get_session(use_slave=False, autocommit=True, expire_on_commit=False):
+    """Return a SQLAlchemy session.
+
+    If use_slave is True and slave_connection is set, the session reads
+    from the slave database.
+    """
+    global _SLAVE_MAKER
+    if use_slave and CONF.slave_connection:
+        if _SLAVE_MAKER is None:
+            _SLAVE_MAKER = db_session.get_maker(get_slave_engine())
+        return _SLAVE_MAKER(autocommit=autocommit,
+                            expire_on_commit=expire_on_commit)
+    return db_session.get_session(autocommit=autocommit,
+                                  expire_on_commit=expire_on_commit)
 
 
 def get_backend():
     """The backend is this module itself."""
-    return sys.modules[__name__]
+    backend = sys.modules[__name__]
+    if CONF.sql_instrumentation:
+        return instrument.InstrumentedBackend(backend)
+    return backend
 
 
 def require_admin_context(f):
@@ -161,11 +256,60 @@ def _retry_on_deadlock(f):
     return wrapped
 
 
+def _slave_usable():
+    """Return whether reads may be sent to the slave database, which is
+    not the case for sql_retry_interval seconds after one failed.
+    """
+    return (_SLAVE_FAILED_AT is None or
+            timeutils.is_older_than(_SLAVE_FAILED_AT,
+                                    CONF.sql_retry_interval))
+
+
+def _slave_failed(error):
+    """Record that a read from the slave database failed."""
+    global _SLAVE_FAILED_AT
+    LOG.warn(_("Reading from the slave database failed, using the "
+               "master: %s"), error)
+    _SLAVE_FAILED_AT = timeutils.utcnow()
+
+
+def _fallback_to_master(f):
+    """Decorator for reads which may be sent to the slave database.
+
+    If the read fails on the slave it is retried on the master, and the
+    slave is left alone for sql_retry_interval seconds. use_slave may be
+    passed either by keyword or positionally.
+    """
+    use_slave_index = inspect.getargspec(f).args.index('use_slave')
+
+    @functools.wraps(f)
+    def wrapped(*args, **kwargs):
+        if len(args) > use_slave_index:
+            use_slave = args[use_slave_index]
+        else:
+            use_slave = kwargs.get('use_slave')
+        if use_slave:
+            if _slave_usable():
+                try:
+                    return f(*args, **kwargs)
+                except DBAPIError as e:
+                    _slave_failed(e)
+            if len(args) > use_slave_index:
+                args = list(args)
+                args[use_slave_index] = False
+            else:
+                kwargs['use_slave'] = False
+        return f(*args, **kwargs)
+    return wrapped
+
+
 def model_query(context, model, *args, **kwargs):
     """Query helper that accounts for context's `read_deleted` field.
 
     :param context: context to query under
     :param session: if present, the session to use
+    :param use_slave: if present and no session is given, read from the
+            slave database if one is configured.
     :param read_deleted: if present, overrides context's read_deleted field.
     :param project_only: if present and context is user-type, then restrict
             query to match the context's project_id. If set to 'allow_none',
@@ -175,7 +319,8 @@ def model_query(context, model, *args, **kwargs):
             parameter that is a subclass of NovaBase and corresponds to the
             model parameter.
     """
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or get_session(
+            use_slave=kwargs.get('use_slave', False))
     read_deleted = kwargs.get('read_deleted') or context.read_deleted
     project_only = kwargs.get('project_only', False)
 
@@ -276,6 +421,20 @@ def convert_datetimes(values, *datetime_keys):
 ###################
 
 
+def dispose_engine():
+    global _SLAVE_ENGINE, _SLAVE_MAKER
+    db_session.cleanup()
+    if _SLAVE_MAKER:
+        _SLAVE_MAKER.close_all()
+        _SLAVE_MAKER = None
+    if _SLAVE_ENGINE:
+        _SLAVE_ENGINE.dispose()
+        _SLAVE_ENGINE = None
+
+
+###################
+
+
 def constraint(**conditions):
     return Constraint(conditions)
 
@@ -459,8 +618,9 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context):
-    return model_query(context, models.ComputeNode).\
+@_fallback_to_master
+def compute_node_get_all(context, use_slave=False):
+    return model_query(context, models.ComputeNode, use_slave=use_slave).\
             options(joinedload('service')).\
             options(joinedload('stats')).\
             all()
@@ -1007,39 +1167,69 @@ def fixed_ip_associate(context, address, instance_uuid, network_id=None,
     return fixed_ip_ref['address']
 
 
+# Free fixed ips of each network which this process has not handed out
+# yet, as lists of (id, address) in random order.  The database remains
+# the source of truth: an address is only allocated once a conditional
+# UPDATE has claimed its row, so entries taken by other processes in the
+# meantime are simply skipped.
+_FIXED_IP_FREE_LISTS = {}
+
+# Maximum number of free fixed ips loaded into a free list at once
+_FIXED_IP_FREE_LIST_SIZE = 256
+
+
+def _fixed_ip_free_query(context, network_id):
+    network_or_none = or_(models.FixedIp.network_id == network_id,
+                          models.FixedIp.network_id == None)
+    return model_query(context, models.FixedIp, read_deleted="no").\
+                   filter(network_or_none).\
+                   filter_by(reserved=False).\
+                   filter_by(instance_uuid=None).\
+                   filter_by(host=None)
+
+
+def _fixed_ip_free_list_refill(context, network_id):
+    rows = _fixed_ip_free_query(context, network_id).\
+                   with_entities(models.FixedIp.id,
+                                 models.FixedIp.address).\
+                   limit(_FIXED_IP_FREE_LIST_SIZE).\
+                   all()
+    free = [(row[0], row[1]) for row in rows]
+    # NOTE: Shuffled so that processes refilling at the same time rarely
+    # try to claim the same addresses.
+    random.shuffle(free)
+    _FIXED_IP_FREE_LISTS[network_id] = free
+    return free
+
+
 @require_admin_context
 def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                             host=None):
     if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
 
-    session = get_session()
-    with session.begin():
-        network_or_none = or_(models.FixedIp.network_id == network_id,
-                              models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
-                               filter(network_or_none).\
-                               filter_by(reserved=False).\
-                               filter_by(instance_uuid=None).\
-                               filter_by(host=None).\
-                               with_lockmode('update').\
-                               first()
-        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
-        #             then this has concurrency issues
-        if not fixed_ip_ref:
-            raise exception.NoMoreFixedIps()
-
-        if fixed_ip_ref['network_id'] is None:
-            fixed_ip_ref['network'] = network_id
-
-        if instance_uuid:
-            fixed_ip_ref['instance_uuid'] = instance_uuid
-
-        if host:
-            fixed_ip_ref['host'] = host
-        session.add(fixed_ip_ref)
-    return fixed_ip_ref['address']
+    values = {'network_id': network_id}
+    if instance_uuid:
+        values['instance_uuid'] = instance_uuid
+    if host:
+        values['host'] = host
+
+    while True:
+        free = _FIXED_IP_FREE_LISTS.get(network_id)
+        if not free:
+            free = _fixed_ip_free_list_refill(context, network_id)
+            if not free:
+                raise exception.NoMoreFixedIps()
+        fixed_ip_id, address = free.pop()
+        # Claim the address only if it is still free.  This locks the one
+        # row for the length of the statement instead of scanning the
+        # network's rows with SELECT ... FOR UPDATE.
+        claimed = _fixed_ip_free_query(context, network_id).\
+                          filter_by(id=fixed_ip_id).\
+                          filter_by(address=address).\
+                          update(values, synchronize_session=False)
+        if claimed:
+            return address
 
 
 @require_context
@@ -1136,6 +1326,15 @@ def fixed_ip_get_all(context, session=None):
     return result
 
 
+@require_admin_context
+def fixed_ip_get_all_iter(context, chunk_size=1000):
+    """Yield all fixed ips in order of id, chunk_size at a time."""
+    query = model_query(context, models.FixedIp, read_deleted="yes")
+    for fixed_ips in _iter_chunks_by_id(query, models.FixedIp, chunk_size):
+        for fixed_ip in fixed_ips:
+            yield fixed_ip
+
+
 @require_context
 def fixed_ip_get_by_address(context, address, session=None):
     result = model_query(context, models.FixedIp, session=session).\
@@ -1463,6 +1662,153 @@ def instance_create(context, values):
     return instance_ref
 
 
+def _insert_many(session, model, rows):
+    """Insert rows into the table of a model with as few statements as
+    possible.  Rows with the same keys are inserted by one executemany,
+    which the MySQL driver turns into a multi-row INSERT.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        session.execute(model.__table__.insert(), group)
+
+
+def _block_device_mappings_merge(block_device_mappings):
+    """Merge a list of block device mapping values the way
+    block_device_mapping_update_or_create merges them when called for
+    each one in turn on an instance without block device mappings.
+    """
+    merged = []
+    for values in block_device_mappings:
+        values = values.copy()
+        _scrub_empty_str_values(values, ['volume_size'])
+        for bdm in merged:
+            if bdm['device_name'] == values['device_name']:
+                bdm.update(values)
+                break
+        else:
+            merged.append(values)
+
+        virtual_name = values.get('virtual_name')
+        if (virtual_name is not None and
+            block_device.is_swap_or_ephemeral(virtual_name)):
+            merged = [bdm for bdm in merged
+                      if (bdm.get('virtual_name') != virtual_name or
+                          bdm['device_name'] == values['device_name'])]
+    return merged
+
+
+@require_context
+def instance_create_bulk(context, values_list):
+    """Create several Instance records in one transaction.
+
+    The instances, their metadata, system metadata, info caches, security
+    group associations, block device mappings and ec2 id mappings are each
+    inserted with one statement, rather than one statement per row.
+
+    context - request context object
+    values_list - list of dicts containing column values, as passed to
+                  instance_create.  A 'block_device_mapping' key may hold
+                  a list of block device mapping values for the instance.
+
+    Returns the created instances in the order of values_list.
+    """
+    columns = set(models.Instance.__table__.columns.keys())
+    unique_names = CONF.osapi_compute_unique_server_name_scope in ('project',
+                                                                   'global')
+    instance_rows = []
+    metadata_rows = []
+    system_metadata_rows = []
+    info_cache_rows = []
+    bdm_rows = []
+    instance_groups = []
+    group_names = set()
+
+    for values in values_list:
+        values = values.copy()
+        if not values.get('uuid'):
+            values['uuid'] = str(uuid.uuid4())
+        instance_uuid = values['uuid']
+
+        for key, value in (values.pop('metadata', None) or {}).iteritems():
+            metadata_rows.append({'instance_uuid': instance_uuid,
+                                  'key': key, 'value': value})
+        for key, value in (values.pop('system_metadata', None) or
+                           {}).iteritems():
+            system_metadata_rows.append({'instance_uuid': instance_uuid,
+                                         'key': key, 'value': value})
+
+        info_cache = dict(values.pop('info_cache', None) or {})
+        info_cache['instance_uuid'] = instance_uuid
+        info_cache_rows.append(info_cache)
+
+        security_groups = set(values.pop('security_groups', None) or [])
+        group_names.update(security_groups)
+        instance_groups.append((instance_uuid, security_groups))
+
+        for bdm in _block_device_mappings_merge(
+                values.pop('block_device_mapping', None) or []):
+            bdm['instance_uuid'] = instance_uuid
+            bdm_rows.append(bdm)
+
+        instance_rows.append(dict((key, value)
+                                  for key, value in values.iteritems()
+                                  if key in columns))
+
+    instance_uuids = [row['uuid'] for row in instance_rows]
+    session = get_session()
+    with session.begin():
+        hostnames = set()
+        for row in instance_rows:
+            if 'hostname' not in row:
+                continue
+            _validate_unique_server_name(context, session, row['hostname'])
+            # NOTE: The instances of this batch are not in the database
+            # yet, so check them against each other as well.
+            lowername = row['hostname'].lower()
+            if unique_names and lowername in hostnames:
+                raise exception.InstanceExists(name=lowername)
+            hostnames.add(lowername)
+
+        groups = {'default': security_group_ensure_default(context,
+                                                           session=session)}
+        group_names.discard('default')
+        if group_names:
+            for group in _security_group_get_by_names(context, session,
+                    context.project_id, list(group_names)):
+                groups[group['name']] = group
+        association_rows = [{'security_group_id': groups[name]['id'],
+                             'instance_uuid': instance_uuid}
+                            for instance_uuid, names in instance_groups
+                            for name in names]
+
+        _insert_many(session, models.Instance, instance_rows)
+        _insert_many(session, models.InstanceMetadata, metadata_rows)
+        _insert_many(session, models.InstanceSystemMetadata,
+                     system_metadata_rows)
+        _insert_many(session, models.InstanceInfoCache, info_cache_rows)
+        _insert_many(session, models.SecurityGroupInstanceAssociation,
+                     association_rows)
+        _insert_many(session, models.BlockDeviceMapping, bdm_rows)
+        _insert_many(session, models.InstanceIdMapping,
+                     [{'uuid': instance_uuid}
+                      for instance_uuid in instance_uuids])
+
+        instances = model_query(context, models.Instance, session=session).\
+                options(joinedload_all('security_groups.rules')).\
+                options(joinedload('info_cache')).\
+                options(joinedload('metadata')).\
+                options(joinedload('system_metadata')).\
+                filter(models.Instance.uuid.in_(instance_uuids)).\
+                all()
+
+    instances_by_uuid = dict((instance['uuid'], instance)
+                             for instance in instances)
+    return [instances_by_uuid[instance_uuid]
+            for instance_uuid in instance_uuids]
+
+
 @require_admin_context
 def instance_data_get_for_project(context, project_id, session=None):
     result = model_query(context,
@@ -1515,6 +1861,28 @@ def instance_get_by_uuid(context, uuid, columns_to_join=None):
             columns_to_join=columns_to_join)
 
 
+@require_context
+def instance_get_by_uuids(context, uuids, columns_to_join=None):
+    """Return the instances matching a list of uuids in a single query.
+
+    Instances which do not exist are not included in the result.
+    """
+    if not uuids:
+        return []
+
+    if columns_to_join is None:
+        columns_to_join = ['info_cache', 'security_groups']
+        manual_joins = ['metadata', 'system_metadata']
+    else:
+        manual_joins, columns_to_join = _manual_join_columns(
+                list(columns_to_join))
+    query = model_query(context, models.Instance, project_only=True)
+    for column in columns_to_join:
+        query = query.options(joinedload(column))
+    instances = query.filter(models.Instance.uuid.in_(uuids)).all()
+    return _instances_fill_metadata(context, instances, manual_joins)
+
+
 @require_context
 def _instance_get_by_uuid(context, uuid, session=None, columns_to_join=None):
     result = _build_instance_get(context, session=session,
@@ -1562,7 +1930,8 @@ def _build_instance_get(context, session=None, columns_to_join=None):
     return query
 
 
-def _instances_fill_metadata(context, instances, manual_joins=None):
+def _instances_fill_metadata(context, instances, manual_joins=None,
+                             session=None):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1571,6 +1940,7 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param session: if present, the session to read the metadata with
     """
     uuids = [inst['uuid'] for inst in instances]
 
@@ -1579,12 +1949,14 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
 
     meta = collections.defaultdict(list)
     if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids):
+        for row in _instance_metadata_get_multi(context, uuids,
+                                                session=session):
             meta[row['instance_uuid']].append(row)
 
     sys_meta = collections.defaultdict(list)
     if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids):
+        for row in _instance_system_metadata_get_multi(context, uuids,
+                                                       session=session):
             sys_meta[row['instance_uuid']].append(row)
 
     filled_instances = []
@@ -1627,17 +1999,44 @@ def instance_get_all(context, columns_to_join=None):
 
 
 @require_context
+def instance_get_all_iter(context, host=None, columns_to_join=None,
+                          chunk_size=1000):
+    """Yield all instances, optionally only those on host, in order of id.
+
+    The instances are read chunk_size at a time.
+    """
+    if columns_to_join is None:
+        columns_to_join = ['info_cache', 'security_groups']
+        manual_joins = ['metadata', 'system_metadata']
+    else:
+        manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
+    query = model_query(context, models.Instance, project_only=True)
+    for column in columns_to_join:
+        query = query.options(joinedload(column))
+    if host is not None:
+        query = query.filter_by(host=host)
+    for instances in _iter_chunks_by_id(query, models.Instance, chunk_size):
+        for instance in _instances_fill_metadata(context, instances,
+                                                 manual_joins):
+            yield instance
+
+
+@require_context
+@_fallback_to_master
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                session=None):
+                                session=None, use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
+    otherwise.
 
-    sort_fn = {'desc': desc, 'asc': asc}
+    When a limit is given, the ids of the page are looked up first and
+    the joined columns are only loaded for those instances, so that the
+    joins don't have to be done for every row the database skips over.
+    """
 
     if not session:
-        session = get_session()
+        session = get_session(use_slave=use_slave)
 
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
@@ -1645,12 +2044,45 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     else:
         manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
 
-    query_prefix = session.query(models.Instance)
-    for column in columns_to_join:
-        query_prefix = query_prefix.options(joinedload(column))
+    query_prefix = _instance_filters_query(context, filters, session)
+
+    # paginate query
+    sort_keys = [sort_key] + [key for key in ('created_at', 'id')
+                              if key != sort_key]
+    if marker is not None:
+        marker = _instance_get_sort_values(context, marker, sort_keys,
+                                           session=session)
+    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
+                           models.Instance, limit,
+                           sort_keys,
+                           marker=marker,
+                           sort_dir=sort_dir)
 
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
+    if limit is None:
+        for column in columns_to_join:
+            query_prefix = query_prefix.options(joinedload(column))
+        instances = query_prefix.all()
+    else:
+        ids = [row.id for row in
+               query_prefix.with_entities(models.Instance.id).all()]
+        instances = []
+        if ids:
+            query = session.query(models.Instance).\
+                            filter(models.Instance.id.in_(ids))
+            for column in columns_to_join:
+                query = query.options(joinedload(column))
+            instances_by_id = dict((inst.id, inst) for inst in query.all())
+            instances = [instances_by_id[inst_id] for inst_id in ids]
+
+    return _instances_fill_metadata(context, instances, manual_joins,
+                                    session=session)
+
+
+def _instance_filters_query(context, filters, session):
+    """Return a query of the instances matching filters, as used by
+    instance_get_all_by_filters.
+    """
+    query_prefix = session.query(models.Instance)
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1691,24 +2123,59 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 filters, exact_match_filter_names)
 
     query_prefix = regex_filter(query_prefix, models.Instance, filters)
-    query_prefix = tag_filter(query_prefix, models.Instance,
-                              models.InstanceMetadata,
-                              models.InstanceMetadata.instance_uuid,
-                              filters)
+    return tag_filter(query_prefix, models.Instance,
+                      models.InstanceMetadata,
+                      models.InstanceMetadata.instance_uuid,
+                      filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+@require_context
+@_fallback_to_master
+def instance_get_version_by_filters(context, filters, use_slave=False):
+    """Return the number of instances matching filters and the last time
+    one of them, its network info cache, metadata, security groups or
+    faults changed.
+
+    Soft-deleted rows count as changes, since soft_delete() keeps their
+    updated_at.
+    """
+    session = get_session(use_slave=use_slave)
+    query = _instance_filters_query(context, filters, session)
+    result = query.with_entities(
+            func.count(distinct(models.Instance.id)),
+            func.max(models.Instance.created_at),
+            func.max(models.Instance.updated_at),
+            func.max(models.Instance.deleted_at)).one()
+    count, times = result[0], list(result[1:])
+
+    instance_uuids = query.with_entities(models.Instance.uuid).subquery()
+    for model in (models.InstanceInfoCache, models.InstanceMetadata,
+                  models.SecurityGroupInstanceAssociation,
+                  models.InstanceFault):
+        times.extend(session.query(func.max(model.created_at),
+                                   func.max(model.updated_at),
+                                   func.max(model.deleted_at)).
+                     filter(model.instance_uuid.in_(instance_uuids)).
+                     one())
+
+    times = [time for time in times if time is not None]
+    return {'count': count, 'updated_at': max(times) if times else None}
+
+
+def _instance_get_sort_values(context, uuid, sort_keys, session=None):
+    """Return the values of sort_keys for the instance used as a marker.
+
+    Raises MarkerNotFound if there is no such instance.
+    """
+    columns = [getattr(models.Instance, key) for key in sort_keys]
+    result = model_query(context, columns[0], *columns[1:],
+                         base_model=models.Instance, session=session,
+                         project_only=True).\
+                     filter_by(uuid=uuid).\
+                     first()
+    if not result:
+        raise exception.MarkerNotFound(uuid)
+    return result
 
 
 def tag_filter(query, model, tag_model, tag_model_col, filters):
@@ -1787,6 +2254,38 @@ def tag_filter(query, model, tag_model, tag_model_col, filters):
     return query
 
 
+# Characters with a special meaning in regular expressions
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def _literal_regex_filter(column_attr, regex):
+    """Return a criterion matching the same values as a literal regex.
+
+    Regexes made only of literal characters, optionally anchored with ^
+    and $, are turned into an exact match ('^foo$'), a prefix match
+    ('^foo') or a substring match ('foo'), which unlike a regex match
+    can use an index for the first two.  None is returned for regexes
+    using any other syntax.
+    """
+    anchored_start = regex.startswith('^')
+    if anchored_start:
+        regex = regex[1:]
+    anchored_end = regex.endswith('$')
+    if anchored_end:
+        regex = regex[:-1]
+    if not regex or _REGEX_SPECIAL_CHARS.intersection(regex):
+        return None
+
+    if anchored_start and anchored_end:
+        return column_attr == regex
+    pattern = regex.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    if not anchored_start:
+        pattern = '%' + pattern
+    if not anchored_end:
+        pattern = pattern + '%'
+    return column_attr.like(pattern, escape='!')
+
+
 def regex_filter(query, model, filters):
     """Applies regular expression filtering to a query.
 
@@ -1812,30 +2311,156 @@ def regex_filter(query, model, filters):
             continue
         if 'property' == type(column_attr).__name__:
             continue
-        query = query.filter(column_attr.op(db_regexp_op)(
-                                    str(filters[filter_name])))
+        value = str(filters[filter_name])
+        criterion = None
+        if db_string in regexp_op_map:
+            criterion = _literal_regex_filter(column_attr, value)
+        if criterion is None:
+            criterion = column_attr.op(db_regexp_op)(value)
+        query = query.filter(criterion)
     return query
 
 
 @require_context
+@_fallback_to_master
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False, limit=None,
+                                         marker=None):
     """Return instances and joins that were active during window."""
+    session = get_session(use_slave=use_slave)
+    query = _instance_get_active_by_window_query(session, begin, end,
+                                                 project_id, host)
+    query = query.options(joinedload('info_cache')).\
+                  options(joinedload('security_groups'))
+    if limit is not None or marker is not None:
+        # Pages are ordered by id, starting after the marker instance
+        if marker is not None:
+            marker_id = _instance_id_for_marker(context, marker)
+            query = query.filter(models.Instance.id > marker_id)
+        query = query.order_by(asc(models.Instance.id)).limit(limit)
+
+    return _instances_fill_metadata(context, query.all(), session=session)
+
+
+@require_context
+def instance_count_active_by_window(context, begin, end=None,
+                                    project_id=None, host=None):
+    """Return the number of instances that were active during window."""
     session = get_session()
-    query = session.query(models.Instance)
+    query = _instance_get_active_by_window_query(session, begin, end,
+                                                 project_id, host)
+    return query.count()
 
-    query = query.options(joinedload('info_cache')).\
-                  options(joinedload('security_groups')).\
-                  filter(or_(models.Instance.terminated_at == None,
-                             models.Instance.terminated_at > begin))
+
+# Columns read by instance_get_usage_by_window
+_USAGE_COLUMNS = ['id', 'uuid', 'project_id', 'display_name', 'vm_state',
+                  'launched_at', 'terminated_at', 'instance_type_id',
+                  'deleted']
+
+
+@require_context
+def instance_get_usage_by_window(context, begin, end=None, project_id=None,
+                                 use_slave=False, chunk_size=1000):
+    """Yield the usage of the instances that were active during window.
+
+    Only the columns needed to bill an instance are read, along with its
+    instance_type_* system metadata, chunk_size instances at a time.  The
+    instances are yielded as dicts in order of project_id and id, so that
+    the usage of a project can be summed up as the instances stream by.
+    """
+    use_slave = use_slave and _slave_usable()
+    session = get_session(use_slave=use_slave)
+    last = None
+    while True:
+        # NOTE: This is a generator, so _fallback_to_master cannot cover
+        # it; a chunk which fails on the slave is read again from the
+        # master, as are the chunks following it.
+        try:
+            instances = _instance_get_usage_chunk(context, session, begin,
+                                                  end, project_id, last,
+                                                  chunk_size)
+        except DBAPIError as e:
+            if not use_slave:
+                raise
+            _slave_failed(e)
+            use_slave = False
+            session = get_session()
+            continue
+        for instance in instances:
+            yield instance
+
+        if len(instances) < chunk_size:
+            return
+        last = instances[-1]
+
+
+def _instance_get_usage_chunk(context, session, begin, end, project_id,
+                              last, chunk_size):
+    """Return the usage of up to chunk_size instances following last."""
+    query = _instance_get_active_by_window_query(session, begin, end,
+                                                 project_id)
+    query = query.with_entities(*[getattr(models.Instance, column)
+                                  for column in _USAGE_COLUMNS])
+    if last is not None:
+        query = query.filter(or_(
+                models.Instance.project_id > last['project_id'],
+                and_(models.Instance.project_id == last['project_id'],
+                     models.Instance.id > last['id'])))
+    query = query.order_by(asc(models.Instance.project_id),
+                           asc(models.Instance.id))
+    instances = [dict(zip(_USAGE_COLUMNS, row))
+                 for row in query.limit(chunk_size).all()]
+    if not instances:
+        return instances
+
+    sys_meta = collections.defaultdict(list)
+    rows = _instance_system_metadata_get_multi(
+            context, [instance['uuid'] for instance in instances],
+            session=session).\
+        filter(models.InstanceSystemMetadata.key.like('instance_type_%')).\
+        with_entities(models.InstanceSystemMetadata.instance_uuid,
+                      models.InstanceSystemMetadata.key,
+                      models.InstanceSystemMetadata.value)
+    for instance_uuid, key, value in rows:
+        sys_meta[instance_uuid].append({'key': key, 'value': value})
+    for instance in instances:
+        instance['system_metadata'] = sys_meta[instance['uuid']]
+    return instances
+
+
+def _instance_get_active_by_window_query(session, begin, end=None,
+                                         project_id=None, host=None):
+    query = session.query(models.Instance).\
+                    filter(or_(models.Instance.terminated_at == None,
+                               models.Instance.terminated_at > begin))
     if end:
         query = query.filter(models.Instance.launched_at < end)
     if project_id:
         query = query.filter_by(project_id=project_id)
     if host:
         query = query.filter_by(host=host)
+    return query
+
 
-    return _instances_fill_metadata(context, query.all())
+def _iter_chunks_by_id(query, model, chunk_size):
+    """Yield lists of the rows of a query, ordered by id.
+
+    Every chunk is read with its own query for the rows following the
+    last id of the previous chunk, so that only one chunk of rows has to
+    be held in memory at a time.
+    """
+    last_id = None
+    while True:
+        chunk_query = query
+        if last_id is not None:
+            chunk_query = chunk_query.filter(model.id > last_id)
+        rows = chunk_query.order_by(asc(model.id)).limit(chunk_size).all()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].id
 
 
 @require_admin_context
@@ -1850,10 +2475,27 @@ def _instance_get_all_query(context, project_only=False, joins=None):
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host, columns_to_join=None):
-    return _instances_fill_metadata(context,
-        _instance_get_all_query(context).filter_by(host=host).all(),
-                                manual_joins=columns_to_join)
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             limit=None, marker=None):
+    query = _instance_get_all_query(context).filter_by(host=host)
+    if limit is not None or marker is not None:
+        # Pages are ordered by id, starting after the marker instance
+        if marker is not None:
+            marker_id = _instance_id_for_marker(context, marker)
+            query = query.filter(models.Instance.id > marker_id)
+        query = query.order_by(asc(models.Instance.id)).limit(limit)
+    return _instances_fill_metadata(context, query.all(),
+                                    manual_joins=columns_to_join)
+
+
+def _instance_id_for_marker(context, marker):
+    result = model_query(context, models.Instance.id, read_deleted='yes',
+                         base_model=models.Instance).\
+                    filter_by(uuid=marker).\
+                    first()
+    if not result:
+        raise exception.MarkerNotFound(marker=marker)
+    return result[0]
 
 
 @require_admin_context
@@ -2881,6 +3523,216 @@ def reservation_rollback(context, reservations, project_id=None):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+# NOTE: The optimistic variants of quota_reserve, reservation_commit and
+# reservation_rollback below never lock the usages of a project as a
+# whole.  Usages are refreshed outside of any lock and only written back
+# if nobody changed them in the meantime, and reservations are applied
+# with a single guarded UPDATE per usage row, so parallel reservations
+# for a project only contend with each other for the usage rows they
+# reserve, and only for the short transaction which also creates the
+# reservation rows.  Usage rows are still updated before reservation rows.
+
+def _quota_usages_by_resource(context, project_id):
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+                   filter_by(project_id=project_id).\
+                   order_by(desc(models.QuotaUsage.id)).\
+                   all()
+    # NOTE: Concurrent first reservations of a resource may create more
+    # than one usage row for it; the oldest one is used consistently.
+    return dict((row.resource, row) for row in rows)
+
+
+def _quota_usage_create_optimistic(context, project_id, resource,
+                                   until_refresh):
+    """Create the usage of a resource and return the one to reserve from.
+
+    A concurrent reservation may have created a usage for the resource as
+    well, so the usages are read back and the oldest one is returned.  The
+    newer ones have nothing reserved from them yet and are deleted again.
+    """
+    _quota_usage_create(context, project_id, resource, 0, 0, until_refresh)
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+                   filter_by(project_id=project_id).\
+                   filter_by(resource=resource).\
+                   order_by(asc(models.QuotaUsage.id)).\
+                   all()
+    if len(rows) > 1:
+        model_query(context, models.QuotaUsage, read_deleted="no").\
+                filter(models.QuotaUsage.id.in_([row.id
+                                                 for row in rows[1:]])).\
+                filter_by(reserved=0).\
+                soft_delete(synchronize_session=False)
+    return rows[0]
+
+
+def _quota_usage_needs_refresh(usage, max_age):
+    if usage.in_use < 0:
+        # Negative in_use count indicates a desync, so try to
+        # heal from that...
+        return True
+    if usage.until_refresh is not None:
+        # The count is decremented by the reservation being made.
+        return usage.until_refresh <= 1
+    return bool(max_age and (usage.updated_at -
+                             timeutils.utcnow()).seconds >= max_age)
+
+
+def _quota_usages_refresh(context, resources, project_id, usages, work,
+                          until_refresh):
+    """Run the sync routines of the resources in work and store the results.
+
+    A refreshed usage is only written if it did not change while the sync
+    routine ran.  Otherwise the concurrent writer's value is kept, as usage
+    refreshes are a best-effort mechanism anyway.
+
+    :returns: the set of resources which were refreshed
+    """
+    refreshed = set()
+    while work:
+        resource = work.pop()
+        sync = resources[resource].sync
+        updates = sync(context, project_id, get_session())
+        for res, in_use in updates.items():
+            if res not in usages:
+                usages[res] = _quota_usage_create_optimistic(
+                        context, project_id, res, until_refresh or None)
+            usage = usages[res]
+            model_query(context, models.QuotaUsage, read_deleted="no").\
+                    filter_by(id=usage.id).\
+                    filter_by(in_use=usage.in_use).\
+                    filter_by(reserved=usage.reserved).\
+                    update({'in_use': in_use,
+                            'until_refresh': until_refresh or None},
+                           synchronize_session=False)
+            usage.in_use = in_use
+            refreshed.add(res)
+            work.discard(res)
+    return refreshed
+
+
+@require_context
+def quota_reserve_optimistic(context, resources, quotas, deltas, expire,
+                             until_refresh, max_age, project_id=None):
+    """Like quota_reserve, but without locking the usages of the project."""
+    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+
+    usages = _quota_usages_by_resource(elevated, project_id)
+    work = set()
+    for resource in deltas:
+        if resource not in usages:
+            usages[resource] = _quota_usage_create_optimistic(
+                    elevated, project_id, resource, until_refresh or None)
+            work.add(resource)
+        elif _quota_usage_needs_refresh(usages[resource], max_age):
+            work.add(resource)
+    refreshed = _quota_usages_refresh(elevated, resources, project_id,
+                                      usages, work, until_refresh)
+
+    # Check for deltas that would go negative
+    unders = [resource for resource, delta in deltas.items()
+              if delta < 0 and
+              delta + usages[resource].in_use < 0]
+    if unders:
+        LOG.warning(_("Change will make usage less than 0 for the following "
+                      "resources: %(unders)s") % locals())
+
+    # Reserve every resource with an UPDATE which only matches if the
+    # usage stays within the quota.  As in quota_reserve, only positive
+    # increments are checked and reserved.  The reservation rows are
+    # created in the same transaction, so either both or neither are
+    # written.
+    overs = []
+    session = get_session()
+    try:
+        with session.begin():
+            for resource, delta in sorted(deltas.items()):
+                values = {'reserved': (models.QuotaUsage.reserved +
+                                       max(delta, 0))}
+                if resource not in refreshed:
+                    values['until_refresh'] = (
+                            models.QuotaUsage.until_refresh - 1)
+                query = model_query(elevated, models.QuotaUsage,
+                                    session=session, read_deleted="no").\
+                                filter_by(id=usages[resource].id)
+                if quotas[resource] >= 0 and delta >= 0:
+                    query = query.filter(models.QuotaUsage.in_use +
+                                         models.QuotaUsage.reserved +
+                                         delta <= quotas[resource])
+                if not query.update(values, synchronize_session=False):
+                    overs.append(resource)
+            if overs:
+                raise exception.OverQuota(overs=sorted(overs),
+                                          quotas=quotas, usages={})
+
+            reservations = []
+            for resource, delta in deltas.items():
+                reservation = reservation_create(elevated,
+                                                 str(uuid.uuid4()),
+                                                 usages[resource],
+                                                 project_id,
+                                                 resource, delta, expire,
+                                                 session=session)
+                reservations.append(reservation.uuid)
+    except exception.OverQuota:
+        usages = _quota_usages_by_resource(elevated, project_id)
+        usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
+                      for k, v in usages.items())
+        raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
+                                  usages=usages)
+
+    return reservations
+
+
+def _reservation_finish(context, reservation, in_use_delta):
+    """Apply a reservation to its usage and delete it, unless it was
+    already committed, rolled back or expired by somebody else.
+    """
+    values = {'in_use': models.QuotaUsage.in_use + in_use_delta}
+    if reservation.delta >= 0:
+        values['reserved'] = models.QuotaUsage.reserved - reservation.delta
+    session = get_session()
+    try:
+        with session.begin():
+            model_query(context, models.QuotaUsage, session=session,
+                        read_deleted="no").\
+                    filter_by(id=reservation.usage_id).\
+                    update(values, synchronize_session=False)
+            deleted = model_query(context, models.Reservation,
+                                  session=session, read_deleted="no").\
+                              filter_by(id=reservation.id).\
+                              soft_delete(synchronize_session=False)
+            if not deleted:
+                raise exception.ReservationNotFound(uuid=reservation.uuid)
+    except exception.ReservationNotFound:
+        pass
+
+
+def _reservations_get(context, reservations):
+    return model_query(context, models.Reservation, read_deleted="no").\
+                   filter(models.Reservation.uuid.in_(reservations)).\
+                   all()
+
+
+@require_context
+def reservation_commit_optimistic(context, reservations, project_id=None):
+    """Like reservation_commit, but without locking the usages of the
+    project.
+    """
+    for reservation in _reservations_get(context, reservations):
+        _reservation_finish(context, reservation, reservation.delta)
+
+
+@require_context
+def reservation_rollback_optimistic(context, reservations, project_id=None):
+    """Like reservation_rollback, but without locking the usages of the
+    project.
+    """
+    for reservation in _reservations_get(context, reservations):
+        _reservation_finish(context, reservation, 0)
+
+
 @require_admin_context
 def quota_destroy_all_by_project(context, project_id):
     session = get_session()
@@ -2903,19 +3755,17 @@ def quota_destroy_all_by_project(context, project_id):
 
 @require_admin_context
 def reservation_expire(context):
-    session = get_session()
-    with session.begin():
-        current_time = timeutils.utcnow()
-        reservation_query = model_query(context, models.Reservation,
-                                        session=session, read_deleted="no").\
-                            filter(models.Reservation.expire < current_time)
-
-        for reservation in reservation_query.join(models.QuotaUsage).all():
-            if reservation.delta >= 0:
-                reservation.usage.reserved -= reservation.delta
-                reservation.usage.save(session=session)
-
-        reservation_query.soft_delete(synchronize_session=False)
+    current_time = timeutils.utcnow()
+    reservations = model_query(context, models.Reservation,
+                               read_deleted="no").\
+                           filter(models.Reservation.expire < current_time).\
+                           all()
+    # NOTE: Each reservation is released with the same atomic UPDATE as
+    # a rollback, so that expiring does not overwrite the reservations
+    # made concurrently by the optimistic quota driver, and a reservation
+    # committed or rolled back in the meantime is left alone.
+    for reservation in reservations:
+        _reservation_finish(context, reservation, 0)
 
 
 ###################
@@ -3077,6 +3927,22 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get the block device mappings of each of instance_uuids."""
+    output = dict((instance_uuid, []) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return output
+    rows = _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 order_by(asc(models.BlockDeviceMapping.id)).\
+                 all()
+    for row in rows:
+        output[row['instance_uuid']].append(row)
+    return output
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     _block_device_mapping_get_query(context).\
@@ -4225,8 +5091,10 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 
 @require_context
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    return model_query(context, models.BandwidthUsage, read_deleted="yes").\
+@_fallback_to_master
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    return model_query(context, models.BandwidthUsage, read_deleted="yes",
+                       use_slave=use_slave).\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
                    filter_by(start_period=start_period).\
                    all()
@@ -4885,6 +5753,17 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Return a dict of the ec2 ids of the instance uuids which have one."""
+    if not instance_uuids:
+        return {}
+    rows = _ec2_instance_get_query(context).\
+                    filter(models.InstanceIdMapping.uuid.in_(instance_uuids)).\
+                    all()
+    return dict((row['uuid'], row['id']) for row in rows)
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_instance_get_query(context,
@@ -4995,6 +5874,10 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
     """Move up to max_rows rows from one tables to the corresponding
     shadow table.
 
+    The rows are copied with INSERT ... SELECT and deleted in a single
+    transaction, without being read back into Python.  Only the rows
+    which reached the shadow table are deleted.
+
     :returns: number of rows archived
     """
     # The context argument is only used for the decorator.
@@ -5011,41 +5894,62 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
     except NoSuchTableError:
         # No corresponding shadow table; skip it.
         return rows_archived
+    try:
+        column = table.c.id
+    except AttributeError:
+        # We have one table (dns_domains) where the key is called
+        # "domain" rather than "id"
+        column = table.c.domain
+    shadow_key = shadow_table.c[column.name]
+    deleted = table.c.deleted != default_deleted_value
     # Group the insert and delete in a transaction.
-    with conn.begin():
-        # TODO(dripton): It would be more efficient to insert(select) and then
-        # delete(same select) without ever returning the selected rows back to
-        # Python.  sqlalchemy does not support that directly, but we have
-        # nova.db.sqlalchemy.utils.InsertFromSelect for the insert side.  We
-        # need a corresponding function for the delete side.
+    with conn.begin() as transaction:
+        # The batch is at most max_rows deleted rows between the keys of
+        # the first and the max_rows'th deleted row.
+        keys = select([column], deleted).order_by(column).\
+                       limit(max_rows).alias('keys')
+        min_key, max_key = conn.execute(
+                select([func.min(keys.c[column.name]),
+                        func.max(keys.c[column.name])])).first()
+        if max_key is None:
+            return rows_archived
+        # Columns are selected in the order of the shadow table, which may
+        # differ from the order of the production table.
+        columns = [table.c[shadow_column.name]
+                   for shadow_column in shadow_table.c]
+        insert_statement = db_utils.InsertFromSelect(
+                shadow_table,
+                select(columns, and_(deleted, column >= min_key,
+                                     column <= max_key)).
+                        order_by(column).limit(max_rows))
+        # NOTE: Rows deleted after the insert are not in the shadow table,
+        # so they are left for the next batch rather than lost.
+        copied = select([shadow_key]).where(
+                and_(shadow_key >= min_key, shadow_key <= max_key))
         try:
-            column = table.c.id
-            column_name = "id"
-        except AttributeError:
-            # We have one table (dns_domains) where the key is called
-            # "domain" rather than "id"
-            column = table.c.domain
-            column_name = "domain"
-        query = select([table],
-                       table.c.deleted != default_deleted_value).\
-                       order_by(column).limit(max_rows)
-        rows = conn.execute(query).fetchall()
-        if rows:
-            keys = [getattr(row, column_name) for row in rows]
-            delete_statement = table.delete(column.in_(keys))
-            try:
-                result = conn.execute(delete_statement)
-            except IntegrityError:
-                # A foreign key constraint keeps us from deleting some of
-                # these rows until we clean up a dependent table.  Just
-                # skip this table for now; we'll come back to it later.
-                return rows_archived
-            insert_statement = shadow_table.insert()
-            conn.execute(insert_statement, rows)
-            rows_archived = result.rowcount
+            conn.execute(insert_statement)
+            result = conn.execute(table.delete(
+                    and_(deleted, column.in_(copied))))
+        except IntegrityError:
+            # A foreign key constraint keeps us from deleting some of
+            # these rows until we clean up a dependent table.  Just
+            # skip this table for now; we'll come back to it later.
+            transaction.rollback()
+            return rows_archived
+        rows_archived = result.rowcount
     return rows_archived
 
 
+def _archive_tablenames():
+    """Return the names of the tables to archive in dependency order.
+
+    Tables come before the tables they have foreign keys to, so that rows
+    referring to other rows are archived first.
+    """
+    return [table.name
+            for table in reversed(models.BASE.metadata.sorted_tables)]
+
+
 @require_admin_context
 def archive_deleted_rows(context, max_rows=None):
     """Move up to max_rows rows from production tables to the corresponding
@@ -5054,14 +5958,38 @@ def archive_deleted_rows(context, max_rows=None):
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
-    tablenames = []
-    for model_class in models.__dict__.itervalues():
-        if hasattr(model_class, "__tablename__"):
-            tablenames.append(model_class.__tablename__)
     rows_archived = 0
-    for tablename in tablenames:
+    for tablename in _archive_tablenames():
+        if max_rows is None:
+            rows_archived += archive_deleted_rows_for_table(context,
+                                                            tablename, None)
+            continue
         rows_archived += archive_deleted_rows_for_table(context, tablename,
                                          max_rows=max_rows - rows_archived)
         if rows_archived >= max_rows:
             break
     return rows_archived
+
+
+@require_admin_context
+def archive_deleted_rows_in_batches(context, batch_size, time_limit=None,
+                                    throttle=0):
+    """Archive deleted rows batch_size at a time until none are left.
+
+    Each batch is its own set of short transactions, and throttle seconds
+    are slept between batches so that other users of the tables are not
+    held up.  No new batch is started once time_limit seconds have passed.
+
+    :returns: Number of rows archived.
+    """
+    start = time.time()
+    rows_archived = 0
+    while True:
+        batch_archived = archive_deleted_rows(context, max_rows=batch_size)
+        rows_archived += batch_archived
+        if not batch_archived or batch_archived < batch_size:
+            break
+        if time_limit is not None and time.time() - start >= time_limit:
+            break
+        time.sleep(throttle)
+    return rows_archived
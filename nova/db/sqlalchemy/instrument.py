@@ -0,0 +1,276 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Counts the SQL statements issued by DB API calls.
+
+When sql_instrumentation is enabled, every statement executed is
+attributed to the outermost DB API function being called and to the
+request_id of the current context.  The statement count, the number of
+rows and the time spent are aggregated per function and, for the most
+recent requests, per request and function.  Statements slower than
+sql_slow_query_time are logged.
+
+The statistics live in the memory of each process.  The managers of the
+nova services log the busiest functions every
+sql_instrumentation_log_interval seconds; the statistics can also be looked
+at through the eventlet backdoor::
+
+    >>> from nova.db.sqlalchemy import instrument
+    >>> print '\n'.join(instrument.format_stats())
+"""
+
+import collections
+import functools
+import inspect
+import time
+
+from eventlet import corolocal
+from oslo.config import cfg
+import sqlalchemy.engine
+import sqlalchemy.event
+
+from nova.openstack.common import local
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+
+instrument_opts = [
+    cfg.BoolOpt('sql_instrumentation',
+                default=False,
+                help='Count the SQL statements, rows and time of every DB '
+                     'API call and request'),
+    cfg.FloatOpt('sql_slow_query_time',
+                 default=1.0,
+                 help='Number of seconds after which an instrumented SQL '
+                      'statement is logged as slow.  0 disables logging'),
+    cfg.IntOpt('sql_instrumentation_log_interval',
+               default=600,
+               help='Number of seconds between logging the DB API '
+                    'functions which issued the most SQL statements.  0 '
+                    'disables logging'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(instrument_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Number of requests for which statistics are kept
+MAX_REQUESTS = 1000
+
+UNKNOWN_FUNCTION = '<unknown>'
+
+_START_TIMES_KEY = 'nova_instrument_start_times'
+
+_local = corolocal.local()
+_listening = False
+_enabled = False
+_last_logged = None
+
+
+class QueryStats(object):
+    """Statement count, rows and seconds spent of a set of statements."""
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, rows, seconds):
+        self.statements += 1
+        self.rows += rows
+        self.seconds += seconds
+
+    def as_dict(self):
+        return dict(statements=self.statements, rows=self.rows,
+                    seconds=self.seconds)
+
+
+_function_stats = collections.defaultdict(QueryStats)
+_request_stats = {}
+# The ids of the requests in _request_stats, oldest first
+_request_ids = collections.deque()
+
+
+def _current_function():
+    return getattr(_local, 'function', None) or UNKNOWN_FUNCTION
+
+
+def _current_request_id():
+    context = getattr(local.store, 'context', None)
+    return getattr(context, 'request_id', None)
+
+
+def _record(statement, rows, seconds):
+    function = _current_function()
+    request_id = _current_request_id()
+    _function_stats[function].add(rows, seconds)
+    if request_id is not None:
+        stats = _request_stats.get(request_id)
+        if stats is None:
+            if len(_request_ids) >= MAX_REQUESTS:
+                del _request_stats[_request_ids.popleft()]
+            stats = _request_stats[request_id] = collections.defaultdict(
+                    QueryStats)
+            _request_ids.append(request_id)
+        stats[function].add(rows, seconds)
+    if CONF.sql_slow_query_time > 0 and seconds >= CONF.sql_slow_query_time:
+        LOG.warn(_('Slow SQL statement in %(function)s for request '
+                   '%(request_id)s took %(seconds).3f seconds: '
+                   '%(statement)s') % locals())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _enabled:
+        conn.info.setdefault(_START_TIMES_KEY, []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start_times = conn.info.get(_START_TIMES_KEY)
+    if not _enabled or not start_times:
+        return
+    seconds = time.time() - start_times.pop()
+    _record(statement, max(cursor.rowcount, 0), seconds)
+
+
+def enable():
+    """Start recording the statements of all engines."""
+    global _listening, _enabled
+    if not _listening:
+        # NOTE: Listeners cannot be removed again, so disable() only
+        # stops them from recording.
+        sqlalchemy.event.listen(sqlalchemy.engine.Engine,
+                                'before_cursor_execute',
+                                _before_cursor_execute)
+        sqlalchemy.event.listen(sqlalchemy.engine.Engine,
+                                'after_cursor_execute',
+                                _after_cursor_execute)
+        _listening = True
+    _enabled = True
+
+
+def disable():
+    """Stop recording statements."""
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """Forget all statistics recorded so far."""
+    _function_stats.clear()
+    _request_stats.clear()
+    _request_ids.clear()
+
+
+def get_stats():
+    """Return a dict of the statistics of each DB API function."""
+    return dict((function, stats.as_dict())
+                for function, stats in _function_stats.items())
+
+
+def get_request_stats(request_id):
+    """Return a dict of the statistics of each DB API function called by a
+    recent request, or None if the request is not known.
+    """
+    stats = _request_stats.get(request_id)
+    if stats is None:
+        return None
+    return dict((function, function_stats.as_dict())
+                for function, function_stats in stats.items())
+
+
+def get_request_ids():
+    """Return the ids of the recent requests, oldest first."""
+    return list(_request_ids)
+
+
+def format_stats(sort_key='statements', limit=20):
+    """Return the lines of a table of the functions with the most
+    statements, rows or seconds, headed by the column names.
+    """
+    stats = sorted(get_stats().items(), key=lambda item: item[1][sort_key],
+                   reverse=True)
+    lines = ['%-50s %10s %10s %10s' % ('function', 'statements', 'rows',
+                                       'seconds')]
+    for function, function_stats in stats[:limit]:
+        lines.append('%-50s %10d %10d %10.3f' % (function,
+                                                 function_stats['statements'],
+                                                 function_stats['rows'],
+                                                 function_stats['seconds']))
+    return lines
+
+
+def log_stats():
+    """Log the table of :func:`format_stats`, at most once every
+    sql_instrumentation_log_interval seconds.
+    """
+    global _last_logged
+    interval = CONF.sql_instrumentation_log_interval
+    if not _enabled or interval <= 0 or not _function_stats:
+        return
+    if (_last_logged is not None and
+            not timeutils.is_older_than(_last_logged, interval)):
+        return
+    _last_logged = timeutils.utcnow()
+    LOG.info(_('SQL statements of the DB API functions in this process:'
+               '\n%s'), '\n'.join(format_stats()))
+
+
+def _iter_in_function(name, iterator):
+    _local.function = name
+    try:
+        for item in iterator:
+            # NOTE: Other DB API calls may be made between items.
+            _local.function = None
+            yield item
+            _local.function = name
+    finally:
+        _local.function = None
+
+
+class InstrumentedBackend(object):
+    """Wraps a DB API backend so that statements are attributed to the
+    DB API function which issued them.
+
+    Only the outermost call is recorded, so DB API functions calling each
+    other are counted once.
+    """
+
+    def __init__(self, backend):
+        enable()
+        self._backend = backend
+
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if not inspect.isfunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'function', None) is not None:
+                return attr(*args, **kwargs)
+            _local.function = key
+            try:
+                result = attr(*args, **kwargs)
+            finally:
+                _local.function = None
+            if inspect.isgenerator(result):
+                return _iter_in_function(key, result)
+            return result
+
+        return wrapper
@@ -0,0 +1,48 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+TABLE_NAME = 'instances'
+INDEXES = {
+    'instances_deleted_created_at_id_idx': ['deleted', 'created_at', 'id'],
+    'instances_project_id_deleted_created_at_id_idx': ['project_id',
+                                                       'deleted',
+                                                       'created_at',
+                                                       'id'],
+}
+
+
+def _get_indexes(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    instances = Table(TABLE_NAME, meta, autoload=True)
+    return [Index(name, *[getattr(instances.c, column) for column in columns])
+            for name, columns in INDEXES.iteritems()]
+
+
+def upgrade(migrate_engine):
+    """Add indexes matching the sort order used to page through instances,
+    so that listing servers doesn't need to sort the whole table.
+    """
+    for index in _get_indexes(migrate_engine):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    for index in _get_indexes(migrate_engine):
+        index.drop(migrate_engine)
@@ -0,0 +1,39 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+TABLE_NAME = 'instances'
+IDX_NAME = 'instances_display_name_idx'
+
+
+def upgrade(migrate_engine):
+    """Add an index so that exact and prefix searches of servers by name
+    don't need to scan the instances table.
+    """
+    meta = MetaData(bind=migrate_engine)
+    instances = Table(TABLE_NAME, meta, autoload=True)
+    idx = Index(IDX_NAME, instances.c.display_name)
+    idx.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    instances = Table(TABLE_NAME, meta, autoload=True)
+    idx = Index(IDX_NAME, instances.c.display_name)
+    idx.drop(migrate_engine)
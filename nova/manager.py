@@ -57,6 +57,7 @@ from oslo.config import cfg
 
 from nova import baserpc
 from nova.db import base
+from nova.db.sqlalchemy import instrument
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
 from nova.openstack.common.plugin import pluginmanager
@@ -99,6 +100,10 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         """Tasks to be run at a periodic interval."""
         return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
 
+    @periodic_task.periodic_task
+    def _log_sql_stats(self, context):
+        instrument.log_stats()
+
     def init_host(self):
         """Hook to do additional manager initialization when one requests
         the service be started.  This is called before any service record
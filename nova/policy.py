@@ -18,11 +18,13 @@
 """Policy Engine For Nova."""
 
 import os.path
+import re
 
 from oslo.config import cfg
 
 from nova import exception
 from nova.openstack.common import policy
+from nova.openstack.common import timeutils
 from nova import utils
 
 
@@ -33,6 +35,15 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.BoolOpt('policy_compile',
+                default=False,
+                help=_('Compile the policy rules into functions when they '
+                       'are loaded, and remember the result of each check '
+                       'for the rest of the request')),
+    cfg.IntOpt('policy_reload_interval',
+               default=0,
+               help=_('Number of seconds between checks of the policy file '
+                      'for changes.  0 checks on every policy check')),
     ]
 
 CONF = cfg.CONF
@@ -40,25 +51,49 @@ CONF.register_opts(policy_opts)
 
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+_LAST_RELOAD_CHECK = None
+
+# The compiled rules and the rules they were compiled from
+_COMPILED = None
+_COMPILED_FROM = None
+
+# Number of check results remembered per context
+_MAX_MEMOIZED = 100
+
+_SUBSTITUTION_RE = re.compile(r'%\((\w+)\)')
+
+_MISSING = object()
 
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _LAST_RELOAD_CHECK
+    global _COMPILED
+    global _COMPILED_FROM
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _LAST_RELOAD_CHECK = None
+    _COMPILED = None
+    _COMPILED_FROM = None
     policy.reset()
 
 
 def init():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _LAST_RELOAD_CHECK
     if not _POLICY_PATH:
         _POLICY_PATH = CONF.policy_file
         if not os.path.exists(_POLICY_PATH):
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
+    if (_POLICY_CACHE and _LAST_RELOAD_CHECK is not None and
+            not timeutils.is_older_than(_LAST_RELOAD_CHECK,
+                                        CONF.policy_reload_interval)):
+        return
+    _LAST_RELOAD_CHECK = timeutils.utcnow()
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
 
@@ -94,6 +129,16 @@ def enforce(context, action, target, do_raise=True):
 
     credentials = context.to_dict()
 
+    if CONF.policy_compile:
+        result = _check_compiled(context, action, target, credentials)
+        if not result:
+            # NOTE: Checks which are not compiled, such as http: checks,
+            # may deny with any false value.
+            if do_raise:
+                raise exception.PolicyNotAuthorized(action=action)
+            return False
+        return result
+
     # Add the exception arguments if asked to do a raise
     extra = {}
     if do_raise:
@@ -112,9 +157,184 @@ def check_is_admin(context):
     credentials = context.to_dict()
     target = credentials
 
+    if CONF.policy_compile:
+        return _check_compiled(context, 'context_is_admin', target,
+                               credentials)
+
     return policy.check('context_is_admin', target, credentials)
 
 
+def _union(*key_sets):
+    """Union of the keys used by checks, None meaning unknown keys."""
+    if None in key_sets:
+        return None
+    return frozenset().union(*key_sets)
+
+
+def _compile_check(check, rules, compiled):
+    """Turn a check tree into a function of (target, creds).
+
+    Returns the function along with the target keys and the credential
+    keys it reads, or None instead of the keys if they are not known.
+    """
+    kind = type(check)
+    if kind is policy.TrueCheck:
+        return lambda target, creds: True, frozenset(), frozenset()
+
+    if kind is policy.FalseCheck:
+        return lambda target, creds: False, frozenset(), frozenset()
+
+    if kind is policy.NotCheck:
+        func, target_keys, creds_keys = _compile_check(check.rule, rules,
+                                                       compiled)
+        return (lambda target, creds: not func(target, creds),
+                target_keys, creds_keys)
+
+    if kind in (policy.AndCheck, policy.OrCheck):
+        parts = [_compile_check(rule, rules, compiled)
+                 for rule in check.rules]
+        funcs = [part[0] for part in parts]
+        target_keys = _union(*[part[1] for part in parts])
+        creds_keys = _union(*[part[2] for part in parts])
+        if kind is policy.AndCheck:
+            def and_check(target, creds):
+                for func in funcs:
+                    if not func(target, creds):
+                        return False
+                return True
+            return and_check, target_keys, creds_keys
+
+        def or_check(target, creds):
+            for func in funcs:
+                if func(target, creds):
+                    return True
+            return False
+        return or_check, target_keys, creds_keys
+
+    if kind is policy.RuleCheck:
+        func, target_keys, creds_keys = _compile_rule(check.match, rules,
+                                                      compiled)
+
+        def rule_check(target, creds):
+            try:
+                return func(target, creds)
+            except KeyError:
+                # We don't have any matching rule; fail closed
+                return False
+        return rule_check, target_keys, creds_keys
+
+    if kind is policy.RoleCheck:
+        role = check.match.lower()
+        return (lambda target, creds: role in [x.lower()
+                                               for x in creds['roles']],
+                frozenset(), frozenset(['roles']))
+
+    if kind is IsAdminCheck:
+        expected = check.expected
+        return (lambda target, creds: creds['is_admin'] == expected,
+                frozenset(), frozenset(['is_admin']))
+
+    if kind is policy.GenericCheck:
+        cred_kind = check.kind
+        match = check.match
+        target_keys = frozenset(_SUBSTITUTION_RE.findall(match))
+        if '%' in match:
+            if not target_keys:
+                # NOTE: Positional substitutions use the whole target.
+                target_keys = None
+
+            def generic_check(target, creds):
+                value = match % target
+                if cred_kind in creds:
+                    return value == unicode(creds[cred_kind])
+                return False
+        else:
+            def generic_check(target, creds):
+                if cred_kind in creds:
+                    return match == unicode(creds[cred_kind])
+                return False
+        return generic_check, target_keys, frozenset([cred_kind])
+
+    # NOTE: Other checks, such as http: checks, are called as they are
+    # and their results are not remembered.
+    return check, None, None
+
+
+def _compile_rule(name, rules, compiled):
+    if name in compiled:
+        if compiled[name] is None:
+            # NOTE: The rule refers to itself, so it can only be looked
+            # up once it is compiled.
+            return (lambda target, creds: compiled[name][0](target, creds),
+                    None, None)
+        return compiled[name]
+
+    try:
+        check = rules[name]
+    except KeyError:
+        # If the rule doesn't exist, fail closed
+        result = (lambda target, creds: False, frozenset(), frozenset())
+    else:
+        compiled[name] = None
+        result = _compile_check(check, rules, compiled)
+    compiled[name] = result
+    return result
+
+
+def _get_compiled(action):
+    """Return the compiled rule of an action, compiling the rules again
+    whenever they have been replaced.
+    """
+    global _COMPILED
+    global _COMPILED_FROM
+    rules = policy._rules
+    if _COMPILED is None or _COMPILED_FROM is not rules:
+        _COMPILED = {}
+        _COMPILED_FROM = rules
+    if not rules:
+        # No rules to reference means we're going to fail closed
+        return lambda target, creds: False, frozenset(), frozenset()
+    return _compile_rule(action, rules, _COMPILED)
+
+
+def _check_compiled(context, action, target, credentials):
+    func, target_keys, creds_keys = _get_compiled(action)
+    if target_keys is None or creds_keys is None:
+        key = None
+    else:
+        key = (action,
+               tuple((k, target.get(k, _MISSING)) for k in target_keys),
+               tuple((k, _freeze(credentials.get(k))) for k in creds_keys))
+        # NOTE: Remembered results are only valid for the rules they
+        # were computed with.
+        compiled, results = getattr(context, '_policy_results', (None, {}))
+        if compiled is not _COMPILED or len(results) >= _MAX_MEMOIZED:
+            results = {}
+            context._policy_results = (_COMPILED, results)
+        try:
+            if key in results:
+                return results[key]
+        except TypeError:
+            # Unhashable target values cannot be remembered
+            key = None
+
+    try:
+        result = func(target, credentials)
+    except KeyError:
+        # If the rule doesn't exist, fail closed
+        result = False
+
+    if key is not None:
+        results[key] = result
+    return result
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
 @policy.register('is_admin')
 class IsAdminCheck(policy.Check):
     """An explicit check for is_admin."""
@@ -349,6 +349,11 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
+        return self._reserve(context, resources, quotas, deltas, expire,
+                             project_id)
+
+    def _reserve(self, context, resources, quotas, deltas, expire,
+                 project_id):
         return db.quota_reserve(context, resources, quotas, deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
                                 project_id=project_id)
@@ -437,6 +442,58 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class OptimisticDbQuotaDriver(DbQuotaDriver):
+    """
+    Driver which stores quotas in the local database like DbQuotaDriver,
+    but reserves without locking all of the usages of a project.
+
+    Each resource is reserved with a single conditional update of its
+    usage, and usage refreshes run outside of any lock, so parallel
+    reservations for the same project do not serialize on each other.
+    """
+
+    def _reserve(self, context, resources, quotas, deltas, expire,
+                 project_id):
+        return db.quota_reserve_optimistic(context, resources, quotas,
+                                           deltas, expire,
+                                           CONF.until_refresh, CONF.max_age,
+                                           project_id=project_id)
+
+    def commit(self, context, reservations, project_id=None):
+        """Commit reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        """
+        # If project_id is None, then we use the project_id in context
+        if project_id is None:
+            project_id = context.project_id
+
+        db.reservation_commit_optimistic(context, reservations,
+                                         project_id=project_id)
+
+    def rollback(self, context, reservations, project_id=None):
+        """Roll back reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        """
+        # If project_id is None, then we use the project_id in context
+        if project_id is None:
+            project_id = context.project_id
+
+        db.reservation_rollback_optimistic(context, reservations,
+                                           project_id=project_id)
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -395,7 +395,7 @@ class HostManager(object):
         """
 
         # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
+        compute_nodes = db.compute_node_get_all(context, use_slave=True)
         seen_nodes = set()
         for compute in compute_nodes:
             service = compute['service']
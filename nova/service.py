@@ -33,6 +33,7 @@ from oslo.config import cfg
 
 from nova import conductor
 from nova import context
+from nova import db
 from nova import exception
 from nova.openstack.common import eventlet_backdoor
 from nova.openstack.common import importutils
@@ -331,6 +332,12 @@ class ProcessLauncher(object):
     def launch_server(self, server, workers=1):
         wrap = ServerWrapper(server, workers)
 
+        # Give the server a chance to do one-time setup in the parent
+        # before any workers are forked off.
+        pre_fork = getattr(server, 'pre_fork', None)
+        if pre_fork:
+            pre_fork()
+
         LOG.info(_('Starting %d workers'), wrap.workers)
         while self.running and len(wrap.children) < wrap.workers:
             self._start_child(wrap)
@@ -419,6 +426,8 @@ class Service(object):
         self.saved_args, self.saved_kwargs = args, kwargs
         self.timers = []
         self.backdoor_port = None
+        self.db_allowed = db_allowed
+        self.service_ref = None
         self.conductor_api = conductor.API(use_local=db_allowed)
         self.conductor_api.wait_until_ready(context.get_admin_context())
 
@@ -429,13 +438,8 @@ class Service(object):
         self.basic_config_check()
         self.manager.init_host()
         self.model_disconnected = False
-        ctxt = context.get_admin_context()
-        try:
-            self.service_ref = self.conductor_api.service_get_by_args(ctxt,
-                    self.host, self.binary)
-            self.service_id = self.service_ref['id']
-        except exception.NotFound:
-            self.service_ref = self._create_service_ref(ctxt)
+        if not self.service_ref:
+            self._init_service_ref(context.get_admin_context())
 
         if self.backdoor_port is not None:
             self.manager.backdoor_port = self.backdoor_port
@@ -479,6 +483,25 @@ class Service(object):
                            periodic_interval_max=self.periodic_interval_max)
             self.timers.append(periodic)
 
+    def pre_fork(self):
+        """Prepare the service to be run by multiple worker processes.
+
+        The service record is looked up or created once here so the workers
+        don't race to create it.  Database connections opened by the parent
+        are then closed so that each worker gets its own connection pool.
+        """
+        self._init_service_ref(context.get_admin_context())
+        if self.db_allowed:
+            db.dispose_engine()
+
+    def _init_service_ref(self, context):
+        try:
+            self.service_ref = self.conductor_api.service_get_by_args(context,
+                    self.host, self.binary)
+            self.service_id = self.service_ref['id']
+        except exception.NotFound:
+            self.service_ref = self._create_service_ref(context)
+
     def _create_service_ref(self, context):
         svc_values = {
             'host': self.host,
@@ -559,6 +582,11 @@ class Service(object):
                 pass
         self.timers = []
 
+        try:
+            self.conductor_api.flush_updates()
+        except Exception:
+            LOG.exception(_('Failed to write pending instance updates'))
+
     def wait(self):
         for x in self.timers:
             try:
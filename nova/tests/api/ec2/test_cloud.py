@@ -1155,6 +1155,40 @@ class CloudTestCase(test.TestCase):
         db.instance_destroy(self.context, inst1['uuid'])
         db.service_destroy(self.context, comp1['id'])
 
+    def test_describe_instances_batched_lookups(self):
+        # Per instance lookups are replaced by one lookup for all instances.
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        sys_meta = flavors.save_instance_type_info(
+            {}, flavors.get_instance_type(1))
+        instances = [db.instance_create(self.context,
+                                        {'reservation_id': 'a',
+                                         'image_ref': image_uuid,
+                                         'instance_type_id': 1,
+                                         'host': 'host1',
+                                         'vm_state': 'active',
+                                         'metadata': {'tag': str(i)},
+                                         'system_metadata': sys_meta})
+                     for i in xrange(3)]
+
+        def fail(*args, **kwargs):
+            self.fail('per instance lookup')
+
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance', fail)
+        self.stubs.Set(db, 'get_ec2_instance_id_by_uuid', fail)
+        self.stubs.Set(self.cloud.compute_api, 'get_instance_metadata', fail)
+
+        result = self.cloud.describe_instances(self.context)
+        result = result['reservationSet'][0]['instancesSet']
+        self.assertEqual(3, len(result))
+        self.stubs.UnsetAll()
+        for instance in instances:
+            ec2_id = ec2utils.id_to_ec2_inst_id(instance['uuid'])
+            formatted = [i for i in result if i['instanceId'] == ec2_id]
+            self.assertEqual(1, len(formatted))
+            self.assertEqual('ami-00000001', formatted[0]['imageId'])
+            self.assertEqual(instance['metadata'][0]['value'],
+                             formatted[0]['tagSet'][0]['value'])
+
     def test_describe_instances_deleted(self):
         image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
         sys_meta = flavors.save_instance_type_info(
@@ -2627,6 +2661,15 @@ class CloudTestCase(test.TestCase):
                           filter=[{'name': 'resource_type',
                                    'value': ['instance', 'volume']}])
 
+    def test_ids_to_ec2_inst_ids(self):
+        inst = db.instance_create(self.context, {})
+        unmapped_uuid = 'aebef54a-ed67-4d10-912f-14455edce176'
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids([inst['uuid'], unmapped_uuid])
+        self.assertEqual(ec2utils.id_to_ec2_inst_id(inst['uuid']),
+                         ec2_ids[inst['uuid']])
+        self.assertEqual(ec2utils.id_to_ec2_inst_id(unmapped_uuid),
+                         ec2_ids[unmapped_uuid])
+
     def test_resource_type_from_id(self):
         self.assertEqual(
                 ec2utils.resource_type_from_id(self.context, 'i-12345'),
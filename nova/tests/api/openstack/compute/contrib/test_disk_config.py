@@ -125,6 +125,13 @@ class DiskConfigTestCase(test.TestCase):
 
         self.stubs.Set(nova.db, 'instance_create', fake_instance_create)
 
+        def fake_instance_create_bulk(context, values_list):
+            return [fake_instance_create(context, values)
+                    for values in values_list]
+
+        self.stubs.Set(nova.db, 'instance_create_bulk',
+                       fake_instance_create_bulk)
+
         self.app = compute.APIRouter(init_only=('servers', 'images'))
 
     def tearDown(self):
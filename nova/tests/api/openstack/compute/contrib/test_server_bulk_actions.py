@@ -0,0 +1,135 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from lxml import etree
+import webob
+
+from nova.api.openstack.compute.contrib import server_bulk_actions
+from nova.compute import api as compute_api
+from nova import exception
+from nova.openstack.common import jsonutils
+from nova import test
+from nova.tests.api.openstack import fakes
+
+UUID1 = '00000000-0000-0000-0000-000000000001'
+UUID2 = '00000000-0000-0000-0000-000000000002'
+UUID3 = '00000000-0000-0000-0000-000000000003'
+
+
+class ServerBulkActionsTest(test.TestCase):
+
+    def setUp(self):
+        super(ServerBulkActionsTest, self).setUp()
+        self.controller = server_bulk_actions.ServerBulkActionsController()
+        self.calls = []
+
+        def fake_bulk_action(api, context, instance_uuids, action, *args):
+            self.calls.append((instance_uuids, action, args))
+            return {UUID1: None,
+                    UUID2: exception.InstanceInvalidState(
+                        attr='vm_state', instance_uuid=UUID2,
+                        state='stopped', method=action),
+                    UUID3: exception.InstanceNotFound(instance_id=UUID3)}
+
+        self.stubs.Set(compute_api.API, 'bulk_action', fake_bulk_action)
+
+    def _bulk_action(self, **bulk_action):
+        req = fakes.HTTPRequest.blank('/v2/fake/os-server-bulk-actions')
+        return self.controller.create(req, {'bulk_action': bulk_action})
+
+    def test_stop(self):
+        res_dict = self._bulk_action(action='stop',
+                                     servers=[UUID1, UUID2, UUID3])
+        self.assertEqual([([UUID1, UUID2, UUID3], 'stop', ())], self.calls)
+        servers = res_dict['servers']
+        self.assertEqual([UUID1, UUID2, UUID3],
+                         [server['id'] for server in servers])
+        self.assertEqual([202, 409, 404],
+                         [server['status'] for server in servers])
+        self.assertFalse('message' in servers[0])
+        self.assertTrue(UUID3 in servers[2]['message'])
+
+    def test_reboot(self):
+        self._bulk_action(action='reboot', servers=[UUID1], type='hard')
+        self.assertEqual([([UUID1], 'reboot', ('HARD',))], self.calls)
+
+    def test_reboot_bad_type(self):
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='reboot', servers=[UUID1], type='cold')
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='reboot', servers=[UUID1])
+
+    def test_bad_action(self):
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='rebuild', servers=[UUID1])
+
+    def test_bad_servers(self):
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='stop', servers=UUID1)
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='stop', servers=[UUID1, 'test_inst'])
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='stop')
+
+    def test_too_many_servers(self):
+        self.flags(osapi_max_limit=2)
+        self.assertRaises(webob.exc.HTTPBadRequest, self._bulk_action,
+                          action='stop', servers=[UUID1, UUID2, UUID3])
+        self.assertEqual([], self.calls)
+
+    def test_bulk_action_json(self):
+        self.flags(
+            osapi_compute_extension=[
+                'nova.api.openstack.compute.contrib.select_extensions'],
+            osapi_compute_ext_list=['Server_bulk_actions'])
+        req = webob.Request.blank('/v2/fake/os-server-bulk-actions')
+        req.method = 'POST'
+        req.content_type = 'application/json'
+        req.body = jsonutils.dumps({'bulk_action': {
+                'action': 'delete', 'servers': [UUID1, UUID2, UUID3]}})
+        res = req.get_response(fakes.wsgi_app(
+                init_only=('os-server-bulk-actions',)))
+        self.assertEqual(200, res.status_int)
+        servers = jsonutils.loads(res.body)['servers']
+        self.assertEqual([202, 409, 404],
+                         [server['status'] for server in servers])
+
+
+class ServerBulkActionsXMLTest(test.TestCase):
+
+    def test_deserializer(self):
+        deserializer = server_bulk_actions.ServerBulkActionXMLDeserializer()
+        body = ('<bulk_action action="reboot" type="SOFT">'
+                '<server id="%s"/><server id="%s"/></bulk_action>' %
+                (UUID1, UUID2))
+        expected = {'bulk_action': {'action': 'reboot', 'type': 'SOFT',
+                                    'servers': [UUID1, UUID2]}}
+        self.assertEqual(expected, deserializer.deserialize(body)['body'])
+
+    def test_serializer(self):
+        serializer = server_bulk_actions.ServerBulkActionsTemplate()
+        servers = [{'id': UUID1, 'status': 202},
+                   {'id': UUID2, 'status': 404, 'message': 'not found'}]
+        text = serializer.serialize({'servers': servers})
+        tree = etree.fromstring(text)
+
+        self.assertEqual('servers', tree.tag)
+        self.assertEqual(2, len(tree))
+        self.assertEqual(UUID1, tree[0].get('id'))
+        self.assertEqual('202', tree[0].get('status'))
+        self.assertEqual(None, tree[0].get('message'))
+        self.assertEqual('not found', tree[1].get('message'))
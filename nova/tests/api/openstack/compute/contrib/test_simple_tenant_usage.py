@@ -73,8 +73,7 @@ def get_fake_db_instance(start, end, instance_id, tenant_id):
             'system_metadata': sys_meta}
 
 
-def fake_instance_get_active_by_window_joined(self, context, begin, end,
-        project_id):
+def fake_get_usage_by_window(self, context, begin, end, project_id):
             return [get_fake_db_instance(START,
                                          STOP,
                                          x,
@@ -85,8 +84,8 @@ def fake_instance_get_active_by_window_joined(self, context, begin, end,
 class SimpleTenantUsageTest(test.TestCase):
     def setUp(self):
         super(SimpleTenantUsageTest, self).setUp()
-        self.stubs.Set(api.API, "get_active_by_window",
-                       fake_instance_get_active_by_window_joined)
+        self.stubs.Set(api.API, "get_usage_by_window",
+                       fake_get_usage_by_window)
         self.admin_context = context.RequestContext('fakeadmin_0',
                                                     'faketenant_0',
                                                     is_admin=True)
@@ -468,3 +467,51 @@ class SimpleTenantUsageControllerTest(test.TestCase):
         flavor = self.controller._get_flavor(self.context, self.compute_api,
                                              inst_without_sys_meta, {})
         self.assertEqual(flavor, None)
+
+    def _get_usages_counted(self, period_stop):
+        calls = []
+
+        def fake_get_usage_by_window(compute_api, context, begin, end,
+                                     project_id):
+            calls.append(project_id)
+            return [dict(self.baseinst, uuid='fake-uuid',
+                         project_id='faketenant', terminated_at=None,
+                         vm_state='active')]
+
+        self.stubs.Set(api.API, 'get_usage_by_window',
+                       fake_get_usage_by_window)
+        period_start = period_stop - datetime.timedelta(days=1)
+        for i in xrange(2):
+            usages = self.controller._tenant_usages_for_period(
+                self.context, period_start, period_stop, 'faketenant')
+            self.assertEqual('faketenant', usages[0]['tenant_id'])
+            self.assertEqual(1, len(usages[0]['server_usages']))
+        return usages, calls
+
+    def test_usage_of_past_period_cached(self):
+        self.flags(simple_tenant_usage_cache_time=60)
+        period_stop = timeutils.utcnow() - datetime.timedelta(hours=1)
+        usages, calls = self._get_usages_counted(period_stop)
+        self.assertEqual(['faketenant'], calls)
+
+    def test_usage_of_recent_period_not_cached(self):
+        self.flags(simple_tenant_usage_cache_time=60)
+        usages, calls = self._get_usages_counted(timeutils.utcnow())
+        self.assertEqual(['faketenant', 'faketenant'], calls)
+
+    def test_usage_not_cached_by_default(self):
+        period_stop = timeutils.utcnow() - datetime.timedelta(hours=1)
+        usages, calls = self._get_usages_counted(period_stop)
+        self.assertEqual(['faketenant', 'faketenant'], calls)
+
+    def test_uptime_of_cached_usage_updated(self):
+        self.flags(simple_tenant_usage_cache_time=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        period_stop = timeutils.utcnow() - datetime.timedelta(hours=1)
+        usages, calls = self._get_usages_counted(period_stop)
+        uptime = usages[0]['server_usages'][0]['uptime']
+        timeutils.advance_time_seconds(30)
+        usages, calls = self._get_usages_counted(period_stop)
+        self.assertEqual([], calls)
+        self.assertEqual(uptime + 30, usages[0]['server_usages'][0]['uptime'])
@@ -16,12 +16,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
 import iso8601
 from lxml import etree
 from oslo.config import cfg
 import webob
 
 from nova.api.openstack import compute
+from nova.api.openstack.compute import contrib
 from nova.api.openstack.compute import extensions as compute_extensions
 from nova.api.openstack import extensions as base_extensions
 from nova.api.openstack import wsgi
@@ -198,6 +201,7 @@ class ExtensionControllerTest(ExtensionTestCase):
             "SchedulerHints",
             "SecurityGroupDefaultRules",
             "SecurityGroups",
+            "ServerBulkActions",
             "ServerDiagnostics",
             "ServerPassword",
             "ServerStartStop",
@@ -707,3 +711,112 @@ class ExtensionControllerIdFormatTest(test.TestCase):
     def test_id_with_bad_format(self):
         result = self._bounce_id('foo.bad')
         self.assertEqual(result, 'foo.bad')
+
+
+class LazyExtensionTest(test.TestCase):
+
+    def setUp(self):
+        super(LazyExtensionTest, self).setUp()
+        self.flags(osapi_compute_lazy_extensions=True)
+        self.imported = []
+        orig_import = base_extensions.ExtensionManager.import_lazy_extension
+
+        def fake_import_lazy_extension(ext_mgr, lazy_ext):
+            self.imported.append(lazy_ext.alias)
+            return orig_import(ext_mgr, lazy_ext)
+
+        self.stubs.Set(base_extensions.ExtensionManager,
+                       'import_lazy_extension', fake_import_lazy_extension)
+
+    def _contrib_file(self, name):
+        return os.path.join(os.path.dirname(contrib.__file__), name)
+
+    def test_describe_extension(self):
+        info = base_extensions.describe_extension(
+                self._contrib_file('volumes.py'), 'Volumes')
+        self.assertEqual('os-volumes', info['alias'])
+        self.assertEqual('Volumes', info['name'])
+        self.assertEqual('Volumes support.', info['description'])
+        self.assertEqual(set(['os-volumes', 'os-volume_attachments',
+                              'os-volumes_boot', 'os-snapshots']),
+                         info['resource_collections'])
+        self.assertEqual(set(['servers']), info['inherited_collections'])
+
+        info = base_extensions.describe_extension(
+                self._contrib_file('disk_config.py'), 'Disk_config')
+        self.assertEqual('OS-DCF', info['alias'])
+        self.assertEqual(set(['servers', 'images']),
+                         info['controller_collections'])
+
+    def test_describe_extension_not_literal(self):
+        # Foxinsocks names the collections it extends with a variable
+        filename = os.path.join(os.path.dirname(__file__), 'extensions',
+                                'foxinsocks.py')
+        self.assertEqual(None, base_extensions.describe_extension(
+                filename, 'Foxinsocks'))
+
+    def test_extensions_listed_without_import(self):
+        request = webob.Request.blank('/fake/extensions')
+        app = compute.APIRouter(init_only=('extensions',))
+        lazy = jsonutils.loads(request.get_response(app).body)
+        self.assertEqual([], self.imported)
+
+        self.flags(osapi_compute_lazy_extensions=False)
+        app = compute.APIRouter(init_only=('extensions',))
+        eager = jsonutils.loads(request.get_response(app).body)
+        self.assertEqual(eager, lazy)
+
+    def test_imported_on_first_request(self):
+        app = fakes.wsgi_app()
+        self.assertEqual([], self.imported)
+
+        for i in xrange(2):
+            request = webob.Request.blank('/v2/fake/os-availability-zone')
+            response = request.get_response(app)
+            self.assertEqual(200, response.status_int)
+            self.assertEqual(['os-availability-zone'], self.imported)
+
+        request = webob.Request.blank('/v2/fake/flavors/detail')
+        response = request.get_response(app)
+        self.assertEqual(200, response.status_int)
+        flavor = jsonutils.loads(response.body)['flavors'][0]
+        self.assertTrue('OS-FLV-EXT-DATA:ephemeral' in flavor)
+        self.assertTrue('OS-FLV-EXT-DATA' in self.imported)
+        self.assertFalse('os-hosts' in self.imported)
+
+        request = webob.Request.blank('/v2/fake/os-no-such-thing')
+        self.assertEqual(404, request.get_response(app).status_int)
+
+    def test_dependencies_imported(self):
+        router = compute.APIRouter()
+        aliases = [ext.alias for ext in
+                   router._lazy_extensions_for('/fake/os-volumes_boot')]
+        self.assertTrue('os-volumes' in aliases)
+        self.assertTrue('OS-EXT-STS' in aliases)
+        self.assertFalse('os-hosts' in aliases)
+
+        aliases = [ext.alias for ext in
+                   router._lazy_extensions_for('/fake/os-networks/1.json')]
+        self.assertEqual(set(['os-networks', 'os-networks-associate']),
+                         set(aliases))
+
+    def test_lock_only_taken_for_lazy_collections(self):
+        router = compute.APIRouter()
+        locked = []
+
+        class FakeLock(object):
+            def __enter__(self):
+                locked.append(True)
+
+            def __exit__(self, *exc_info):
+                pass
+
+        router._lazy_lock = FakeLock()
+        fakes.HTTPRequest.blank('/fake/os-no-such-thing').get_response(
+            router)
+        self.assertEqual([], locked)
+        for i in xrange(2):
+            fakes.HTTPRequest.blank('/fake/os-availability-zone').get_response(
+                router)
+        self.assertEqual([True], locked)
+        self.assertEqual(['os-availability-zone'], self.imported)
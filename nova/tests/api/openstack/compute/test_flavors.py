@@ -297,6 +297,28 @@ class FlavorsTest(test.TestCase):
         self.assertThat({'limit': ['2'], 'marker': ['2']},
                         matchers.DictMatches(params))
 
+    def test_get_flavor_list_not_modified(self):
+        self.flags(osapi_list_etags=True)
+        req = fakes.HTTPRequest.blank('/v2/fake/flavors/detail')
+        etag = self.controller.detail(req)['ETag']
+        req = fakes.HTTPRequest.blank('/v2/fake/flavors/detail')
+        req.headers['If-None-Match'] = etag
+        response = self.controller.detail(req)
+        self.assertEqual(304, response.status_int)
+
+        def fake_get_all_types(inactive=False, filters=None):
+            flavors = fake_instance_type_get_all(inactive, filters)
+            flavors['flavor 1'] = dict(flavors['flavor 1'], memory_mb='512')
+            return flavors
+
+        self.stubs.Set(nova.compute.flavors, "get_all_types",
+                       fake_get_all_types)
+        req = fakes.HTTPRequest.blank('/v2/fake/flavors/detail')
+        req.headers['If-None-Match'] = etag
+        resp_obj = self.controller.detail(req)
+        self.assertNotEqual(etag, resp_obj['ETag'])
+        self.assertEqual('512', resp_obj.obj['flavors'][0]['ram'])
+
     def test_get_flavor_list_detail(self):
         req = fakes.HTTPRequest.blank('/v2/fake/flavors/detail')
         flavor = self.controller.detail(req)
@@ -169,6 +169,22 @@ class ImagesControllerTest(test.TestCase):
         self.assertRaises(webob.exc.HTTPNotFound,
                           self.controller.show, fake_req, 'unknown')
 
+    def test_get_image_details_not_modified(self):
+        self.flags(osapi_list_etags=True)
+        request = fakes.HTTPRequest.blank('/v2/fake/images/detail')
+        etag = self.controller.detail(request)['ETag']
+        request = fakes.HTTPRequest.blank('/v2/fake/images/detail')
+        request.headers['If-None-Match'] = etag
+        response = self.controller.detail(request)
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(etag, response.headers['ETag'])
+
+        request = fakes.HTTPRequest.blank('/v2/fake/images')
+        request.headers['If-None-Match'] = etag
+        resp_obj = self.controller.index(request)
+        self.assertNotEqual(etag, resp_obj['ETag'])
+        self.assertTrue(resp_obj.obj['images'])
+
     def test_get_image_details(self):
         request = fakes.HTTPRequest.blank('/v2/fake/images/detail')
         response = self.controller.detail(request)
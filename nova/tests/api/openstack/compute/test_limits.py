@@ -29,6 +29,7 @@ from nova.api.openstack.compute import views
 from nova.api.openstack import xmlutil
 import nova.context
 from nova.openstack.common import jsonutils
+from nova.openstack.common import memorycache
 from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests import matchers
@@ -634,6 +635,96 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class MemcacheLimiterTest(BaseLimitTestSuite):
+    """
+    Tests for the `limits.MemcacheLimiter` class.
+    """
+
+    def setUp(self):
+        super(MemcacheLimiterTest, self).setUp()
+        self.cache = memorycache.Client()
+        self.stubs.Set(memorycache, 'get_client', lambda: self.cache)
+        self.stubs.Set(limits.MemcacheLimiter, '_get_time', self._get_time)
+        userlimits = {'user:user3': ''}
+        self.limiter = limits.MemcacheLimiter(TEST_LIMITS, **userlimits)
+
+    def _check(self, num, verb, url, username=None, limiter=None):
+        limiter = limiter or self.limiter
+        return [limiter.check_for_delay(verb, url, username)[0]
+                for x in xrange(num)]
+
+    def _assertDelays(self, expected, results):
+        self.assertEqual(len(expected), len(results))
+        for delay, result in zip(expected, results):
+            if delay is None:
+                self.assertEqual(None, result)
+            else:
+                self.assertAlmostEqual(delay, result)
+
+    def test_no_delay_GET(self):
+        delay = self.limiter.check_for_delay("GET", "/anything")
+        self.assertEqual(delay, (None, None))
+
+    def test_delay_PUT(self):
+        # The 11th PUT is allowed once the window has slid by a tenth
+        self._assertDelays([None] * 10 + [66.0],
+                           self._check(11, "PUT", "/anything"))
+        delay, error = self.limiter.check_for_delay("PUT", "/anything")
+        self.assertEqual(error, TEST_LIMITS[3].error_message)
+
+        self.time += 65.0
+        self._assertDelays([1.0], self._check(1, "PUT", "/anything"))
+        self.time += 1.0
+        self._assertDelays([None, 6.0], self._check(2, "PUT", "/anything"))
+
+    def test_sliding_window(self):
+        self._assertDelays([None] * 10, self._check(10, "PUT", "/anything"))
+
+        # Half of the previous window is still within the last minute
+        self.time += 90.0
+        self._assertDelays([None] * 5 + [6.0],
+                           self._check(6, "PUT", "/anything"))
+
+        # Two minutes later, nothing is left
+        self.time += 120.0
+        self._assertDelays([None] * 10, self._check(10, "PUT", "/anything"))
+
+    def test_rejected_not_counted(self):
+        self._assertDelays([None] * 5 + [72.0] * 3,
+                           self._check(8, "PUT", "/servers"))
+        self._assertDelays([None] * 5 + [66.0],
+                           self._check(6, "PUT", "/anything"))
+
+    def test_shared_between_limiters(self):
+        other = limits.MemcacheLimiter(TEST_LIMITS)
+        self._assertDelays([None] * 3, self._check(3, "POST", "/servers"))
+        self._assertDelays([80.0], self._check(1, "POST", "/servers",
+                                                limiter=other))
+
+    def test_multiple_users(self):
+        self._assertDelays([None] * 10 + [66.0],
+                           self._check(11, "PUT", "/anything", "user1"))
+        self._assertDelays([None] * 10,
+                           self._check(10, "PUT", "/anything", "user2"))
+        self._assertDelays([None] * 20,
+                           self._check(20, "PUT", "/anything", "user3"))
+
+    def test_get_limits(self):
+        self.time = 30.0
+        self._check(5, "PUT", "/servers")
+        self._check(1, "PUT", "/servers")
+        limits_ = dict((limit['URI'], limit)
+                       for limit in self.limiter.get_limits()
+                       if limit['verb'] == 'PUT')
+        self.assertEqual(limits_['*']['remaining'], 5)
+        self.assertEqual(limits_['*']['resetTime'], 30)
+        self.assertEqual(limits_['/servers']['remaining'], 0)
+        self.assertEqual(limits_['/servers']['resetTime'], 72)
+        self.assertEqual(limits_['/servers']['unit'], 'MINUTE')
+        self.assertEqual(limits_['/servers']['value'], 5)
+        self.assertEqual(self.limiter.get_limits('user3'), [])
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
     Tests for `limits.WsgiLimiter` class.
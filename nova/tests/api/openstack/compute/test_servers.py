@@ -47,6 +47,7 @@ from nova.network.quantumv2 import api as quantum_api
 from nova.openstack.common import jsonutils
 from nova.openstack.common import policy as common_policy
 from nova.openstack.common import rpc
+from nova.openstack.common import timeutils
 from nova import policy
 from nova import test
 from nova.tests.api.openstack import fakes
@@ -584,6 +585,47 @@ class ServersControllerTest(test.TestCase):
 
             self.assertEqual(s['links'], expected_links)
 
+    def test_get_server_list_not_modified(self):
+        self.flags(osapi_list_etags=True)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        version = {'count': 5,
+                   'updated_at': timeutils.utcnow() - datetime.timedelta(1)}
+        searches = []
+
+        def fake_get_all_version(compute_self, context, search_opts=None):
+            searches.append(search_opts)
+            return dict(version)
+
+        self.stubs.Set(compute_api.API, 'get_all_version',
+                       fake_get_all_version)
+
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        resp_obj = self.controller.detail(req)
+        self.assertEqual(5, len(resp_obj.obj['servers']))
+        self.assertEqual(searches, [{'deleted': False,
+                                     'project_id': 'fake'}])
+        etag = resp_obj['ETag']
+
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        req.headers['If-None-Match'] = etag
+        response = self.controller.detail(req)
+        self.assertEqual(304, response.status_int)
+
+        # Changes made within the last second might not be visible in
+        # the version yet
+        version['updated_at'] = timeutils.utcnow()
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        req.headers['If-None-Match'] = etag
+        res_dict = self.controller.detail(req)
+        self.assertEqual(5, len(res_dict['servers']))
+
+        timeutils.advance_time_seconds(2)
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        req.headers['If-None-Match'] = etag
+        resp_obj = self.controller.detail(req)
+        self.assertNotEqual(etag, resp_obj['ETag'])
+
     def test_get_servers_with_limit(self):
         req = fakes.HTTPRequest.blank('/v2/fake/servers?limit=3')
         res_dict = self.controller.index(req)
@@ -689,7 +731,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             return [fakes.stub_instance(100, uuid=server_uuid)]
 
         self.stubs.Set(compute_api.API, 'get_all', fake_get_all)
@@ -700,12 +742,27 @@ class ServersControllerTest(test.TestCase):
         self.assertEqual(len(servers), 1)
         self.assertEqual(servers[0]['id'], server_uuid)
 
+    def test_get_servers_reads_from_slave(self):
+        calls = []
+
+        def fake_get_all(compute_self, context, search_opts=None,
+                         sort_key=None, sort_dir='desc',
+                         limit=None, marker=None, use_slave=False):
+            calls.append(use_slave)
+            return []
+
+        self.stubs.Set(compute_api.API, 'get_all', fake_get_all)
+
+        req = fakes.HTTPRequest.blank('/v2/fake/servers')
+        self.controller.index(req)
+        self.assertEqual([True], calls)
+
     def test_get_servers_allows_image(self):
         server_uuid = str(uuid.uuid4())
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('image' in search_opts)
             self.assertEqual(search_opts['image'], '12345')
@@ -721,7 +778,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_tenant_id_filter_converts_to_project_id_for_admin(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         use_slave=False):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             self.assertFalse(filters.get('tenant_id'))
@@ -738,7 +796,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_admin_restricted_tenant(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         use_slave=False):
             self.assertNotEqual(filters, None)
             self.assertEqual(filters['project_id'], 'fake')
             return [fakes.stub_instance(100)]
@@ -754,7 +813,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_all_tenants_pass_policy(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         use_slave=False):
             self.assertNotEqual(filters, None)
             self.assertTrue('project_id' not in filters)
             return [fakes.stub_instance(100)]
@@ -778,7 +838,8 @@ class ServersControllerTest(test.TestCase):
 
     def test_all_tenants_fail_policy(self):
         def fake_get_all(context, filters=None, sort_key=None,
-                         sort_dir='desc', limit=None, marker=None):
+                         sort_dir='desc', limit=None, marker=None,
+                         use_slave=False):
             self.assertNotEqual(filters, None)
             return [fakes.stub_instance(100)]
 
@@ -802,7 +863,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('flavor' in search_opts)
             # flavor is an integer ID
@@ -828,7 +889,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], vm_states.ACTIVE)
@@ -860,7 +921,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertTrue('vm_state' in search_opts)
             self.assertEqual(search_opts['vm_state'], 'deleted')
 
@@ -880,7 +941,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('name' in search_opts)
             self.assertEqual(search_opts['name'], 'whee.*')
@@ -899,7 +960,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('changes-since' in search_opts)
             changes_since = datetime.datetime(2011, 1, 24, 17, 8, 1,
@@ -931,7 +992,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -960,7 +1021,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             # Allowed by user
             self.assertTrue('name' in search_opts)
@@ -989,7 +1050,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip' in search_opts)
             self.assertEqual(search_opts['ip'], '10\..*')
@@ -1012,7 +1073,7 @@ class ServersControllerTest(test.TestCase):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          sort_key=None, sort_dir='desc',
-                         limit=None, marker=None):
+                         limit=None, marker=None, use_slave=False):
             self.assertNotEqual(search_opts, None)
             self.assertTrue('ip6' in search_opts)
             self.assertEqual(search_opts['ip6'], 'ffff.*')
@@ -1756,6 +1817,10 @@ class ServersControllerCreateTest(test.TestCase):
             self.instance_cache_by_uuid[instance['uuid']] = instance
             return instance
 
+        def instance_create_bulk(context, values_list):
+            return [instance_create(context, values)
+                    for values in values_list]
+
         def instance_get(context, instance_id):
             """Stub for compute/api create() pulling in instance after
             scheduling
@@ -1803,6 +1868,7 @@ class ServersControllerCreateTest(test.TestCase):
         self.stubs.Set(db, 'project_get_networks',
                        project_get_networks)
         self.stubs.Set(db, 'instance_create', instance_create)
+        self.stubs.Set(db, 'instance_create_bulk', instance_create_bulk)
         self.stubs.Set(db, 'instance_system_metadata_update',
                 fake_method)
         self.stubs.Set(db, 'instance_get', instance_get)
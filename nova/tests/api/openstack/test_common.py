@@ -25,9 +25,14 @@ import webob.exc
 import xml.dom.minidom as minidom
 
 from nova.api.openstack import common
+from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import utils as compute_utils
+from nova import context
 from nova import exception
+from nova.network import model as network_model
 from nova import test
+from nova.tests import fake_network_cache_model
 from nova.tests import utils
 
 
@@ -325,6 +330,152 @@ class MiscFunctionsTest(test.TestCase):
                 common.check_img_metadata_properties_quota, ctxt, metadata3)
 
 
+class CachedNetworksTest(test.TestCase):
+    def setUp(self):
+        super(CachedNetworksTest, self).setUp()
+        self.hydrated = []
+
+        def fake_get_nw_info_for_instance(instance):
+            self.hydrated.append(instance['uuid'])
+            return network_model.NetworkInfo([
+                fake_network_cache_model.new_vif()])
+
+        self.stubs.Set(compute_utils, 'get_nw_info_for_instance',
+                       fake_get_nw_info_for_instance)
+
+    def _make_request(self):
+        request = wsgi.Request.blank('/v2/fake/servers/detail')
+        request.environ['nova.context'] = utils.get_test_admin_context()
+        return request
+
+    def test_hydrated_once_per_request(self):
+        request = self._make_request()
+        instance = {'uuid': 'uuid0'}
+        networks = common.get_cached_networks_for_instance(request, instance)
+        self.assertEqual(networks.keys(), ['public'])
+        self.assertTrue(networks is
+                common.get_cached_networks_for_instance(request, instance))
+        common.get_cached_networks_for_instance(request, {'uuid': 'uuid1'})
+        self.assertEqual(self.hydrated, ['uuid0', 'uuid1'])
+
+        common.get_cached_networks_for_instance(self._make_request(),
+                                                instance)
+        self.assertEqual(self.hydrated, ['uuid0', 'uuid1', 'uuid0'])
+
+    def test_plain_request(self):
+        request = webob.Request.blank('/v2/fake/servers/detail')
+        request.environ['nova.context'] = utils.get_test_admin_context()
+        instance = {'uuid': 'uuid0'}
+        common.get_cached_networks_for_instance(request, instance)
+        common.get_cached_networks_for_instance(request, instance)
+        self.assertEqual(self.hydrated, ['uuid0', 'uuid0'])
+
+
+class ConditionalListTest(test.TestCase):
+    def setUp(self):
+        super(ConditionalListTest, self).setUp()
+        self.flags(osapi_list_etags=True)
+        self.version = {'count': 1}
+        self.built = []
+
+    def _get_version(self):
+        return self.version
+
+    def _build(self):
+        self.built.append(True)
+        return {'servers': []}
+
+    def _list(self, path='/v2/fake/servers', etag=None, context=None):
+        request = wsgi.Request.blank(path)
+        request.environ['nova.context'] = (context or
+                                           utils.get_test_admin_context())
+        if etag is not None:
+            request.headers['If-None-Match'] = etag
+        return common.conditional_list(request, self._get_version,
+                                       self._build)
+
+    def test_disabled(self):
+        self.flags(osapi_list_etags=False)
+        self.assertEqual({'servers': []}, self._list())
+
+    def test_no_version(self):
+        self.version = None
+        self.assertEqual({'servers': []}, self._list())
+
+    def test_etag_returned(self):
+        resp_obj = self._list()
+        self.assertTrue(isinstance(resp_obj, wsgi.ResponseObject))
+        self.assertEqual({'servers': []}, resp_obj.obj)
+        self.assertEqual(resp_obj['ETag'], self._list()['ETag'])
+
+    def test_not_modified(self):
+        etag = self._list()['ETag']
+        response = self._list(etag=etag)
+        self.assertTrue(isinstance(response, webob.exc.HTTPNotModified))
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual(1, len(self.built))
+
+    def test_modified(self):
+        etag = self._list()['ETag']
+        self.version = {'count': 2}
+        resp_obj = self._list(etag=etag)
+        self.assertNotEqual(etag, resp_obj['ETag'])
+        self.assertEqual(2, len(self.built))
+
+    def test_etag_depends_on_request(self):
+        etag = self._list()['ETag']
+        self.assertNotEqual(etag,
+                            self._list('/v2/fake/servers?limit=1')['ETag'])
+        self.assertNotEqual(etag,
+                            self._list('/v2/fake/servers.xml')['ETag'])
+        other = context.RequestContext('other', 'fake')
+        self.assertNotEqual(etag, self._list(context=other)['ETag'])
+
+
+class ViewBuilderLinksTest(test.TestCase):
+    def setUp(self):
+        super(ViewBuilderLinksTest, self).setUp()
+        self.builder = common.ViewBuilder()
+        self.request = webob.Request.blank('/v2/fake/servers',
+                                           base_url='http://localhost/v2')
+        self.request.environ['nova.context'] = utils.get_test_admin_context()
+        self.request.environ['nova.context'].project_id = 'fake'
+
+    def test_links(self):
+        self.assertEqual(self.builder._get_links(self.request, 'abc',
+                                                 'servers'),
+                         [{'rel': 'self',
+                           'href': 'http://localhost/v2/fake/servers/abc'},
+                          {'rel': 'bookmark',
+                           'href': 'http://localhost/fake/servers/abc'}])
+
+    def test_prefix_computed_once(self):
+        calls = []
+        orig_remove_version = common.remove_version_from_href
+
+        def fake_remove_version_from_href(href):
+            calls.append(href)
+            return orig_remove_version(href)
+
+        self.stubs.Set(common, 'remove_version_from_href',
+                       fake_remove_version_from_href)
+        for i in xrange(3):
+            self.builder._get_bookmark_link(self.request, i, 'servers')
+        self.assertEqual(calls, ['http://localhost/v2'])
+
+    def test_prefix_follows_config(self):
+        self.assertEqual(
+            self.builder._get_href_link(self.request, 'abc', 'servers'),
+            'http://localhost/v2/fake/servers/abc')
+        self.flags(osapi_compute_link_prefix='https://example.com')
+        self.assertEqual(
+            self.builder._get_href_link(self.request, 'abc', 'servers'),
+            'https://example.com/v2/fake/servers/abc')
+        self.assertEqual(
+            self.builder._get_bookmark_link(self.request, 'abc', 'servers'),
+            'https://example.com/fake/servers/abc')
+
+
 class MetadataXMLDeserializationTest(test.TestCase):
 
     deserializer = common.MetadataXMLDeserializer()
@@ -97,6 +97,13 @@ class RequestTest(test.TestCase):
                  'uuid1': instances[1],
                  'uuid2': instances[2]})
 
+    def test_cache_and_retrieve_instance_networks(self):
+        request = wsgi.Request.blank('/foo')
+        networks = {'private': {'ips': [], 'floating_ips': []}}
+        request.cache_instance_networks('uuid0', networks)
+        self.assertEqual(request.get_instance_networks('uuid0'), networks)
+        self.assertEqual(request.get_instance_networks('uuid1'), None)
+
 
 class ActionDispatcherTest(test.TestCase):
     def test_dispatch(self):
@@ -656,6 +656,92 @@ class TemplateTest(test.TestCase):
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
 
+class CompiledTemplateTest(test.TestCase):
+    def _make_master(self):
+        root = xmlutil.TemplateElement('test', selector='test',
+                                       name='name')
+        value = xmlutil.SubTemplateElement(root, 'value', selector='values')
+        value.text = xmlutil.Selector()
+        attrs = xmlutil.SubTemplateElement(root, 'attrs', selector='attrs')
+        xmlutil.SubTemplateElement(attrs, 'attr', selector=xmlutil.get_items,
+                                   key=0, value=1)
+        return xmlutil.MasterTemplate(root, 1, nsmap=dict(f='foo'))
+
+    def _make_slave(self):
+        root = xmlutil.TemplateElement('test', selector='test', id='id')
+        image = xmlutil.SubTemplateElement(root, 'image',
+                                           selector='image', id='id')
+        image.text = xmlutil.Selector('name')
+        attrs = xmlutil.SubTemplateElement(root, 'attrs', selector='attrs',
+                                           count='count')
+        xmlutil.SubTemplateElement(attrs, 'attr', selector=xmlutil.get_items,
+                                   key=0)
+        return xmlutil.SlaveTemplate(root, 1, nsmap=dict(b='bar'))
+
+    def _serialize(self, tmpl, obj):
+        elem = tmpl._serialize(None, obj, tmpl._siblings(), tmpl._nsmap())
+        return etree.tostring(elem)
+
+    def test_make_tree_matches_serialize(self):
+        obj = {
+            'test': {
+                'id': 7,
+                'name': 'foobar',
+                'values': [1, 2, 3],
+                'attrs': {'a': 1, 'b': 2},
+                'image': {'name': 'image_foobar', 'id': 42},
+                },
+            }
+        master = self._make_master()
+        master.attach(self._make_slave())
+        self.assertEqual(etree.tostring(master.make_tree(obj)),
+                         self._serialize(master, obj))
+
+        del obj['test']['image']
+        self.assertEqual(etree.tostring(master.make_tree(obj)),
+                         self._serialize(master, obj))
+
+    def test_compiled_cached_per_slaves(self):
+        master = self._make_master()
+        slave = self._make_slave()
+        compiled = xmlutil.compile_template(master._siblings())
+        self.assertTrue(isinstance(compiled, xmlutil.CompiledElement))
+        self.assertTrue(
+            compiled is xmlutil.compile_template(master.copy()._siblings()))
+
+        master.attach(slave)
+        with_slave = xmlutil.compile_template(master._siblings())
+        self.assertTrue(with_slave is not compiled)
+        self.assertTrue(
+            with_slave is xmlutil.compile_template(master._siblings()))
+        self.assertEqual(len(with_slave.children), 3)
+
+    def test_recompiled_after_change(self):
+        master = self._make_master()
+        obj = {'test': {'name': 'foobar', 'id': 7}}
+        self.assertEqual(master.make_tree(obj).get('id'), None)
+        master.root.set('id')
+        self.assertEqual(master.make_tree(obj).get('id'), '7')
+        master.root.append(xmlutil.TemplateElement('child'))
+        self.assertEqual(master.make_tree(obj)[0].tag, 'child')
+
+    def test_custom_render_not_compiled(self):
+        class UpperTemplateElement(xmlutil.TemplateElement):
+            def apply(self, elem, obj):
+                elem.text = obj.upper()
+
+        root = xmlutil.TemplateElement('test')
+        xmlutil.SubTemplateElement(root, 'name', selector='name')
+        root.append(UpperTemplateElement('upper', selector='name'))
+        tmpl = xmlutil.Template(root)
+        self.assertEqual(xmlutil.compile_template(tmpl._siblings()), None)
+        self.assertEqual(tmpl.make_tree(dict(name='foo'))[1].text, 'FOO')
+
+    def test_root_selecting_list(self):
+        tmpl = xmlutil.Template(xmlutil.TemplateElement('test'))
+        self.assertRaises(ValueError, tmpl.make_tree, [1, 2])
+
+
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
         elem = xmlutil.TemplateElement('test')
@@ -19,6 +19,7 @@
 """Tests for compute service."""
 
 import base64
+import collections
 import copy
 import datetime
 import sys
@@ -40,6 +41,8 @@ from nova.compute import rpcapi as compute_rpcapi
 from nova.compute import task_states
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
+from nova import conductor
+from nova.conductor import api as conductor_api
 from nova.conductor import manager as conductor_manager
 from nova import context
 from nova import db
@@ -1105,6 +1108,33 @@ class ComputeTestCase(BaseTestCase):
         LOG.info(_("After terminating instances: %s"), instances)
         self.assertEqual(len(instances), 0)
 
+    def test_run_instance_coalesces_updates(self):
+        # The updates of the build are merged into fewer writes.
+        writes = collections.defaultdict(int)
+        orig_update = db.instance_update_and_get_original
+
+        def fake_update(context, instance_uuid, values, *args, **kwargs):
+            writes[instance_uuid] += 1
+            return orig_update(context, instance_uuid, values, *args,
+                               **kwargs)
+
+        self.stubs.Set(db, 'instance_update_and_get_original', fake_update)
+        uncoalesced = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=uncoalesced)
+
+        self.flags(update_coalesce_window=60, group='conductor')
+        self.stubs.Set(conductor_api, '_UPDATE_COALESCERS', {})
+        self.stubs.Set(self.compute, 'conductor_api', conductor.API())
+        coalesced = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=coalesced)
+        self.compute.conductor_api.flush_updates()
+
+        self.assertTrue(writes[coalesced['uuid']] <
+                        writes[uncoalesced['uuid']])
+        instance = db.instance_get_by_uuid(self.context, coalesced['uuid'])
+        self.assertEqual(vm_states.ACTIVE, instance['vm_state'])
+        self.assertEqual(None, instance['task_state'])
+
     def test_run_terminate_with_vol_attached(self):
         """Make sure it is possible to  run and terminate instance with volume
         attached
@@ -1276,6 +1306,23 @@ class ComputeTestCase(BaseTestCase):
         self.compute.start_instance(self.context, instance=instance)
         self.compute.terminate_instance(self.context, instance=instance)
 
+    def test_stop_instances(self):
+        # Ensure a failure to stop one instance doesn't stop the others.
+        instances = [jsonutils.to_primitive(self._create_fake_instance())
+                     for i in xrange(2)]
+        for instance in instances:
+            self.compute.run_instance(self.context, instance=instance)
+        db.instance_update(self.context, instances[1]['uuid'],
+                           {"task_state": task_states.POWERING_OFF})
+        self.compute.stop_instances(self.context, instances=instances)
+        self.compute._bulk_action_pool.waitall()
+        instance = db.instance_get_by_uuid(self.context, instances[0]['uuid'])
+        self.assertEqual(vm_states.ACTIVE, instance['vm_state'])
+        instance = db.instance_get_by_uuid(self.context, instances[1]['uuid'])
+        self.assertEqual(vm_states.STOPPED, instance['vm_state'])
+        for instance in instances:
+            self.compute.terminate_instance(self.context, instance=instance)
+
     def test_stop_start_no_image(self):
         params = {'image_ref': ''}
         instance = self._create_fake_instance(params)
@@ -3737,6 +3784,34 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(instances[0]['task_state'], None)
 
+    def test_sync_power_states_rereads_before_syncing(self):
+        # An instance started after its power state was sampled, while the
+        # next instance is sampled, is not stopped.
+        for i in xrange(2):
+            self._create_fake_instance(
+                    {'host': self.compute.host,
+                     'vm_state': vm_states.STOPPED,
+                     'power_state': power_state.SHUTDOWN})
+        sampled = []
+
+        def fake_get_info(instance):
+            if sampled:
+                db.instance_update(self.context, sampled[0],
+                                   {'vm_state': vm_states.ACTIVE,
+                                    'power_state': power_state.RUNNING})
+            sampled.append(instance['uuid'])
+            return {'state': power_state.SHUTDOWN}
+
+        def fake_compute_stop(context, instance):
+            self.fail('stopped %s' % instance['uuid'])
+
+        self.stubs.Set(self.compute.driver, 'get_info', fake_get_info)
+        self.stubs.Set(self.compute.conductor_api, 'compute_stop',
+                       fake_compute_stop)
+        self.compute._sync_power_states(context.get_admin_context())
+        instance = db.instance_get_by_uuid(self.context, sampled[0])
+        self.assertEqual(power_state.RUNNING, instance['power_state'])
+
     def test_add_instance_fault(self):
         instance = self._create_fake_instance()
         exc_info = None
@@ -4066,14 +4141,12 @@ class ComputeTestCase(BaseTestCase):
                                'instance_uuid': instance['uuid'],
                                'status': None})
 
-        def fake_instance_get_by_uuid(context, instance_uuid,
+        def fake_instance_get_by_uuids(context, instance_uuids,
                 cols_to_join=None):
-            # raise InstanceNotFound exception for uuid 'noexist'
-            if instance_uuid == 'noexist':
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            for instance in instances:
-                if instance['uuid'] == instance_uuid:
-                    return instance
+            # leave out the instance with uuid 'noexist'
+            return [instance for instance in instances
+                    if instance['uuid'] in instance_uuids and
+                    instance['uuid'] != 'noexist']
 
         def fake_migration_get_unconfirmed_by_dest_compute(context,
                 resize_confirm_window, dest_compute):
@@ -4096,8 +4169,8 @@ class ComputeTestCase(BaseTestCase):
                     migration_ref['instance_uuid']):
                     migration['status'] = 'confirmed'
 
-        self.stubs.Set(db, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
+        self.stubs.Set(db, 'instance_get_by_uuids',
+                fake_instance_get_by_uuids)
         self.stubs.Set(db, 'migration_get_unconfirmed_by_dest_compute',
                 fake_migration_get_unconfirmed_by_dest_compute)
         self.stubs.Set(self.compute.conductor_api, 'migration_update',
@@ -4694,6 +4767,9 @@ class ComputeTestCase(BaseTestCase):
         self.stubs.Set(self.compute.conductor_api,
                        'instance_get_active_by_window_joined',
                        lambda *a, **k: instances)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_count_active_by_window',
+                       lambda *a, **k: len(instances))
         self.stubs.Set(compute_utils, 'start_instance_usage_audit',
                        lambda *a, **k: None)
         self.stubs.Set(compute_utils, 'finish_instance_usage_audit',
@@ -4706,6 +4782,37 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._instance_usage_audit(self.context)
 
+    def test_instance_usage_audit_pages(self):
+        instances = [{'uuid': 'foo'}, {'uuid': 'bar'}, {'uuid': 'baz'}]
+        self.flags(instance_usage_audit=True)
+        self.stubs.Set(compute_manager, '_AUDIT_PAGE_SIZE', 2)
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                       lambda *a, **k: False)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_count_active_by_window',
+                       lambda *a, **k: len(instances))
+        self.stubs.Set(compute_utils, 'finish_instance_usage_audit',
+                       lambda *a, **k: None)
+        self.stubs.Set(self.compute.conductor_api, 'notify_usage_exists',
+                       lambda *a, **k: None)
+
+        self.mox.StubOutWithMock(compute_utils, 'start_instance_usage_audit')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_get_active_by_window_joined')
+        compute_utils.start_instance_usage_audit(
+            self.context, self.compute.conductor_api, mox.IgnoreArg(),
+            mox.IgnoreArg(), self.compute.host, 3)
+        self.compute.conductor_api.instance_get_active_by_window_joined(
+            self.context, mox.IgnoreArg(), mox.IgnoreArg(),
+            host=self.compute.host, limit=2, marker=None).AndReturn(
+                instances[:2])
+        self.compute.conductor_api.instance_get_active_by_window_joined(
+            self.context, mox.IgnoreArg(), mox.IgnoreArg(),
+            host=self.compute.host, limit=2, marker='bar').AndReturn(
+                instances[2:])
+        self.mox.ReplayAll()
+        self.compute._instance_usage_audit(self.context)
+
     def test_add_remove_fixed_ip_updates_instance_updated_at(self):
         def _noop(*args, **kwargs):
             pass
@@ -5092,6 +5199,99 @@ class ComputeAPITestCase(BaseTestCase):
 
         db.instance_destroy(self.context, instance['uuid'])
 
+    def test_bulk_action(self):
+        instances = [jsonutils.to_primitive(self._create_fake_instance())
+                     for i in xrange(2)]
+        instances.append(jsonutils.to_primitive(
+                self._create_fake_instance(params={'host': 'other_host'})))
+        instances.append(jsonutils.to_primitive(
+                self._create_fake_instance(params={'host': ''})))
+        missing_uuid = str(uuid.uuid4())
+        casts = []
+
+        def fake_stop_instances(rpcapi, context, instances, host):
+            casts.append((host, sorted(i['uuid'] for i in instances)))
+
+        self.stubs.Set(compute_rpcapi.ComputeAPI, 'stop_instances',
+                       fake_stop_instances)
+        uuids = [instance['uuid'] for instance in instances]
+        results = self.compute_api.bulk_action(self.context,
+                                               uuids + [missing_uuid],
+                                               'stop')
+
+        self.assertEqual(None, results[uuids[0]])
+        self.assertEqual(None, results[uuids[2]])
+        self.assertTrue(isinstance(results[uuids[3]],
+                                   exception.InstanceNotReady))
+        self.assertTrue(isinstance(results[missing_uuid],
+                                   exception.InstanceNotFound))
+        self.assertEqual([('fake_host', sorted(uuids[:2])),
+                          ('other_host', [uuids[2]])], sorted(casts))
+        for instance_uuid in uuids[:3]:
+            instance = db.instance_get_by_uuid(self.context, instance_uuid)
+            self.assertEqual(task_states.POWERING_OFF, instance['task_state'])
+
+        # Stopping them again fails with the state of each instance.
+        results = self.compute_api.bulk_action(self.context, uuids[:1],
+                                               'stop')
+        self.assertTrue(isinstance(results[uuids[0]],
+                                   exception.InstanceInvalidState))
+        self.assertEqual(2, len(casts))
+
+        for instance_uuid in uuids:
+            db.instance_destroy(self.context, instance_uuid)
+
+    def test_bulk_action_unexpected_error(self):
+        instances = [jsonutils.to_primitive(self._create_fake_instance())
+                     for i in xrange(2)]
+        casts = []
+
+        def fake_stop_instances(rpcapi, context, instances, host):
+            casts.append((host, [i['uuid'] for i in instances]))
+
+        orig_record_action_start = self.compute_api._record_action_start
+        calls = []
+
+        def fake_record_action_start(context, instance, action):
+            if calls:
+                raise test.TestingException()
+            calls.append(instance['uuid'])
+            orig_record_action_start(context, instance, action)
+
+        self.stubs.Set(compute_rpcapi.ComputeAPI, 'stop_instances',
+                       fake_stop_instances)
+        self.stubs.Set(self.compute_api, '_record_action_start',
+                       fake_record_action_start)
+        uuids = [instance['uuid'] for instance in instances]
+        self.assertRaises(test.TestingException,
+                          self.compute_api.bulk_action, self.context, uuids,
+                          'stop')
+        # The instance stopped before the error is still cast
+        self.assertEqual([('fake_host', calls)], casts)
+
+        for instance_uuid in uuids:
+            db.instance_destroy(self.context, instance_uuid)
+
+    def test_bulk_action_reboot(self):
+        instances = [jsonutils.to_primitive(self._create_fake_instance())
+                     for i in xrange(2)]
+        casts = []
+
+        def fake_reboot_instances(rpcapi, context, instances, reboot_type,
+                                  host):
+            casts.append((host, len(instances), reboot_type))
+
+        self.stubs.Set(compute_rpcapi.ComputeAPI, 'reboot_instances',
+                       fake_reboot_instances)
+        uuids = [instance['uuid'] for instance in instances]
+        results = self.compute_api.bulk_action(self.context, uuids,
+                                               'reboot', 'HARD')
+        self.assertEqual(dict.fromkeys(uuids), results)
+        self.assertEqual([('fake_host', 2, 'HARD')], casts)
+
+        for instance_uuid in uuids:
+            db.instance_destroy(self.context, instance_uuid)
+
     def test_start_shutdown(self):
         def check_state(instance_uuid, power_state_, vm_state_, task_state_):
             instance = db.instance_get_by_uuid(self.context, instance_uuid)
@@ -6369,6 +6569,54 @@ class ComputeAPITestCase(BaseTestCase):
         db.instance_destroy(c, instance2['uuid'])
         db.instance_destroy(c, instance3['uuid'])
 
+    def test_get_all_version(self):
+        c = context.get_admin_context()
+        network_manager = fake_network.FakeNetworkManager()
+        self.stubs.Set(self.compute_api.network_api,
+                       'get_instance_uuids_by_ip_filter',
+                       network_manager.get_instance_uuids_by_ip_filter)
+
+        instance1 = self._create_fake_instance({
+                'display_name': 'woot',
+                'id': 1,
+                'uuid': '00000000-0000-0000-0000-000000000010'})
+        instance2 = self._create_fake_instance({
+                'display_name': 'woo',
+                'id': 20,
+                'uuid': '00000000-0000-0000-0000-000000000020'})
+
+        version = self.compute_api.get_all_version(c,
+                search_opts={'name': '^woo.*'})
+        self.assertEqual(2, version['count'])
+        self.assertTrue(version['updated_at'])
+
+        version = self.compute_api.get_all_version(c,
+                search_opts={'ip': '.*\.1$', 'name': '^woo.*'})
+        self.assertEqual(1, version['count'])
+
+        self.assertRaises(exception.FlavorNotFound,
+                          self.compute_api.get_all_version, c,
+                          search_opts={'flavor': 99999})
+
+        db.instance_destroy(c, instance1['uuid'])
+        db.instance_destroy(c, instance2['uuid'])
+
+    def test_get_all_use_slave(self):
+        c = context.get_admin_context()
+        calls = []
+
+        def fake_get_all_by_filters(context, filters, sort_key, sort_dir,
+                                    limit=None, marker=None,
+                                    use_slave=False):
+            calls.append(use_slave)
+            return []
+
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                       fake_get_all_by_filters)
+        self.compute_api.get_all(c)
+        self.compute_api.get_all(c, use_slave=True)
+        self.assertEqual([False, True], calls)
+
     def test_get_all_by_image(self):
         # Test searching instances by image.
 
@@ -6841,6 +7089,40 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(refs[1]['display_name'], 'x-%s' % refs[1]['uuid'])
         self.assertEqual(refs[1]['hostname'], 'x-%s' % refs[1]['uuid'])
 
+    def test_create_multiple_instances_in_bulk(self):
+        calls = []
+        orig_create_bulk = db.instance_create_bulk
+
+        def fake_create_bulk(context, values_list):
+            calls.append(len(values_list))
+            return orig_create_bulk(context, values_list)
+
+        def fail(*args, **kwargs):
+            self.fail('Instances should be created in bulk')
+
+        self.stubs.Set(db, 'instance_create_bulk', fake_create_bulk)
+        self.stubs.Set(db, 'instance_create', fail)
+        self.stubs.Set(db, 'instance_update', fail)
+        self.stubs.Set(db, 'block_device_mapping_update_or_create', fail)
+
+        block_device_mapping = [{'device_name': '/dev/vdb',
+                                 'snapshot_id': 'fake-snapshot-id',
+                                 'delete_on_termination': False}]
+        self.stubs.Set(self.compute_api.volume_api, 'get_snapshot',
+                       lambda *args: None)
+        (refs, resv_id) = self.compute_api.create(self.context,
+                flavors.get_default_instance_type(), None,
+                min_count=3, max_count=3, display_name='x',
+                block_device_mapping=block_device_mapping)
+        self.assertEqual([3], calls)
+        self.assertEqual(3, len(set(ref['uuid'] for ref in refs)))
+        for ref in refs:
+            self.assertEqual('x-%s' % ref['uuid'], ref['display_name'])
+            bdms = db.block_device_mapping_get_all_by_instance(
+                    self.context, ref['uuid'])
+            self.assertEqual(['/dev/vdb'],
+                             [bdm['device_name'] for bdm in bdms])
+
     def test_instance_architecture(self):
         # Test the instance architecture.
         i_ref = self._create_fake_instance()
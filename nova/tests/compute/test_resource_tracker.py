@@ -350,6 +350,9 @@ class BaseTrackerTestCase(BaseTestCase):
 
         self.updated = False
         self.deleted = False
+        self.update_call_count = 0
+        self.update_values = None
+        self.update_prune_stats = None
 
         self.tracker = self._tracker()
         self._migrations = {}
@@ -376,6 +379,9 @@ class BaseTrackerTestCase(BaseTestCase):
     def _fake_compute_node_update(self, ctx, compute_node_id, values,
             prune_stats=False):
         self.updated = True
+        self.update_call_count += 1
+        self.update_values = dict(values)
+        self.update_prune_stats = prune_stats
         values['stats'] = [{"key": "num_instances", "value": "1"}]
 
         self.compute.update(values)
@@ -459,6 +465,46 @@ class TrackerTestCase(BaseTrackerTestCase):
         self.assertFalse(self.tracker.disabled)
         self.assertEqual(0, self.tracker.compute_node['current_workload'])
 
+    def test_unchanged_update_still_written(self):
+        self.assertEqual(1, self.update_call_count)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+        self.assertEqual({}, self.update_values)
+
+    def test_update_sends_changed_fields_only(self):
+        self.tracker.driver.vcpus = 2
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+        self.assertEqual({'vcpus': 2}, self.update_values)
+        self.assertFalse(self.update_prune_stats)
+
+    def test_unchanged_update_refreshed_after_interval(self):
+        self.flags(compute_node_refresh_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.tracker.last_refreshed_at = timeutils.utcnow()
+
+        timeutils.advance_time_seconds(59)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+        self.assertEqual({}, self.update_values)
+
+        timeutils.advance_time_seconds(2)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(3, self.update_call_count)
+        self.assertIn('cpu_info', self.update_values)
+
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(4, self.update_call_count)
+        self.assertEqual({}, self.update_values)
+
+    def test_full_update_without_refresh_interval(self):
+        self.flags(compute_node_refresh_interval=0)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+        self.assertIn('cpu_info', self.update_values)
+        self.assertTrue(self.update_prune_stats)
+
 
 class InstanceClaimTestCase(BaseTrackerTestCase):
 
@@ -254,6 +254,11 @@ class ComputeRpcAPITestCase(test.TestCase):
                 reboot_type='type',
                 version='2.23')
 
+    def test_reboot_instances(self):
+        self._test_compute_api('reboot_instances', 'cast',
+                instances=[self.fake_instance], reboot_type='type',
+                host='fake_host', version='2.29')
+
     def test_rebuild_instance(self):
         self._test_compute_api('rebuild_instance', 'cast',
                 instance=self.fake_instance, new_pass='pass',
@@ -356,6 +361,11 @@ class ComputeRpcAPITestCase(test.TestCase):
         self._test_compute_api('start_instance', 'cast',
                 instance=self.fake_instance)
 
+    def test_start_instances(self):
+        self._test_compute_api('start_instances', 'cast',
+                instances=[self.fake_instance], host='fake_host',
+                version='2.29')
+
     def test_stop_instance_cast(self):
         self._test_compute_api('stop_instance', 'cast',
                 instance=self.fake_instance)
@@ -364,6 +374,11 @@ class ComputeRpcAPITestCase(test.TestCase):
         self._test_compute_api('stop_instance', 'call',
                 instance=self.fake_instance)
 
+    def test_stop_instances(self):
+        self._test_compute_api('stop_instances', 'cast',
+                instances=[self.fake_instance], host='fake_host',
+                version='2.29')
+
     def test_suspend_instance(self):
         self._test_compute_api('suspend_instance', 'cast',
                 instance=self.fake_instance)
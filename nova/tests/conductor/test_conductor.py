@@ -14,18 +14,23 @@
 
 """Tests for the conductor service."""
 
+from eventlet import greenthread
 import mox
 
 from nova.api.ec2 import ec2utils
 from nova.compute import flavors
+from nova.compute import task_states
 from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova import conductor
 from nova.conductor import api as conductor_api
+from nova.conductor import coalescer
 from nova.conductor import manager as conductor_manager
 from nova.conductor import rpcapi as conductor_rpcapi
 from nova import context
 from nova import db
+from nova.db import cache as db_cache
+from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova.db.sqlalchemy import models
 from nova import exception as exc
 from nova import notifications
@@ -177,6 +182,15 @@ class _BaseTestCase(object):
         self.assertEqual(orig_instance['name'],
                          copy_instance['name'])
 
+    def test_instance_get_by_uuids(self):
+        instance1 = self._create_fake_instance()
+        instance2 = self._create_fake_instance()
+        result = self.conductor.instance_get_by_uuids(
+            self.context, [instance1['uuid'], instance2['uuid'], 'fake-uuid'],
+            columns_to_join=[])
+        self.assertEqual(sorted([instance1['uuid'], instance2['uuid']]),
+                         sorted([inst['uuid'] for inst in result]))
+
     def _setup_aggregate_with_host(self):
         aggregate_ref = db.aggregate_create(self.context.elevated(),
                 {'name': 'foo'}, metadata={'availability_zone': 'foo'})
@@ -328,11 +342,33 @@ class _BaseTestCase(object):
         self.mox.StubOutWithMock(db, 'instance_get_active_by_window_joined')
         db.instance_get_active_by_window_joined(self.context, 'fake-begin',
                                                 'fake-end', 'fake-proj',
-                                                'fake-host')
+                                                'fake-host', limit=None,
+                                                marker=None)
         self.mox.ReplayAll()
         self.conductor.instance_get_active_by_window_joined(
             self.context, 'fake-begin', 'fake-end', 'fake-proj', 'fake-host')
 
+    def test_instance_get_active_by_window_joined_paged(self):
+        self.mox.StubOutWithMock(db, 'instance_get_active_by_window_joined')
+        db.instance_get_active_by_window_joined(self.context, 'fake-begin',
+                                                'fake-end', 'fake-proj',
+                                                'fake-host', limit=10,
+                                                marker='fake-uuid')
+        self.mox.ReplayAll()
+        self.conductor.instance_get_active_by_window_joined(
+            self.context, 'fake-begin', 'fake-end', 'fake-proj', 'fake-host',
+            limit=10, marker='fake-uuid')
+
+    def test_instance_count_active_by_window(self):
+        self.mox.StubOutWithMock(db, 'instance_count_active_by_window')
+        db.instance_count_active_by_window(self.context, 'fake-begin',
+                                           'fake-end', 'fake-proj',
+                                           'fake-host').AndReturn(42)
+        self.mox.ReplayAll()
+        result = self.conductor.instance_count_active_by_window(
+            self.context, 'fake-begin', 'fake-end', 'fake-proj', 'fake-host')
+        self.assertEqual(42, result)
+
     def test_instance_destroy(self):
         self.mox.StubOutWithMock(db, 'instance_destroy')
         db.instance_destroy(self.context, 'fake-uuid')
@@ -601,6 +637,93 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.conductor = conductor_manager.ConductorManager()
         self.conductor_manager = self.conductor
 
+    def _enable_cache(self):
+        db_cache.reset()
+        self.addCleanup(db_cache.reset)
+        self.conductor.cache = db_cache.Cache(60)
+
+    def _enable_flavor_cache(self):
+        db_cache.reset()
+        self.addCleanup(db_cache.reset)
+        self.stubs.Set(db.api, '_FLAVOR_CACHE', None)
+        self.flags(flavor_cache_ttl=60)
+
+    def test_instance_type_get_uses_flavor_cache(self):
+        self._enable_cache()
+        self._enable_flavor_cache()
+        self.mox.StubOutWithMock(sqlalchemy_api, 'instance_type_get')
+        sqlalchemy_api.instance_type_get(self.context, 'fake-id').AndReturn(
+            {'id': 'fake-id', 'name': 'fake'})
+        self.mox.ReplayAll()
+        for i in range(3):
+            result = self.conductor.instance_type_get(self.context,
+                                                      'fake-id')
+            self.assertEqual(result, {'id': 'fake-id', 'name': 'fake'})
+        # NOTE: Flavors are only cached by the DB API, not a second time
+        # in the conductor cache.
+        self.assertEqual(self.conductor.cache.get_stats(), {})
+
+    def test_instance_type_get_cache_invalidated(self):
+        self._enable_flavor_cache()
+        self.mox.StubOutWithMock(sqlalchemy_api, 'instance_type_get')
+        self.mox.StubOutWithMock(sqlalchemy_api, 'instance_type_destroy')
+        sqlalchemy_api.instance_type_get(
+            self.context, 'fake-id').AndReturn('first')
+        sqlalchemy_api.instance_type_destroy(self.context, 'fake')
+        sqlalchemy_api.instance_type_get(
+            self.context, 'fake-id').AndReturn('second')
+        self.mox.ReplayAll()
+        self.assertEqual('first',
+                         self.conductor.instance_type_get(self.context,
+                                                          'fake-id'))
+        db.instance_type_destroy(self.context, 'fake')
+        self.assertEqual('second',
+                         self.conductor.instance_type_get(self.context,
+                                                          'fake-id'))
+
+    def test_agent_build_get_by_triple_caches_none(self):
+        self._enable_cache()
+        self.mox.StubOutWithMock(db, 'agent_build_get_by_triple')
+        db.agent_build_get_by_triple(self.context, 'fake-hv', 'fake-os',
+                                     'fake-arch').AndReturn(None)
+        self.mox.ReplayAll()
+        for i in range(2):
+            self.assertEqual(None, self.conductor.agent_build_get_by_triple(
+                self.context, 'fake-hv', 'fake-os', 'fake-arch'))
+
+    def test_report_cache_stats(self):
+        self._enable_cache()
+        self._enable_flavor_cache()
+        self.mox.StubOutWithMock(db, 'agent_build_get_by_triple')
+        self.mox.StubOutWithMock(sqlalchemy_api, 'instance_type_get')
+        db.agent_build_get_by_triple(self.context, 'fake-hv', 'fake-os',
+                                     'fake-arch').AndReturn(None)
+        sqlalchemy_api.instance_type_get(self.context, 'fake-id').AndReturn(
+            {'id': 'fake-id'})
+        self.mox.ReplayAll()
+        for i in range(2):
+            self.conductor.agent_build_get_by_triple(
+                self.context, 'fake-hv', 'fake-os', 'fake-arch')
+        self.conductor.instance_type_get(self.context, 'fake-id')
+        logged = []
+        self.stubs.Set(conductor_manager.LOG, 'debug',
+                       lambda msg, kwargs: logged.append(kwargs))
+        self.conductor._report_cache_stats(self.context)
+        self.assertEqual([{'namespace': db_cache.AGENT_BUILD,
+                           'hits': 1, 'misses': 1},
+                          {'namespace': db_cache.INSTANCE_TYPE,
+                           'hits': 0, 'misses': 1}], logged)
+
+    def test_cache_disabled_by_default(self):
+        self.mox.StubOutWithMock(db, 'provider_fw_rule_get_all')
+        db.provider_fw_rule_get_all(self.context).AndReturn(['a'])
+        db.provider_fw_rule_get_all(self.context).AndReturn(['b'])
+        self.mox.ReplayAll()
+        self.assertEqual(['a'],
+                         self.conductor.provider_fw_rule_get_all(self.context))
+        self.assertEqual(['b'],
+                         self.conductor.provider_fw_rule_get_all(self.context))
+
     def test_block_device_mapping_update_or_create(self):
         fake_bdm = {'id': 'fake-id'}
         self.mox.StubOutWithMock(db, 'block_device_mapping_create')
@@ -661,12 +784,20 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host_and_node')
         db.instance_get_all_by_host(self.context.elevated(),
-                                    'host', None).AndReturn('result')
+                                    'host', None, limit=None,
+                                    marker=None).AndReturn('result')
+        db.instance_get_all_by_host(self.context.elevated(),
+                                    'host', None, limit=10,
+                                    marker='uuid').AndReturn('result')
         db.instance_get_all_by_host_and_node(self.context.elevated(), 'host',
                                              'node').AndReturn('result')
         self.mox.ReplayAll()
         result = self.conductor.instance_get_all_by_host(self.context, 'host')
         self.assertEqual(result, 'result')
+        result = self.conductor.instance_get_all_by_host(self.context, 'host',
+                                                         limit=10,
+                                                         marker='uuid')
+        self.assertEqual(result, 'result')
         result = self.conductor.instance_get_all_by_host(self.context, 'host',
                                                          'node')
         self.assertEqual(result, 'result')
@@ -761,6 +892,19 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor_manager = self.conductor_service.manager
         self.conductor = conductor_rpcapi.ConductorAPI()
 
+    def test_instance_get_all_by_host_versions(self):
+        versions = []
+
+        def fake_call(context, msg, version=None):
+            versions.append(version)
+
+        self.stubs.Set(self.conductor, 'call', fake_call)
+        self.conductor.instance_get_all_by_host(self.context, 'host')
+        self.conductor.instance_get_all_by_host(self.context, 'host',
+                                                limit=10, marker='uuid')
+        # Conductors older than 1.50 can still serve unpaged calls
+        self.assertEqual(['1.47', '1.50'], versions)
+
     def test_block_device_mapping_update_or_create(self):
         fake_bdm = {'id': 'fake-id'}
         self.mox.StubOutWithMock(db, 'block_device_mapping_create')
@@ -1041,7 +1185,8 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host_and_node')
         db.instance_get_all_by_host(self.context.elevated(), 'host',
-                                    None).AndReturn('fake-result')
+                                    None, limit=None,
+                                    marker=None).AndReturn('fake-result')
         self.mox.ReplayAll()
         result = self.conductor.instance_get_all_by_host(self.context,
                                                          'host')
@@ -1141,3 +1286,258 @@ class ConductorPolicyTest(test.TestCase):
 
         for key in keys:
             self.assertTrue(hasattr(instance, key))
+
+
+class FakeTimer(object):
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def fire(self):
+        self.func(*self.args)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class InstanceUpdateCoalescerTestCase(test.TestCase):
+    def setUp(self):
+        super(InstanceUpdateCoalescerTestCase, self).setUp()
+        self.context = FakeContext('fake-user', 'fake-project')
+        self.instance = {'uuid': 'fake-uuid', 'task_state': None,
+                         'vm_state': vm_states.BUILDING}
+        self.writes = []
+        self.write_error = None
+        self.timers = []
+
+        def fake_spawn_after(seconds, func, *args):
+            timer = FakeTimer(func, *args)
+            self.timers.append(timer)
+            return timer
+
+        self.stubs.Set(greenthread, 'spawn_after', fake_spawn_after)
+        self.coalescer = coalescer.InstanceUpdateCoalescer(self._fake_update,
+                                                           1)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _fake_update(self, context, instance_uuid, updates):
+        updates = dict(updates)
+        self.writes.append(dict(updates))
+        if self.write_error is not None:
+            raise self.write_error
+        expected = updates.pop('expected_task_state', self.instance[
+            'task_state'])
+        if not isinstance(expected, (tuple, list)):
+            expected = (expected,)
+        if self.instance['task_state'] not in expected:
+            raise exc.UnexpectedTaskStateError(
+                actual=self.instance['task_state'], expected=expected)
+        self.instance.update(updates)
+        return dict(self.instance)
+
+    def _build(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING,
+                               'expected_task_state': None})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        return self.coalescer.update(self.context, 'fake-uuid',
+                                     {'progress': 50})
+
+    def test_updates_merged(self):
+        instance = self._build()
+        self.assertEqual(instance['task_state'], task_states.SPAWNING)
+        self.assertEqual(instance['progress'], 50)
+        self.assertEqual(self.writes, [{'task_state': task_states.NETWORKING,
+                                        'expected_task_state': None}])
+        self.timers[0].fire()
+        self.assertEqual(self.writes[1],
+                         {'task_state': task_states.SPAWNING, 'progress': 50})
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+        self.assertEqual(len(self.timers), 1)
+
+    def test_expected_task_state_merged(self):
+        self._build()
+        instance = self.coalescer.update(
+            self.context, 'fake-uuid',
+            {'task_state': None, 'vm_state': vm_states.ACTIVE,
+             'expected_task_state': task_states.SPAWNING})
+        self.assertEqual(instance['vm_state'], vm_states.ACTIVE)
+        self.assertEqual(1, len(self.writes))
+        self.timers[0].fire()
+        self.assertEqual(self.writes[1],
+                         {'task_state': None, 'vm_state': vm_states.ACTIVE,
+                          'progress': 50})
+        self.assertEqual(self.instance['vm_state'], vm_states.ACTIVE)
+
+    def test_merged_write_expects_task_state(self):
+        self.coalescer.update(self.context, 'fake-uuid', {'progress': 10})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING,
+                               'expected_task_state': None})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING,
+                               'expected_task_state': task_states.NETWORKING})
+        self.timers[0].fire()
+        self.assertEqual(self.writes[1],
+                         {'task_state': task_states.SPAWNING,
+                          'expected_task_state': None})
+
+    def test_merged_write_unexpected_task_state_dropped(self):
+        self.coalescer.update(self.context, 'fake-uuid', {'progress': 10})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING,
+                               'expected_task_state': None})
+        self.instance['task_state'] = task_states.DELETING
+        warnings = []
+        self.stubs.Set(coalescer.LOG, 'warn',
+                       lambda *args, **kwargs: warnings.append(args))
+        self.timers[0].fire()
+        self.assertEqual(1, len(warnings))
+        self.assertEqual(1, len(self.timers))
+        self.assertEqual({}, self.coalescer._states)
+        self.assertEqual(self.instance['task_state'], task_states.DELETING)
+
+    def test_window_expired(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        timeutils.advance_time_seconds(2)
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.assertEqual(len(self.writes), 2)
+        self.assertTrue(self.timers[0].cancelled)
+
+    def test_unexpected_task_state_flushes(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.assertRaises(exc.UnexpectedTaskStateError,
+                          self.coalescer.update, self.context, 'fake-uuid',
+                          {'task_state': None,
+                           'expected_task_state': task_states.NETWORKING})
+        self.assertEqual(len(self.writes), 3)
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+
+    def test_unmergeable_keys_flush_in_order(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'host': 'fake-host'})
+        self.assertEqual([w.get('task_state') for w in self.writes],
+                         [task_states.NETWORKING, task_states.SPAWNING, None])
+        self.assertEqual(self.writes[2], {'host': 'fake-host'})
+
+    def test_background_failure_retried(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.write_error = exc.NovaException()
+        errors = []
+        self.stubs.Set(coalescer.LOG, 'exception',
+                       lambda *args, **kwargs: errors.append(args))
+        self.timers[0].fire()
+        self.assertEqual(1, len(errors))
+        self.assertEqual(2, len(self.timers))
+
+        # Nothing more is merged and the next update raises the error
+        self.assertRaises(exc.NovaException, self.coalescer.update,
+                          self.context, 'fake-uuid', {'progress': 10})
+        self.assertEqual(3, len(self.timers))
+        self.assertEqual(self.writes[2], {'task_state': task_states.SPAWNING})
+
+        self.write_error = None
+        self.timers[2].fire()
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+        self.assertEqual({}, self.coalescer._states)
+
+    def test_deleted_instance_updates_dropped(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.write_error = exc.InstanceNotFound(instance_id='fake-uuid')
+        self.timers[0].fire()
+        self.assertEqual(1, len(self.timers))
+        self.assertEqual({}, self.coalescer._states)
+
+    def test_flush_raises_failure(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.write_error = exc.NovaException()
+        self.assertRaises(exc.NovaException, self.coalescer.flush)
+        self.assertTrue('fake-uuid' in self.coalescer._states)
+        self.write_error = None
+        self.coalescer.flush()
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+        self.assertEqual({}, self.coalescer._states)
+
+    def test_flush(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.coalescer.flush('fake-uuid')
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+        self.assertTrue(self.timers[0].cancelled)
+        self.coalescer.flush('fake-uuid')
+        self.assertEqual(len(self.writes), 2)
+
+    def test_flush_all(self):
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.NETWORKING})
+        self.coalescer.update(self.context, 'fake-uuid',
+                              {'task_state': task_states.SPAWNING})
+        self.coalescer.flush()
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+        self.assertEqual({}, self.coalescer._states)
+
+    def test_apis_share_coalescer(self):
+        self.flags(update_coalesce_window=1, group='conductor')
+        self.stubs.Set(conductor_api, '_UPDATE_COALESCERS', {})
+        self.assertTrue(conductor_api.API()._update_coalescer is
+                        conductor_api.API()._update_coalescer)
+        self.assertTrue(conductor_api.LocalAPI()._update_coalescer is
+                        conductor_api.LocalAPI()._update_coalescer)
+        self.assertFalse(conductor_api.API()._update_coalescer is
+                         conductor_api.LocalAPI()._update_coalescer)
+
+    def test_local_api_reads_flush(self):
+        self.flags(update_coalesce_window=1, group='conductor')
+        self.stubs.Set(conductor_api, '_UPDATE_COALESCERS', {})
+        api = conductor_api.LocalAPI()
+        self.stubs.Set(api._update_coalescer, '_update', self._fake_update)
+        self.mox.StubOutWithMock(api._manager, 'instance_get_all_by_host')
+        api._manager.instance_get_all_by_host(
+            self.context, 'fake-host', columns_to_join=None, limit=None,
+            marker=None).AndReturn([])
+        self.mox.ReplayAll()
+        api.instance_update(self.context, 'fake-uuid',
+                            task_state=task_states.NETWORKING)
+        api.instance_update(self.context, 'fake-uuid',
+                            task_state=task_states.SPAWNING)
+        api.instance_get_all_by_host(self.context, 'fake-host')
+        self.assertEqual(self.instance['task_state'], task_states.SPAWNING)
+
+    def test_local_api_coalesces(self):
+        self.flags(update_coalesce_window=1, group='conductor')
+        self.stubs.Set(conductor_api, '_UPDATE_COALESCERS', {})
+        api = conductor_api.LocalAPI()
+        self.mox.StubOutWithMock(api._manager, 'instance_update')
+        api._manager.instance_update(
+            self.context, 'fake-uuid',
+            {'task_state': task_states.NETWORKING},
+            'compute').AndReturn(self.instance)
+        self.mox.ReplayAll()
+        api.instance_update(self.context, 'fake-uuid',
+                            task_state=task_states.NETWORKING)
+        instance = api.instance_update(self.context, 'fake-uuid',
+                                       task_state=task_states.SPAWNING)
+        self.assertEqual(instance['task_state'], task_states.SPAWNING)
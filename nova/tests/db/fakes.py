@@ -204,6 +204,9 @@ def stub_out_db_network_api(stubs):
     def fake_fixed_ip_get_all(context):
         return [FakeModel(i) for i in fixed_ips]
 
+    def fake_fixed_ip_get_all_iter(context, chunk_size=1000):
+        return iter(fake_fixed_ip_get_all(context))
+
     def fake_fixed_ip_get_by_instance(context, instance_uuid):
         ips = filter(lambda i: i['instance_uuid'] == instance_uuid,
                      fixed_ips)
@@ -315,6 +318,7 @@ def stub_out_db_network_api(stubs):
              fake_fixed_ip_disassociate,
              fake_fixed_ip_disassociate_all_by_timeout,
              fake_fixed_ip_get_all,
+             fake_fixed_ip_get_all_iter,
              fake_fixed_ip_get_by_instance,
              fake_fixed_ip_get_by_address,
              fake_fixed_ip_update,
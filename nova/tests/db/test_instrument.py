@@ -0,0 +1,122 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the instrumentation of SQL statements."""
+
+from nova import context
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import instrument
+from nova import test
+
+
+class InstrumentTestCase(test.TestCase):
+    def setUp(self):
+        super(InstrumentTestCase, self).setUp()
+        instrument.reset()
+        self.addCleanup(instrument.reset)
+        self.addCleanup(instrument.disable)
+        self.backend = instrument.InstrumentedBackend(sqlalchemy_api)
+        self.context = context.RequestContext('fake', 'fake',
+                                              request_id='req-1')
+
+    def test_get_backend(self):
+        self.assertEqual(sqlalchemy_api, sqlalchemy_api.get_backend())
+        self.flags(sql_instrumentation=True)
+        self.assertTrue(isinstance(sqlalchemy_api.get_backend(),
+                                   instrument.InstrumentedBackend))
+
+    def test_statements_counted_per_function(self):
+        self.backend.instance_create(self.context, {})
+        self.backend.instance_get_all(self.context)
+        self.backend.instance_get_all(self.context)
+        stats = instrument.get_stats()
+        self.assertTrue(stats['instance_create']['statements'] > 0)
+        self.assertEqual(stats['instance_get_all']['statements'] % 2, 0)
+        self.assertTrue(stats['instance_get_all']['statements'] >= 2)
+
+    def test_statements_counted_per_request(self):
+        self.backend.instance_get_all(self.context)
+        other = context.RequestContext('fake', 'fake', request_id='req-2')
+        self.backend.instance_get_all(other)
+        self.backend.instance_get_all(other)
+        self.assertEqual(['req-1', 'req-2'], instrument.get_request_ids())
+        req1 = instrument.get_request_stats('req-1')['instance_get_all']
+        req2 = instrument.get_request_stats('req-2')['instance_get_all']
+        self.assertEqual(2 * req1['statements'], req2['statements'])
+        self.assertEqual(None, instrument.get_request_stats('req-3'))
+
+    def test_old_requests_dropped(self):
+        self.stubs.Set(instrument, 'MAX_REQUESTS', 2)
+        for request_id in ('req-1', 'req-2', 'req-3'):
+            ctxt = context.RequestContext('fake', 'fake',
+                                          request_id=request_id)
+            self.backend.instance_get_all(ctxt)
+        self.assertEqual(['req-2', 'req-3'], instrument.get_request_ids())
+
+    def test_iterator_statements_counted(self):
+        self.backend.instance_create(self.context, {})
+        list(self.backend.instance_get_all_iter(self.context.elevated()))
+        self.assertTrue('instance_get_all_iter' in instrument.get_stats())
+
+    def test_slow_statements_logged(self):
+        self.flags(sql_slow_query_time=0.000001)
+        messages = []
+        self.stubs.Set(instrument.LOG, 'warn', messages.append)
+        self.backend.instance_get_all(self.context)
+        self.assertTrue(messages)
+        self.assertTrue('instance_get_all' in messages[0])
+        self.assertTrue('req-1' in messages[0])
+
+    def test_format_stats(self):
+        self.backend.instance_get_all(self.context)
+        self.backend.instance_get_all(self.context)
+        self.backend.instance_get_all_by_filters(self.context, {}, 'id',
+                                                 'asc')
+        lines = instrument.format_stats(limit=1)
+        self.assertEqual(2, len(lines))
+        self.assertEqual(['function', 'statements', 'rows', 'seconds'],
+                         lines[0].split())
+        self.assertEqual('instance_get_all', lines[1].split()[0])
+
+    def test_log_stats(self):
+        self.stubs.Set(instrument, '_last_logged', None)
+        messages = []
+        self.stubs.Set(instrument.LOG, 'info',
+                       lambda msg, table: messages.append(table))
+        instrument.log_stats()
+        self.assertEqual([], messages)
+        self.backend.instance_get_all(self.context)
+        instrument.log_stats()
+        instrument.log_stats()
+        self.assertEqual(1, len(messages))
+        self.assertTrue('instance_get_all' in messages[0])
+
+    def test_log_stats_disabled(self):
+        self.stubs.Set(instrument, '_last_logged', None)
+        self.flags(sql_instrumentation_log_interval=0)
+        messages = []
+        self.stubs.Set(instrument.LOG, 'info',
+                       lambda msg, table: messages.append(table))
+        self.backend.instance_get_all(self.context)
+        instrument.log_stats()
+        self.assertEqual([], messages)
+
+    def test_disabled(self):
+        instrument.disable()
+        self.backend = sqlalchemy_api
+        self.backend.instance_get_all(self.context)
+        self.assertEqual({}, instrument.get_stats())
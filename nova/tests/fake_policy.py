@@ -163,6 +163,7 @@ policy_data = """
     "compute_extension:rescue": "",
     "compute_extension:security_group_default_rules": "",
     "compute_extension:security_groups": "",
+    "compute_extension:server_bulk_actions": "",
     "compute_extension:server_diagnostics": "",
     "compute_extension:server_password": "",
     "compute_extension:services": "",
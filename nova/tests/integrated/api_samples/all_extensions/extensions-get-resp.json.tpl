@@ -440,6 +440,14 @@
             "namespace": "http://docs.openstack.org/compute/ext/securitygroups/api/v1.1",
             "updated": "%(timestamp)s"
         },
+        {
+            "alias": "os-server-bulk-actions",
+            "description": "%(text)s",
+            "links": [],
+            "name": "ServerBulkActions",
+            "namespace": "http://docs.openstack.org/compute/ext/server-bulk-actions/api/v2",
+            "updated": "%(timestamp)s"
+        },
         {
             "alias": "os-server-diagnostics",
             "description": "%(text)s",
@@ -165,6 +165,9 @@
   <extension alias="os-security-groups" updated="%(timestamp)s" namespace="http://docs.openstack.org/compute/ext/securitygroups/api/v1.1" name="SecurityGroups">
     <description>%(text)s</description>
   </extension>
+  <extension alias="os-server-bulk-actions" updated="%(timestamp)s" namespace="http://docs.openstack.org/compute/ext/server-bulk-actions/api/v2" name="ServerBulkActions">
+    <description>%(text)s</description>
+  </extension>
   <extension alias="os-server-diagnostics" updated="%(timestamp)s" namespace="http://docs.openstack.org/compute/ext/server-diagnostics/api/v1.1" name="ServerDiagnostics">
     <description>%(text)s</description>
   </extension>
@@ -0,0 +1,8 @@
+{
+    "bulk_action": {
+        "action": "%(action)s",
+        "servers": [
+            "%(uuid)s"
+        ]
+    }
+}
@@ -0,0 +1,4 @@
+<?xml version="1.0" encoding="UTF-8"?>
+<bulk_action action="%(action)s">
+    <server id="%(uuid)s"/>
+</bulk_action>
@@ -0,0 +1,8 @@
+{
+    "servers": [
+        {
+            "id": "%(uuid)s",
+            "status": 202
+        }
+    ]
+}
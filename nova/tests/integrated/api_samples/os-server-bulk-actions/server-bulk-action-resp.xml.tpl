@@ -0,0 +1,4 @@
+<?xml version='1.0' encoding='UTF-8'?>
+<servers>
+  <server id="%(uuid)s" status="202"/>
+</servers>
@@ -929,6 +929,24 @@ class ServerStartStopXmlTest(ServerStartStopJsonTest):
     ctype = 'xml'
 
 
+class ServerBulkActionsJsonTest(ServersSampleBase):
+    extension_name = ("nova.api.openstack.compute.contrib"
+                      ".server_bulk_actions.Server_bulk_actions")
+
+    def test_server_bulk_action(self):
+        uuid = self._post_server()
+        subs = {'uuid': uuid, 'action': 'stop'}
+        response = self._do_post('os-server-bulk-actions',
+                                 'server-bulk-action-req', subs)
+        subs.update(self._get_regexes())
+        return self._verify_response('server-bulk-action-resp', subs,
+                                     response, 200)
+
+
+class ServerBulkActionsXmlTest(ServerBulkActionsJsonTest):
+    ctype = 'xml'
+
+
 class UserDataJsonTest(ApiSampleTestBase):
     extension_name = "nova.api.openstack.compute.contrib.user_data.User_data"
 
@@ -141,4 +141,5 @@ class FakeComputeAPI(object):
 def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
 
-    db.compute_node_get_all(mox.IgnoreArg()).AndReturn(COMPUTE_NODES)
+    db.compute_node_get_all(mox.IgnoreArg(),
+                            use_slave=True).AndReturn(COMPUTE_NODES)
@@ -21,10 +21,14 @@
 
 import copy
 import datetime
+import os
+import time
 import types
 import uuid as stdlib_uuid
 
+import fixtures
 from oslo.config import cfg
+import sqlalchemy.engine
 from sqlalchemy.dialects import sqlite
 from sqlalchemy import MetaData
 from sqlalchemy.schema import Table
@@ -32,7 +36,10 @@ from sqlalchemy.sql.expression import select
 
 from nova import context
 from nova import db
+from nova.db import cache as db_cache
 from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import utils as db_utils
 from nova import exception
 from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common import timeutils
@@ -115,6 +122,103 @@ class DbApiTestCase(DbTestCase):
 
         self.flags(osapi_compute_unique_server_name_scope=None)
 
+    def test_instance_create_bulk(self):
+        db.security_group_create(self.context,
+                                 {'name': 'group1',
+                                  'user_id': self.user_id,
+                                  'project_id': self.project_id})
+        db.security_group_ensure_default(self.context)
+        values = [{'uuid': 'fake-uuid-%d' % i,
+                   'project_id': self.project_id,
+                   'hostname': 'host-%d' % i,
+                   'metadata': {'foo': 'bar%d' % i},
+                   'system_metadata': {'image_foo': 'baz'},
+                   'info_cache': {'network_info': '[]'},
+                   'security_groups': ['default', 'group1']}
+                  for i in xrange(3)]
+        instances = db.instance_create_bulk(self.context, values)
+
+        self.assertEqual(['fake-uuid-0', 'fake-uuid-1', 'fake-uuid-2'],
+                         [instance['uuid'] for instance in instances])
+        for i, instance in enumerate(instances):
+            instance = db.instance_get_by_uuid(self.context, instance['uuid'])
+            self.assertEqual('host-%d' % i, instance['hostname'])
+            self.assertEqual({'foo': 'bar%d' % i},
+                             utils.metadata_to_dict(instance['metadata']))
+            self.assertEqual({'image_foo': 'baz'},
+                             utils.metadata_to_dict(
+                                 instance['system_metadata']))
+            self.assertEqual('[]', instance['info_cache']['network_info'])
+            self.assertEqual(['default', 'group1'],
+                             sorted(group['name'] for group
+                                    in instance['security_groups']))
+            self.assertTrue(db.get_ec2_instance_id_by_uuid(
+                    self.context, instance['uuid']))
+
+    def test_get_ec2_instance_ids_by_uuids(self):
+        uuid1 = db.instance_create(self.context, {})['uuid']
+        uuid2 = db.instance_create(self.context, {})['uuid']
+        uuid3 = str(stdlib_uuid.uuid4())
+        ids = db.get_ec2_instance_ids_by_uuids(self.context,
+                                               [uuid1, uuid2, uuid3])
+        self.assertEqual({uuid1: db.get_ec2_instance_id_by_uuid(self.context,
+                                                                uuid1),
+                          uuid2: db.get_ec2_instance_id_by_uuid(self.context,
+                                                                uuid2)},
+                         ids)
+        self.assertEqual({}, db.get_ec2_instance_ids_by_uuids(self.context,
+                                                              []))
+
+    def test_instance_create_bulk_block_device_mapping(self):
+        bdms = [{'device_name': '/dev/sdb1', 'virtual_name': 'swap',
+                 'volume_size': 1},
+                {'device_name': '/dev/sdb2', 'virtual_name': 'swap',
+                 'volume_size': 1},
+                {'device_name': '/dev/sdc1', 'virtual_name': 'ephemeral0',
+                 'volume_size': ''},
+                {'device_name': '/dev/sdc1', 'virtual_name': None,
+                 'snapshot_id': 'fake-snapshot'}]
+        instance = db.instance_create_bulk(self.context, [
+                {'block_device_mapping': bdms}])[0]
+
+        # The same as creating the mappings one after the other
+        other = db.instance_create(self.context, {})
+        for bdm in bdms:
+            bdm = dict(bdm, instance_uuid=other['uuid'])
+            db.block_device_mapping_update_or_create(self.context, bdm)
+
+        def _get_bdms(instance_uuid):
+            bdms = db.block_device_mapping_get_all_by_instance(
+                    self.context, instance_uuid)
+            return sorted((bdm['device_name'], bdm['virtual_name'],
+                           bdm['volume_size'], bdm['snapshot_id'])
+                          for bdm in bdms)
+
+        expected = [('/dev/sdb2', 'swap', 1, None),
+                    ('/dev/sdc1', None, None, 'fake-snapshot')]
+        self.assertEqual(expected, _get_bdms(instance['uuid']))
+        self.assertEqual(expected, _get_bdms(other['uuid']))
+
+    def test_instance_create_bulk_unique_hostname(self):
+        self.flags(osapi_compute_unique_server_name_scope='project')
+        self.assertRaises(exception.InstanceExists,
+                          db.instance_create_bulk, self.context,
+                          [{'hostname': 'fake_name'},
+                           {'hostname': 'FAKE_NAME'}])
+        self.assertEqual([], db.instance_get_all(self.context))
+
+        self.flags(osapi_compute_unique_server_name_scope=None)
+        instances = db.instance_create_bulk(self.context,
+                                            [{'hostname': 'fake_name'},
+                                             {'hostname': 'fake_name'}])
+        self.assertEqual(2, len(instances))
+
+    def test_instance_create_bulk_unknown_security_group(self):
+        self.assertRaises(exception.SecurityGroupNotFoundForProject,
+                          db.instance_create_bulk, self.context,
+                          [{'security_groups': ['nonexistent']}])
+        self.assertEqual([], db.instance_get_all(self.context))
+
     def test_instance_metadata_get_all_query(self):
         self.create_instances_with_args(metadata={'foo': 'bar'})
         self.create_instances_with_args(metadata={'baz': 'quux'})
@@ -194,6 +298,38 @@ class DbApiTestCase(DbTestCase):
                                                 {'display_name': 't.*st.'})
         self.assertEqual(2, len(result))
 
+    def test_instance_get_all_by_filters_literal_regex(self):
+        self.create_instances_with_args(display_name='web_1')
+        self.create_instances_with_args(display_name='web%1')
+        self.create_instances_with_args(display_name='myweb_1')
+        self.create_instances_with_args(display_name='web_10')
+
+        def _get_names(regex):
+            result = db.instance_get_all_by_filters(self.context,
+                                                    {'display_name': regex})
+            return sorted(inst['display_name'] for inst in result)
+
+        self.assertEqual(['web_1'], _get_names('^web_1$'))
+        self.assertEqual(['web_1', 'web_10'], _get_names('^web_1'))
+        self.assertEqual(['myweb_1', 'web_1'], _get_names('web_1$'))
+        self.assertEqual(['myweb_1', 'web_1', 'web_10'], _get_names('web_1'))
+        self.assertEqual(['web%1'], _get_names('web%1'))
+        self.assertEqual(['web%1', 'web_1', 'web_10'], _get_names('^web.1'))
+
+    def test_literal_regex_filter(self):
+        column = models.Instance.display_name
+        self.assertEqual('instances.display_name = :display_name_1',
+                         str(sqlalchemy_api._literal_regex_filter(column,
+                                                                  '^foo$')))
+        criterion = sqlalchemy_api._literal_regex_filter(column, '^f_o')
+        self.assertEqual("instances.display_name LIKE :display_name_1 "
+                         "ESCAPE '!'", str(criterion))
+        self.assertEqual('f!_o%', criterion.right.value)
+        for regex in ('f.o', 'fo+', '^', '', '[fo]', 'f\\o', 'f|o'):
+            self.assertEqual(None,
+                             sqlalchemy_api._literal_regex_filter(column,
+                                                                  regex))
+
     def test_instance_get_all_by_filters_metadata(self):
         self.create_instances_with_args(metadata={'foo': 'bar'})
         self.create_instances_with_args()
@@ -259,6 +395,215 @@ class DbApiTestCase(DbTestCase):
         else:
             self.assertTrue(result[1]['deleted'])
 
+    def test_instance_get_all_by_filters_paginate_with_limit(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        instances = []
+        for i in range(5):
+            instances.append(self.create_instances_with_args())
+            meta, sys_meta = self.create_metadata_for_instance(
+                    instances[-1]['uuid'])
+            # The last two instances share the same created_at
+            if i < 3:
+                timeutils.advance_time_seconds(1)
+        instances.sort(key=lambda inst: (inst['created_at'], inst['id']),
+                       reverse=True)
+        expected = [inst['uuid'] for inst in instances]
+
+        pages = []
+        marker = None
+        while True:
+            page = db.instance_get_all_by_filters(self.context, {},
+                                                  limit=2, marker=marker)
+            if not page:
+                break
+            for inst in page:
+                self.assertTrue(inst['info_cache'])
+                self.assertEqual(len(meta), len(inst['metadata']))
+                self.assertEqual(len(sys_meta), len(inst['system_metadata']))
+            pages.append([inst['uuid'] for inst in page])
+            marker = pages[-1][-1]
+
+        self.assertEqual([expected[0:2], expected[2:4], expected[4:]],
+                         pages)
+
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                sort_dir='asc', limit=3,
+                                                marker=expected[2])
+        self.assertEqual(expected[:2][::-1], [inst['uuid'] for inst in result])
+
+    def test_instance_get_version_by_filters(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual({'count': 0, 'updated_at': None},
+                         db.instance_get_version_by_filters(self.context, {}))
+
+        inst1 = self.create_instances_with_args()
+        self.create_metadata_for_instance(inst1['uuid'])
+        timeutils.advance_time_seconds(1)
+        inst2 = self.create_instances_with_args(reservation_id='b')
+        version = db.instance_get_version_by_filters(self.context, {})
+        self.assertEqual({'count': 2, 'updated_at': inst2['created_at']},
+                         version)
+        version = db.instance_get_version_by_filters(
+                self.context, {'reservation_id': 'a'})
+        self.assertEqual(1, version['count'])
+
+        timeutils.advance_time_seconds(1)
+        db.instance_metadata_update(self.context, inst1['uuid'],
+                                    {'foo': 'bar'}, False)
+        version = db.instance_get_version_by_filters(self.context, {})
+        self.assertEqual({'count': 2, 'updated_at': timeutils.utcnow()},
+                         version)
+
+        timeutils.advance_time_seconds(1)
+        db.instance_info_cache_update(self.context, inst2['uuid'],
+                                      {'network_info': '[]'})
+        version = db.instance_get_version_by_filters(self.context, {})
+        self.assertEqual(timeutils.utcnow(), version['updated_at'])
+
+        # Deletions and the other parts of the detail view count too.
+        timeutils.advance_time_seconds(1)
+        db.instance_metadata_delete(self.context, inst1['uuid'], 'foo')
+        version = db.instance_get_version_by_filters(self.context, {})
+        self.assertEqual(timeutils.utcnow(), version['updated_at'])
+
+        timeutils.advance_time_seconds(1)
+        group = db.security_group_create(self.context,
+                                         {'name': 'group',
+                                          'project_id': 'fake'})
+        timeutils.advance_time_seconds(1)
+        db.instance_add_security_group(self.context, inst1['uuid'],
+                                       group['id'])
+        version = db.instance_get_version_by_filters(self.context, {})
+        self.assertEqual(timeutils.utcnow(), version['updated_at'])
+
+        timeutils.advance_time_seconds(1)
+        db.instance_fault_create(self.context,
+                                 {'instance_uuid': inst2['uuid'],
+                                  'code': 500, 'message': 'fault'})
+        version = db.instance_get_version_by_filters(self.context, {})
+        self.assertEqual(timeutils.utcnow(), version['updated_at'])
+
+    def test_instance_get_by_uuids(self):
+        inst1 = self.create_instances_with_args()
+        inst2 = self.create_instances_with_args()
+        self.create_instances_with_args()
+        fake_meta, fake_sys = self.create_metadata_for_instance(inst1['uuid'])
+
+        result = db.instance_get_by_uuids(self.context,
+                                          [inst1['uuid'], inst2['uuid'],
+                                           'fake-uuid'])
+        result = dict((inst['uuid'], inst) for inst in result)
+        self.assertEqual(sorted([inst1['uuid'], inst2['uuid']]),
+                         sorted(result.keys()))
+        meta = utils.metadata_to_dict(result[inst1['uuid']]['metadata'])
+        self.assertEqual(fake_meta, meta)
+
+    def test_instance_get_by_uuids_no_join(self):
+        inst = self.create_instances_with_args()
+        self.create_metadata_for_instance(inst['uuid'])
+        result = db.instance_get_by_uuids(self.context, [inst['uuid']],
+                                          columns_to_join=[])
+        self.assertEqual(1, len(result))
+        self.assertEqual([], result[0]['metadata'])
+        self.assertEqual([], result[0]['system_metadata'])
+
+    def test_instance_get_by_uuids_empty(self):
+        self.assertEqual([], db.instance_get_by_uuids(self.context, []))
+
+    def test_instance_get_all_by_host_paged(self):
+        ctxt = self.context.elevated()
+        uuids = [self.create_instances_with_args()['uuid']
+                 for i in xrange(5)]
+        self.create_instances_with_args(host='host2')
+
+        result = db.instance_get_all_by_host(ctxt, 'host1', limit=2)
+        self.assertEqual(uuids[:2], [inst['uuid'] for inst in result])
+        result = db.instance_get_all_by_host(ctxt, 'host1', limit=2,
+                                             marker=uuids[1])
+        self.assertEqual(uuids[2:4], [inst['uuid'] for inst in result])
+        result = db.instance_get_all_by_host(ctxt, 'host1',
+                                             marker=uuids[3])
+        self.assertEqual(uuids[4:], [inst['uuid'] for inst in result])
+
+    def test_instance_get_all_by_host_bad_marker(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_host,
+                          self.context.elevated(), 'host1', limit=1,
+                          marker='fake-uuid')
+
+    def test_instance_get_all_iter(self):
+        ctxt = self.context.elevated()
+        uuids = [self.create_instances_with_args(
+                     system_metadata={'foo': 'bar'})['uuid']
+                 for i in xrange(5)]
+        other = self.create_instances_with_args(host='host2')
+
+        result = list(db.instance_get_all_iter(ctxt, chunk_size=2))
+        self.assertEqual(uuids + [other['uuid']],
+                         [inst['uuid'] for inst in result])
+        self.assertEqual({'foo': 'bar'},
+                         utils.metadata_to_dict(result[0]['system_metadata']))
+        result = db.instance_get_all_iter(ctxt, host='host1', chunk_size=5)
+        self.assertEqual(uuids, [inst['uuid'] for inst in result])
+
+    def test_instance_get_all_iter_no_join(self):
+        self.create_instances_with_args(system_metadata={'foo': 'bar'})
+        result = list(db.instance_get_all_iter(self.context.elevated(),
+                                               columns_to_join=[]))
+        self.assertEqual(1, len(result))
+        self.assertEqual([], result[0]['system_metadata'])
+
+    def test_instance_get_active_by_window_joined_paged(self):
+        ctxt = self.context.elevated()
+        now = timeutils.utcnow()
+        uuids = [self.create_instances_with_args(launched_at=now)['uuid']
+                 for i in xrange(5)]
+        begin = now - datetime.timedelta(hours=1)
+        end = now + datetime.timedelta(hours=1)
+
+        self.assertEqual(5, db.instance_count_active_by_window(
+            ctxt, begin, end, host='host1'))
+        self.assertEqual(0, db.instance_count_active_by_window(
+            ctxt, begin, end, host='host2'))
+        result = db.instance_get_active_by_window_joined(
+            ctxt, begin, end, host='host1', limit=2)
+        self.assertEqual(uuids[:2], [inst['uuid'] for inst in result])
+        result = db.instance_get_active_by_window_joined(
+            ctxt, begin, end, host='host1', limit=2, marker=uuids[3])
+        self.assertEqual(uuids[4:], [inst['uuid'] for inst in result])
+
+    def test_instance_get_usage_by_window(self):
+        ctxt = self.context.elevated()
+        now = timeutils.utcnow()
+        sys_meta = {'instance_type_memory_mb': '512', 'foo': 'bar'}
+        uuids = {}
+        for project_id in ('project2', 'project1', 'project2', 'project1'):
+            instance = self.create_instances_with_args(
+                project_id=project_id, launched_at=now,
+                system_metadata=sys_meta)
+            uuids.setdefault(project_id, []).append(instance['uuid'])
+        self.create_instances_with_args(
+            launched_at=now - datetime.timedelta(hours=3),
+            terminated_at=now - datetime.timedelta(hours=2))
+        begin = now - datetime.timedelta(hours=1)
+        end = now + datetime.timedelta(hours=1)
+
+        result = list(db.instance_get_usage_by_window(ctxt, begin, end,
+                                                      chunk_size=3))
+        self.assertEqual(uuids['project1'] + uuids['project2'],
+                         [inst['uuid'] for inst in result])
+        self.assertEqual(now, result[0]['launched_at'])
+        self.assertEqual(None, result[0]['terminated_at'])
+        self.assertEqual('fake', result[0]['vm_state'])
+        self.assertEqual({'instance_type_memory_mb': '512'},
+                         utils.metadata_to_dict(result[0]['system_metadata']))
+        result = db.instance_get_usage_by_window(ctxt, begin, end,
+                                                 project_id='project2',
+                                                 chunk_size=1)
+        self.assertEqual(uuids['project2'], [inst['uuid'] for inst in result])
+
     def test_instance_get_all_by_host_and_node_no_join(self):
         # Test that system metadata is not joined.
         sys_meta = {'foo': 'bar'}
@@ -1590,6 +1935,110 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
         self.assertEqual(types.UnicodeType, type(result[0]))
 
 
+class SlaveDbApiTestCase(test.TestCase):
+    def setUp(self):
+        super(SlaveDbApiTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(slave_connection='sqlite:///%s' % os.path.join(tmpdir,
+                                                                 'slave.db'))
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_ENGINE', None)
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_MAKER', None)
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_FAILED_AT', None)
+        self.addCleanup(self._dispose_slave_engine)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _dispose_slave_engine(self):
+        if sqlalchemy_api._SLAVE_ENGINE is not None:
+            sqlalchemy_api._SLAVE_ENGINE.dispose()
+
+    def _create_slave_schema(self):
+        engine = sqlalchemy_api.get_slave_engine()
+        models.BASE.metadata.create_all(engine)
+
+    def _create_slave_instance(self, **values):
+        instance = models.Instance()
+        instance.update(values)
+        session = sqlalchemy_api.get_session(use_slave=True)
+        with session.begin():
+            instance.save(session=session)
+
+    def test_reads_from_slave(self):
+        self._create_slave_schema()
+        self._create_slave_instance(host='slave-host')
+        db.instance_create(self.ctxt, {'host': 'master-host'})
+
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(['slave-host'], [i['host'] for i in result])
+        result = db.instance_get_all_by_filters(self.ctxt, {})
+        self.assertEqual(['master-host'], [i['host'] for i in result])
+        result = db.instance_get_active_by_window_joined(
+            self.ctxt, timeutils.utcnow(), use_slave=True)
+        self.assertEqual(['slave-host'], [i['host'] for i in result])
+
+    def test_no_slave_connection(self):
+        self.flags(slave_connection='')
+        db.instance_create(self.ctxt, {'host': 'master-host'})
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(['master-host'], [i['host'] for i in result])
+        self.assertEqual(None, sqlalchemy_api._SLAVE_ENGINE)
+
+    def test_fallback_to_master(self):
+        # The slave database has no tables, so reads from it fail
+        db.instance_create(self.ctxt, {'host': 'master-host'})
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(['master-host'], [i['host'] for i in result])
+        self.assertEqual([], db.compute_node_get_all(self.ctxt,
+                                                     use_slave=True))
+        self.assertEqual([], db.bw_usage_get_by_uuids(self.ctxt, ['fake'],
+                                                      timeutils.utcnow(),
+                                                      use_slave=True))
+
+    def test_usage_by_window_falls_back_to_master(self):
+        db.instance_create(self.ctxt, {'host': 'master-host'})
+        result = list(db.instance_get_usage_by_window(self.ctxt,
+                                                      timeutils.utcnow(),
+                                                      use_slave=True))
+        self.assertEqual(1, len(result))
+        self.assertNotEqual(None, sqlalchemy_api._SLAVE_FAILED_AT)
+
+    def test_fallback_to_master_positional_use_slave(self):
+        db.instance_create(self.ctxt, {'host': 'master-host'})
+        result = db.instance_get_active_by_window_joined(
+            self.ctxt, timeutils.utcnow(), None, None, None, True)
+        self.assertEqual(['master-host'], [i['host'] for i in result])
+        self.assertNotEqual(None, sqlalchemy_api._SLAVE_FAILED_AT)
+
+    def test_slave_session_options(self):
+        session = sqlalchemy_api.get_session(use_slave=True)
+        self.assertTrue(session.autocommit)
+        session = sqlalchemy_api.get_session(use_slave=True,
+                                             autocommit=False,
+                                             expire_on_commit=True)
+        self.assertFalse(session.autocommit)
+        self.assertTrue(session.expire_on_commit)
+
+    def test_slave_skipped_after_failure(self):
+        db.instance_create(self.ctxt, {'host': 'master-host'})
+        db.instance_get_all_by_filters(self.ctxt, {}, use_slave=True)
+
+        # Reads stay on the master until sql_retry_interval has passed
+        self._create_slave_schema()
+        self._create_slave_instance(host='slave-host')
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(['master-host'], [i['host'] for i in result])
+
+        timeutils.advance_time_seconds(CONF.sql_retry_interval + 1)
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(['slave-host'], [i['host'] for i in result])
+
+
 class CapacityTestCase(test.TestCase):
     def setUp(self):
         super(CapacityTestCase, self).setUp()
@@ -2164,6 +2613,84 @@ class InstanceTypeTestCase(BaseInstanceTypeTestCase):
                           self.ctxt, 'nonexists')
 
 
+class InstanceTypeCacheTestCase(BaseInstanceTypeTestCase):
+    def setUp(self):
+        super(InstanceTypeCacheTestCase, self).setUp()
+        db_cache.reset()
+        self.addCleanup(db_cache.reset)
+        self.stubs.Set(db.api, '_FLAVOR_CACHE', None)
+        self.flags(flavor_cache_ttl=60)
+        self.inst_type = self._create_inst_type({})
+        self.calls = []
+        orig_get = sqlalchemy_api.instance_type_get
+
+        def fake_get(context, id):
+            self.calls.append(id)
+            return orig_get(context, id)
+
+        self.stubs.Set(sqlalchemy_api, 'instance_type_get', fake_get)
+
+    def test_cached(self):
+        for i in xrange(3):
+            inst_type = db.instance_type_get(self.ctxt, self.inst_type['id'])
+            self.assertEqual('fake_name', inst_type['name'])
+        self.assertEqual([self.inst_type['id']], self.calls)
+
+    def test_get_stats(self):
+        for i in xrange(3):
+            db.instance_type_get(self.ctxt, self.inst_type['id'])
+        self.assertEqual({db_cache.INSTANCE_TYPE: {'hits': 2, 'misses': 1}},
+                         db.instance_type_cache_get_stats())
+
+    def test_disabled(self):
+        self.flags(flavor_cache_ttl=0)
+        db.instance_type_get(self.ctxt, self.inst_type['id'])
+        db.instance_type_get(self.ctxt, self.inst_type['id'])
+        self.assertEqual(2, len(self.calls))
+
+    def test_returns_copies(self):
+        inst_type = db.instance_type_get(self.ctxt, self.inst_type['id'])
+        inst_type['extra_specs']['foo'] = 'bar'
+        inst_type = db.instance_type_get(self.ctxt, self.inst_type['id'])
+        self.assertEqual({}, inst_type['extra_specs'])
+
+    def test_read_deleted_not_shared(self):
+        db.instance_type_get(self.ctxt, self.inst_type['id'])
+        db.instance_type_get(self.ctxt.elevated(read_deleted='yes'),
+                             self.inst_type['id'])
+        self.assertEqual(2, len(self.calls))
+
+    def test_invalidated_by_extra_specs_update(self):
+        db.instance_type_get(self.ctxt, self.inst_type['id'])
+        db.instance_type_extra_specs_update_or_create(
+                self.ctxt, self.inst_type['flavorid'], {'foo': 'bar'})
+        inst_type = db.instance_type_get(self.ctxt, self.inst_type['id'])
+        self.assertEqual({'foo': 'bar'}, inst_type['extra_specs'])
+
+    def test_invalidated_by_destroy(self):
+        db.instance_type_get_by_name(self.ctxt, 'fake_name')
+        db.instance_type_destroy(self.ctxt, 'fake_name')
+        self.assertRaises(exception.InstanceTypeNotFoundByName,
+                          db.instance_type_get_by_name,
+                          self.ctxt, 'fake_name')
+
+    def test_expired(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        db.instance_type_get(self.ctxt, self.inst_type['id'])
+        timeutils.advance_time_seconds(61)
+        db.instance_type_get(self.ctxt, self.inst_type['id'])
+        self.assertEqual(2, len(self.calls))
+
+    def test_size_bound(self):
+        self.flags(flavor_cache_size=1)
+        other = self._create_inst_type({'name': 'other',
+                                        'flavorid': 'other'})
+        for id in (self.inst_type['id'], other['id'], self.inst_type['id']):
+            db.instance_type_get(self.ctxt, id)
+        self.assertEqual(3, len(self.calls))
+
+
 class InstanceTypeExtraSpecsTestCase(BaseInstanceTypeTestCase):
 
     def setUp(self):
@@ -2559,6 +3086,13 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
         default_params.update(params)
         return db.fixed_ip_create(self.ctxt, default_params)
 
+    def test_fixed_ip_get_all_iter(self):
+        for i in xrange(1, 6):
+            self.create_fixed_ip(address='192.168.0.%d' % i)
+        expected = [ip['address'] for ip in db.fixed_ip_get_all(self.ctxt)]
+        result = db.fixed_ip_get_all_iter(self.ctxt, chunk_size=2)
+        self.assertEqual(expected, [ip['address'] for ip in result])
+
     def test_fixed_ip_associate_fails_if_ip_not_in_network(self):
         instance_uuid = self._create_instance()
         self.assertRaises(exception.FixedIpNotFoundForNetwork,
@@ -2573,6 +3107,59 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
                           db.fixed_ip_associate,
                           self.ctxt, address, instance_uuid)
 
+    def test_fixed_ip_associate_pool(self):
+        instance_uuid = self._create_instance()
+        network = db.network_create_safe(self.ctxt, {})
+        address = self.create_fixed_ip(network_id=None)
+
+        result = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                            instance_uuid, host='host1')
+        self.assertEqual(address, result)
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(instance_uuid, fixed_ip['instance_uuid'])
+        self.assertEqual(network['id'], fixed_ip['network_id'])
+        self.assertEqual('host1', fixed_ip['host'])
+
+    def test_fixed_ip_associate_pool_exhausted(self):
+        network = db.network_create_safe(self.ctxt, {})
+        self.create_fixed_ip(address='192.168.0.1',
+                             network_id=network['id'])
+        self.create_fixed_ip(address='192.168.0.2',
+                             network_id=network['id'], reserved=True)
+        self.create_fixed_ip(address='192.168.0.3',
+                             network_id=network['id'], host='host1')
+
+        result = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                            self._create_instance())
+        self.assertEqual('192.168.0.1', result)
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool, self.ctxt,
+                          network['id'], self._create_instance())
+
+    def test_fixed_ip_associate_pool_skips_claimed(self):
+        network = db.network_create_safe(self.ctxt, {})
+        addresses = set()
+        for i in xrange(1, 5):
+            addresses.add(self.create_fixed_ip(address='192.168.0.%d' % i,
+                                               network_id=network['id']))
+        self.stubs.Set(sqlalchemy_api, '_FIXED_IP_FREE_LIST_SIZE', 2)
+        self.stubs.Set(sqlalchemy_api, '_FIXED_IP_FREE_LISTS', {})
+        first = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                           self._create_instance())
+        # Somebody else takes the other address of the free list
+        other = sqlalchemy_api._FIXED_IP_FREE_LISTS[network['id']][0][1]
+        db.fixed_ip_associate(self.ctxt, other, self._create_instance(),
+                              network_id=network['id'])
+
+        allocated = set([first, other])
+        for i in xrange(2):
+            allocated.add(db.fixed_ip_associate_pool(
+                    self.ctxt, network['id'], self._create_instance()))
+        self.assertEqual(addresses, allocated)
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool, self.ctxt,
+                          network['id'], self._create_instance())
+
     def test_fixed_ip_associate_succeeds(self):
         instance_uuid = self._create_instance()
         network = db.network_create_safe(self.ctxt, {})
@@ -3455,6 +4042,25 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+        self._create_bdm({'instance_uuid': uuid1, 'device_name': 'first'})
+        self._create_bdm({'instance_uuid': uuid2, 'device_name': 'second'})
+        self._create_bdm({'instance_uuid': uuid2, 'device_name': 'third'})
+
+        bdms = db.block_device_mapping_get_all_by_instance_uuids(
+                self.ctxt, [uuid1, uuid2, uuid3])
+        self.assertEqual(['first'],
+                         [bdm['device_name'] for bdm in bdms[uuid1]])
+        self.assertEqual(['second', 'third'],
+                         [bdm['device_name'] for bdm in bdms[uuid2]])
+        self.assertEqual([], bdms[uuid3])
+        self.assertEqual({},
+                db.block_device_mapping_get_all_by_instance_uuids(self.ctxt,
+                                                                  []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -3752,6 +4358,46 @@ class ArchiveTestCase(test.TestCase):
         # Verify we still have 4 in shadow
         self.assertEqual(len(rows8), 4)
 
+    def test_archive_deleted_rows_for_table_concurrent_delete(self):
+        tablename = "instance_id_mappings"
+        for uuidstr in self.uuidstrs:
+            insert_statement = self.table1.insert().values(uuid=uuidstr)
+            self.conn.execute(insert_statement)
+        update_statement = self.table1.update().\
+                where(self.table1.c.uuid.in_([self.uuidstrs[0],
+                                              self.uuidstrs[2]])).\
+                values(deleted=1)
+        self.conn.execute(update_statement)
+        # A row inside the batch is deleted once the batch has been copied.
+        orig_execute = sqlalchemy.engine.base.Connection.execute
+
+        def fake_execute(conn, statement, *args, **kwargs):
+            result = orig_execute(conn, statement, *args, **kwargs)
+            if isinstance(statement, db_utils.InsertFromSelect):
+                orig_execute(conn, self.table1.update().
+                             where(self.table1.c.uuid == self.uuidstrs[1]).
+                             values(deleted=1))
+            return result
+
+        self.stubs.Set(sqlalchemy.engine.base.Connection, 'execute',
+                       fake_execute)
+        num = db.archive_deleted_rows_for_table(self.context, tablename,
+                                                max_rows=2)
+        self.stubs.UnsetAll()
+        self.assertEqual(2, num)
+        query1 = select([self.table1.c.uuid]).where(
+                self.table1.c.uuid.in_(self.uuidstrs))
+        self.assertEqual(4, len(self.conn.execute(query1).fetchall()))
+        query2 = select([self.shadow_table1.c.uuid]).where(
+                self.shadow_table1.c.uuid.in_(self.uuidstrs))
+        self.assertEqual(set([self.uuidstrs[0], self.uuidstrs[2]]),
+                         set(row[0] for row in
+                             self.conn.execute(query2).fetchall()))
+        # The late deletion is archived by the next batch.
+        num = db.archive_deleted_rows_for_table(self.context, tablename,
+                                                max_rows=2)
+        self.assertEqual(1, num)
+
     def test_archive_deleted_rows_no_id_column(self):
         uuidstr0 = self.uuidstrs[0]
         insert_statement = self.table2.insert().values(domain=uuidstr0)
@@ -3806,3 +4452,53 @@ class ArchiveTestCase(test.TestCase):
         # Then archiving console_pools should work.
         num = db.archive_deleted_rows_for_table(self.context, "console_pools")
         self.assertEqual(num, 1)
+
+    def test_archive_tablenames_dependency_order(self):
+        tablenames = sqlalchemy_api._archive_tablenames()
+        # consoles.pool_id depends on console_pools.id
+        self.assertTrue(tablenames.index('consoles') <
+                        tablenames.index('console_pools'))
+        # instance_metadata.instance_uuid depends on instances.uuid
+        self.assertTrue(tablenames.index('instance_metadata') <
+                        tablenames.index('instances'))
+
+    def test_archive_deleted_rows_dependent_tables(self):
+        insert_statement = self.console_pools.insert().values(deleted=1)
+        result = self.conn.execute(insert_statement)
+        id1 = result.inserted_primary_key[0]
+        self.ids.append(id1)
+        insert_statement = self.consoles.insert().values(deleted=1,
+                                                         pool_id=id1)
+        result = self.conn.execute(insert_statement)
+        self.ids.append(result.inserted_primary_key[0])
+        # Both tables are archived in one pass.
+        num = db.archive_deleted_rows(self.context)
+        self.assertEqual(num, 2)
+        rows = self.conn.execute(select([self.shadow_console_pools]).where(
+                self.shadow_console_pools.c.id == id1)).fetchall()
+        self.assertEqual(len(rows), 1)
+
+    def test_archive_deleted_rows_in_batches(self):
+        for uuidstr in self.uuidstrs:
+            insert_statement = self.table1.insert().values(uuid=uuidstr,
+                                                           deleted=1)
+            self.conn.execute(insert_statement)
+        sleeps = []
+        self.stubs.Set(time, 'sleep', sleeps.append)
+        num = db.archive_deleted_rows_in_batches(self.context, 4,
+                                                 throttle=0.5)
+        self.assertEqual(num, 6)
+        self.assertEqual(sleeps, [0.5])
+        query = select([self.shadow_table1]).\
+                where(self.shadow_table1.c.uuid.in_(self.uuidstrs))
+        self.assertEqual(len(self.conn.execute(query).fetchall()), 6)
+
+    def test_archive_deleted_rows_in_batches_time_limit(self):
+        for uuidstr in self.uuidstrs:
+            insert_statement = self.table1.insert().values(uuid=uuidstr,
+                                                           deleted=1)
+            self.conn.execute(insert_statement)
+        self.stubs.Set(time, 'sleep', lambda seconds: None)
+        num = db.archive_deleted_rows_in_batches(self.context, 2,
+                                                 time_limit=0)
+        self.assertEqual(num, 2)
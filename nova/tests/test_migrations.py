@@ -1334,6 +1334,32 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
         cell = cells.select(cells.c.id == 5).execute().first()
         self.assertEqual(0, cell.deleted)
 
+    # migration 180 - add indexes used for paging through instances
+    def _check_180(self, engine, data):
+        instances = get_table(engine, 'instances')
+        index_names = [index.name for index in instances.indexes]
+        self.assertTrue('instances_deleted_created_at_id_idx' in index_names)
+        self.assertTrue('instances_project_id_deleted_created_at_id_idx'
+                        in index_names)
+
+    def _post_downgrade_180(self, engine):
+        instances = get_table(engine, 'instances')
+        index_names = [index.name for index in instances.indexes]
+        self.assertFalse('instances_deleted_created_at_id_idx' in index_names)
+        self.assertFalse('instances_project_id_deleted_created_at_id_idx'
+                         in index_names)
+
+    # migration 181 - add an index on instances.display_name
+    def _check_181(self, engine, data):
+        instances = get_table(engine, 'instances')
+        index_names = [index.name for index in instances.indexes]
+        self.assertTrue('instances_display_name_idx' in index_names)
+
+    def _post_downgrade_181(self, engine):
+        instances = get_table(engine, 'instances')
+        index_names = [index.name for index in instances.indexes]
+        self.assertFalse('instances_display_name_idx' in index_names)
+
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
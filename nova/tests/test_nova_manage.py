@@ -16,6 +16,7 @@
 #    under the License.
 
 import fixtures
+import mox
 import StringIO
 import sys
 
@@ -57,6 +58,15 @@ class FixedIpCommandsTestCase(test.TestCase):
         self.commands.list()
         self.assertTrue(sys.stdout.getvalue().find('192.168.0.100') != -1)
 
+    def test_list_no_fixed_ips(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.db.fixed_ip_get_all_iter',
+            lambda *args, **kwargs: iter([])))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.assertEqual(2, self.commands.list())
+        self.assertTrue(sys.stdout.getvalue().startswith('error: '))
+
     def test_list_just_one_host(self):
         def fake_fixed_ip_get_by_host(*args, **kwargs):
             return [db_fakes.fixed_ip_fields]
@@ -391,6 +401,29 @@ class DBCommandsTestCase(test.TestCase):
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    def test_archive_deleted_rows_continuous(self):
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_in_batches')
+        db.archive_deleted_rows_in_batches(mox.IgnoreArg(), 1000,
+                                           time_limit=None,
+                                           throttle=0.5).AndReturn(5)
+        self.mox.ReplayAll()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.archive_deleted_rows(None, continuous=True,
+                                           throttle='0.5')
+        self.assertTrue('5' in sys.stdout.getvalue())
+
+    def test_archive_deleted_rows_continuous_time_limit(self):
+        self.mox.StubOutWithMock(db, 'archive_deleted_rows_in_batches')
+        db.archive_deleted_rows_in_batches(mox.IgnoreArg(), 10,
+                                           time_limit=30,
+                                           throttle=0.0).AndReturn(0)
+        self.mox.ReplayAll()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.archive_deleted_rows('10', continuous=True,
+                                           time_limit='30')
+
 
 class ServiceCommandsTestCase(test.TestCase):
     def setUp(self):
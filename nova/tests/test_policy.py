@@ -24,6 +24,7 @@ import urllib2
 from nova import context
 from nova import exception
 from nova.openstack.common import policy as common_policy
+from nova.openstack.common import timeutils
 from nova import policy
 from nova import test
 from nova import utils
@@ -147,6 +148,120 @@ class PolicyTestCase(test.TestCase):
         policy.enforce(admin_context, uppercase_action, self.target)
 
 
+class CompiledPolicyTestCase(PolicyTestCase):
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        self.flags(policy_compile=True)
+
+    def _count_calls(self):
+        calls = []
+        orig_get_compiled = policy._get_compiled
+
+        def fake_get_compiled(action):
+            func, target_keys, creds_keys = orig_get_compiled(action)
+
+            def counted(target, creds):
+                calls.append(action)
+                return func(target, creds)
+            return counted, target_keys, creds_keys
+
+        self.stubs.Set(policy, '_get_compiled', fake_get_compiled)
+        return calls
+
+    def test_results_remembered(self):
+        calls = self._count_calls()
+        policy.enforce(self.context, "example:my_file", {'project_id': 'fake'})
+        policy.enforce(self.context, "example:my_file", {'project_id': 'fake'})
+        self.assertEqual(1, len(calls))
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:my_file",
+                          {'project_id': 'another'})
+        self.assertEqual(2, len(calls))
+
+        # Targets keys which are not used by the rule are ignored
+        policy.enforce(self.context, "example:my_file",
+                       {'project_id': 'fake', 'user_id': 'other'})
+        self.assertEqual(2, len(calls))
+
+    def test_results_remembered_per_context(self):
+        other = context.RequestContext('fake', 'fake', roles=['member'])
+        calls = self._count_calls()
+        policy.enforce(self.context, "example:allowed", {})
+        policy.enforce(other, "example:allowed", {})
+        policy.enforce(other, "example:allowed", {})
+        self.assertEqual(2, len(calls))
+
+    def test_role_change_not_remembered(self):
+        action = "example:lowercase_admin"
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, self.target)
+        policy.enforce(self.context.elevated(), action, self.target)
+
+    def test_http_results_not_remembered(self):
+        results = ["True", "False"]
+
+        def fakeurlopen(url, post_data):
+            return StringIO.StringIO(results.pop(0))
+        self.stubs.Set(urllib2, 'urlopen', fakeurlopen)
+        action = "example:get_http"
+        policy.enforce(self.context, action, {})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, {})
+
+    def test_new_rules_compiled(self):
+        policy.enforce(self.context, "example:allowed", {})
+        self.policy.set_rules({"example:allowed": "!"})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:allowed", {})
+
+    def test_rule_reference(self):
+        self.policy.set_rules({"admin": "role:admin",
+                               "example:admin": "rule:admin",
+                               "example:missing": "rule:missing"})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:admin", {})
+        policy.enforce(self.context.elevated(), "example:admin", {})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context.elevated(), "example:missing", {})
+
+    def test_missing_target_key_fails(self):
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, "example:my_file", {})
+
+    def test_false_result_fails(self):
+        for denied in (None, 0, ''):
+            self.stubs.Set(policy, '_get_compiled',
+                           lambda action: (lambda target, creds: denied,
+                                           None, None))
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              self.context, "example:allowed", {})
+            self.assertEqual(False, policy.enforce(self.context,
+                                                   "example:allowed", {},
+                                                   do_raise=False))
+
+
+class PolicyReloadIntervalTestCase(test.TestCase):
+    def test_policy_file_checked_on_interval(self):
+        self.flags(policy_reload_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        calls = []
+        orig_read_cached_file = utils.read_cached_file
+
+        def fake_read_cached_file(*args, **kwargs):
+            calls.append(args[0])
+            return orig_read_cached_file(*args, **kwargs)
+
+        self.stubs.Set(utils, 'read_cached_file', fake_read_cached_file)
+        policy.reset()
+        policy.init()
+        policy.init()
+        self.assertEqual(1, len(calls))
+        timeutils.advance_time_seconds(61)
+        policy.init()
+        self.assertEqual(2, len(calls))
+
+
 class DefaultPolicyTestCase(test.TestCase):
 
     def setUp(self):
@@ -180,6 +295,12 @@ class DefaultPolicyTestCase(test.TestCase):
                 self.context, "example:noexist", {})
 
 
+class CompiledDefaultPolicyTestCase(DefaultPolicyTestCase):
+    def setUp(self):
+        super(CompiledDefaultPolicyTestCase, self).setUp()
+        self.flags(policy_compile=True)
+
+
 class IsAdminCheckTestCase(test.TestCase):
     def test_init_true(self):
         check = policy.IsAdminCheck('is_admin', 'True')
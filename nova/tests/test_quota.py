@@ -1934,6 +1934,188 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                 ])
 
 
+class OptimisticDbQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(OptimisticDbQuotaDriverTestCase, self).setUp()
+        self.flags(quota_instances=2, quota_cores=4, until_refresh=0,
+                   max_age=0)
+        self.driver = quota.OptimisticDbQuotaDriver()
+        self.context = context.RequestContext('admin', 'test_project',
+                                              is_admin=True)
+        self.in_use = dict(instances=0, cores=0)
+        self.sync_called = []
+
+        def make_sync(res_name):
+            def sync(context, project_id, session):
+                self.sync_called.append(res_name)
+                return {res_name: self.in_use[res_name]}
+            return sync
+
+        self.resources = dict(
+            instances=quota.ReservableResource('instances',
+                                               make_sync('instances'),
+                                               'quota_instances'),
+            cores=quota.ReservableResource('cores', make_sync('cores'),
+                                           'quota_cores'))
+
+    def _get_usages(self):
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'test_project')
+        del usages['project_id']
+        return usages
+
+    def test_reserve(self):
+        reservations = self.driver.reserve(self.context, self.resources,
+                                           dict(instances=1, cores=2))
+        self.assertEqual(2, len(reservations))
+        self.assertEqual(['cores', 'instances'], sorted(self.sync_called))
+        self.assertEqual(dict(instances=dict(in_use=0, reserved=1),
+                              cores=dict(in_use=0, reserved=2)),
+                         self._get_usages())
+
+    def test_reserve_existing_usage_not_refreshed(self):
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.in_use['instances'] = 1
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        # The usage exists, so it is not refreshed again
+        self.assertEqual(['instances'], self.sync_called)
+        self.assertEqual(dict(in_use=0, reserved=2),
+                         self._get_usages()['instances'])
+
+    def test_reserve_max_age_refreshes_usage(self):
+        self.flags(max_age=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.driver.reserve(self.context, self.resources, dict(instances=0))
+        self.in_use['instances'] = 1
+        self.driver.reserve(self.context, self.resources, dict(instances=0))
+        self.assertEqual(['instances'], self.sync_called)
+
+        timeutils.advance_time_seconds(61)
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.assertEqual(['instances', 'instances'], self.sync_called)
+        self.assertEqual(dict(in_use=1, reserved=1),
+                         self._get_usages()['instances'])
+
+    def test_reserve_refresh_keeps_concurrent_change(self):
+        self.flags(until_refresh=1)
+        self.driver.reserve(self.context, self.resources, dict(instances=0))
+        self.in_use['instances'] = 1
+
+        def sync(context, project_id, session):
+            self.sync_called.append('instances')
+            # Somebody else changes the usage while it is refreshed
+            db.quota_usage_update(self.context, 'test_project', 'instances',
+                                  in_use=2)
+            return {'instances': 1}
+
+        self.stubs.Set(self.resources['instances'], 'sync', sync)
+        self.driver.reserve(self.context, self.resources, dict(instances=0))
+        self.assertEqual(['instances', 'instances'], self.sync_called)
+        self.assertEqual(dict(in_use=2, reserved=0),
+                         self._get_usages()['instances'])
+
+    def test_reserve_until_refresh(self):
+        self.flags(until_refresh=2)
+        for i in xrange(3):
+            self.driver.reserve(self.context, self.resources,
+                                dict(instances=0))
+        # Refreshed on creation and once the count ran out
+        self.assertEqual(['instances', 'instances'], self.sync_called)
+
+    def test_reserve_over_quota(self):
+        self.assertRaises(exception.OverQuota, self.driver.reserve,
+                          self.context, self.resources,
+                          dict(instances=1, cores=5))
+        # The reservation of the instance was released again
+        self.assertEqual(dict(instances=dict(in_use=0, reserved=0),
+                              cores=dict(in_use=0, reserved=0)),
+                         self._get_usages())
+
+    def test_reserve_over_quota_with_reservations(self):
+        self.driver.reserve(self.context, self.resources, dict(instances=2))
+        try:
+            self.driver.reserve(self.context, self.resources,
+                                dict(instances=1))
+            self.fail('OverQuota not raised')
+        except exception.OverQuota as e:
+            self.assertEqual(['instances'], e.kwargs['overs'])
+            self.assertEqual(dict(in_use=0, reserved=2),
+                             e.kwargs['usages']['instances'])
+
+    def test_reserve_reduction(self):
+        self.in_use['instances'] = 2
+        self.driver.reserve(self.context, self.resources, dict(instances=-1))
+        self.assertEqual(dict(in_use=2, reserved=0),
+                         self._get_usages()['instances'])
+
+    def test_commit(self):
+        reservations = self.driver.reserve(self.context, self.resources,
+                                           dict(instances=1, cores=2))
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(dict(instances=dict(in_use=1, reserved=0),
+                              cores=dict(in_use=2, reserved=0)),
+                         self._get_usages())
+        # Committing again does not count the reservations twice
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(dict(in_use=1, reserved=0),
+                         self._get_usages()['instances'])
+
+    def test_rollback(self):
+        reservations = self.driver.reserve(self.context, self.resources,
+                                           dict(instances=1, cores=2))
+        self.driver.rollback(self.context, reservations)
+        self.driver.rollback(self.context, reservations)
+        self.assertEqual(dict(instances=dict(in_use=0, reserved=0),
+                              cores=dict(in_use=0, reserved=0)),
+                         self._get_usages())
+
+    def test_reserve_concurrent_usage_create(self):
+        orig_quota_usage_create = sqa_api._quota_usage_create
+
+        def fake_quota_usage_create(context, project_id, resource, *args,
+                                    **kwargs):
+            # A concurrent reservation created the usage first and
+            # reserved one instance from it.
+            orig_quota_usage_create(context, project_id, resource, 0, 1,
+                                    None)
+            return orig_quota_usage_create(context, project_id, resource,
+                                           *args, **kwargs)
+
+        self.stubs.Set(sqa_api, '_quota_usage_create',
+                       fake_quota_usage_create)
+        self.assertRaises(exception.OverQuota, self.driver.reserve,
+                          self.context, self.resources, dict(instances=2))
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.assertEqual(dict(in_use=0, reserved=2),
+                         self._get_usages()['instances'])
+        usages = sqa_api.model_query(self.context, sqa_models.QuotaUsage)
+        self.assertEqual(1, usages.filter_by(resource='instances').count())
+
+    def test_expire(self):
+        reservations = self.driver.reserve(self.context, self.resources,
+                                           dict(instances=1), expire=-1)
+        self.driver.reserve(self.context, self.resources, dict(instances=1))
+        self.driver.expire(self.context)
+        self.assertEqual(dict(in_use=0, reserved=1),
+                         self._get_usages()['instances'])
+        # An expired reservation is not rolled back again
+        self.driver.rollback(self.context, reservations)
+        self.assertEqual(dict(in_use=0, reserved=1),
+                         self._get_usages()['instances'])
+
+    def test_reserve_failure_releases_usages(self):
+        def fake_reservation_create(*args, **kwargs):
+            raise test.TestingException()
+
+        self.stubs.Set(sqa_api, 'reservation_create',
+                       fake_reservation_create)
+        self.assertRaises(test.TestingException, self.driver.reserve,
+                          self.context, self.resources, dict(instances=1))
+        self.assertEqual(dict(in_use=0, reserved=0),
+                         self._get_usages()['instances'])
+
+
 class NoopQuotaDriverTestCase(test.TestCase):
     def setUp(self):
         super(NoopQuotaDriverTestCase, self).setUp()
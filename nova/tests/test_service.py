@@ -171,6 +171,45 @@ class ServiceTestCase(test.TestCase):
                                'nova.tests.test_service.FakeManager')
         serv.start()
 
+    def test_pre_fork(self):
+        self.mox.StubOutWithMock(db, 'dispose_engine')
+        service_ref = self._service_start_mocks()
+        db.dispose_engine()
+        self.mox.ReplayAll()
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.pre_fork()
+        self.assertEqual(service_ref, serv.service_ref)
+        self.assertEqual(1, serv.service_id)
+
+    def test_start_after_pre_fork(self):
+        self.mox.StubOutWithMock(db, 'dispose_engine')
+        self._service_start_mocks()
+        db.dispose_engine()
+        self.mox.ReplayAll()
+
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        serv.pre_fork()
+        # The service record is not looked up again by the worker
+        serv.start()
+        serv.stop()
+
+    def test_stop_flushes_instance_updates(self):
+        serv = service.Service(self.host,
+                               self.binary,
+                               self.topic,
+                               'nova.tests.test_service.FakeManager')
+        self.mox.StubOutWithMock(serv.conductor_api, 'flush_updates')
+        serv.conductor_api.flush_updates()
+        self.mox.ReplayAll()
+        serv.stop()
+
 
 class TestWSGIService(test.TestCase):
 
@@ -29,7 +29,9 @@ import netaddr
 from oslo.config import cfg
 
 import nova
+from nova.db.sqlalchemy import models
 from nova import exception
+from nova.openstack.common import jsonutils
 from nova.openstack.common import processutils
 from nova.openstack.common import timeutils
 from nova import test
@@ -811,6 +813,55 @@ class MetadataToDictTestCase(test.TestCase):
         self.assertEqual(utils.dict_to_metadata({}), [])
 
 
+class ToPrimitiveTestCase(test.TestCase):
+    def _check(self, value, **kwargs):
+        self.assertEqual(jsonutils.to_primitive(value, **kwargs),
+                         utils.to_primitive(value, **kwargs))
+
+    def test_plain_data(self):
+        now = datetime.datetime(2013, 5, 1, 12, 0, 0)
+        value = {'a': 1, 'b': u'b', 'c': None, 'd': [1, 2.0, (3, 'x')],
+                 'e': {'created_at': now, 'deleted': False}}
+        self._check(value)
+        self.assertEqual('2013-05-01T12:00:00.000000',
+                         utils.to_primitive(value)['e']['created_at'])
+        self._check(value, convert_datetime=False)
+
+    def test_depth_limit(self):
+        value = [[[[[['deep']]]]]]
+        self._check(value)
+        self._check({'a': {'b': {'c': {'d': {'e': 1}}}}}, max_depth=1)
+
+    def test_other_types(self):
+        class IterItems(object):
+            def iteritems(self):
+                return iter([('a', [1, set([2])])])
+
+        class Instance(object):
+            def __init__(self):
+                self.a = {'b': 1}
+
+        self._check([IterItems(), set([1]), xrange(2)])
+        self._check(Instance(), convert_instances=True)
+        self._check(Instance())
+
+    def test_models(self):
+        inst_type = models.InstanceTypes(
+            id=1, name='m1.tiny', memory_mb=512,
+            created_at=datetime.datetime(2013, 5, 1, 12, 0, 0))
+        self._check(inst_type)
+        self._check({'a': [inst_type]}, max_depth=1)
+
+        def fake_to_primitive(*args, **kwargs):
+            self.fail('Models should not need jsonutils.to_primitive()')
+
+        self.stubs.Set(jsonutils, 'to_primitive', fake_to_primitive)
+        result = utils.to_primitive([inst_type])
+        self.assertEqual('m1.tiny', result[0]['name'])
+        self.assertEqual('2013-05-01T12:00:00.000000',
+                         result[0]['created_at'])
+
+
 class WrappedCodeTestCase(test.TestCase):
     """Test the get_wrapped_function utility method."""
 
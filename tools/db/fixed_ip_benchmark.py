@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of fixed ip allocation in a large network.
+
+A network with the given number of fixed ips is created, and a number of
+threads allocate addresses from it with fixed_ip_associate_pool.  The
+mean, median and 99th percentile latency of the allocations are printed.
+
+The database is taken from sql_connection in the given config file and is
+synced to the latest schema.  Use a scratch MySQL or PostgreSQL database;
+the network and its fixed ips are deleted afterwards.
+
+Run like:
+
+    ./tools/db/fixed_ip_benchmark.py --config-file bench.conf --size 65536
+"""
+import gettext
+import os
+import sys
+import threading
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db import migration
+
+benchmark_opts = [
+    cfg.IntOpt('size',
+               default=65536,
+               help='Number of fixed ips in the network'),
+    cfg.IntOpt('threads',
+               default=10,
+               help='Number of threads allocating in parallel'),
+    cfg.IntOpt('count',
+               default=100,
+               help='Number of addresses allocated by each thread'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(benchmark_opts)
+
+
+def allocate(ctxt, network_id, count, latencies):
+    for i in xrange(count):
+        start = time.time()
+        db.fixed_ip_associate_pool(ctxt, network_id, host='benchmark')
+        latencies.append(time.time() - start)
+
+
+def main():
+    config.parse_args(sys.argv)
+    migration.db_sync()
+    ctxt = context.get_admin_context()
+
+    network = db.network_create_safe(ctxt, {'label': 'fixed-ip-benchmark'})
+    print 'Creating %d fixed ips' % CONF.size
+    db.fixed_ip_bulk_create(ctxt, [
+            {'network_id': network['id'],
+             'address': '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255,
+                                         i & 255)}
+            for i in xrange(CONF.size)])
+
+    latencies = []
+    threads = [threading.Thread(target=allocate,
+                                args=(ctxt, network['id'], CONF.count,
+                                      latencies))
+               for i in xrange(CONF.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    print '%d allocations by %d threads in %.2f seconds' % (
+            len(latencies), CONF.threads, elapsed)
+    print 'latency mean %.2f ms, median %.2f ms, 99th percentile %.2f ms' % (
+            1000 * sum(latencies) / len(latencies),
+            1000 * latencies[len(latencies) / 2],
+            1000 * latencies[int(len(latencies) * 0.99)])
+
+    db.network_delete_safe(ctxt, network['id'])
+
+
+if __name__ == '__main__':
+    main()
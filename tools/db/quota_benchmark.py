@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of parallel quota reservations within a single project.
+
+A number of threads reserve and commit quota for the same project as fast
+as they can, once for each of the database quota drivers, and the number
+of reservations per second and of failed reservations are printed.
+
+The database is taken from sql_connection in the given config file and is
+synced to the latest schema.  Use a scratch MySQL or PostgreSQL database:
+SQLite serializes all writers, and the quotas, usages and reservations of
+the benchmark project are deleted.
+
+Run like:
+
+    ./tools/db/quota_benchmark.py --config-file bench.conf --threads 20
+"""
+import gettext
+import os
+import sys
+import threading
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova import context
+from nova import db
+from nova.db import migration
+from nova import quota
+
+benchmark_opts = [
+    cfg.IntOpt('threads',
+               default=10,
+               help='Number of threads reserving in parallel'),
+    cfg.IntOpt('count',
+               default=20,
+               help='Number of reservations made by each thread'),
+    cfg.ListOpt('drivers',
+                default=['nova.quota.DbQuotaDriver',
+                         'nova.quota.OptimisticDbQuotaDriver'],
+                help='Quota drivers to benchmark'),
+    cfg.StrOpt('project',
+               default='quota-benchmark',
+               help='Project the reservations are made for'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(benchmark_opts)
+
+DELTAS = dict(instances=1, cores=1, ram=512)
+
+
+def reserve(driver, ctxt, resources, count, results):
+    for i in xrange(count):
+        try:
+            reservations = driver.reserve(ctxt, resources, DELTAS)
+            driver.commit(ctxt, reservations)
+            results.append(True)
+        except Exception:
+            results.append(False)
+
+
+def run(driver_name, ctxt):
+    driver = quota.QuotaEngine(quota_driver_class=driver_name)._driver
+    resources = quota.QUOTAS._resources
+    db.quota_destroy_all_by_project(ctxt, CONF.project)
+    total = CONF.threads * CONF.count
+    for resource, delta in DELTAS.items():
+        db.quota_create(ctxt, CONF.project, resource, total * delta)
+
+    results = []
+    threads = [threading.Thread(target=reserve,
+                                args=(driver, ctxt, resources, CONF.count,
+                                      results))
+               for i in xrange(CONF.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    succeeded = results.count(True)
+    print '%-40s %8.1f reservations/s %6d failed' % (
+            driver_name, succeeded / elapsed, results.count(False))
+    db.quota_destroy_all_by_project(ctxt, CONF.project)
+
+
+def main():
+    config.parse_args(sys.argv)
+    migration.db_sync()
+    ctxt = context.RequestContext('quota-benchmark', CONF.project,
+                                  is_admin=True)
+    print '%d threads, %d reservations each, one project' % (CONF.threads,
+                                                             CONF.count)
+    for driver_name in CONF.drivers:
+        run(driver_name, ctxt)
+
+
+if __name__ == '__main__':
+    main()
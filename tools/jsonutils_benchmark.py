@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of nova.utils.to_primitive, jsonutils.to_primitive and
+jsonutils.dumps.
+
+Three payloads are timed: an instance dict as sent over RPC, the
+network_info of an instance with two ports, and a servers/detail response
+with 1000 servers.
+
+Run like:
+
+    ./tools/jsonutils_benchmark.py --count 100
+"""
+import datetime
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova import config
+from nova.openstack.common import jsonutils
+from nova import utils
+
+benchmark_opts = [
+    cfg.IntOpt('count',
+               default=100,
+               help='Number of times each payload is converted'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(benchmark_opts)
+
+
+def instance(i):
+    now = datetime.datetime(2013, 5, 1, 12, 0, 0)
+    return {
+        'id': i, 'uuid': '%08d-1111-2222-3333-444444444444' % i,
+        'user_id': 'fake-user', 'project_id': 'fake-project',
+        'image_ref': '155d900f-4e14-4e4c-a73d-069cbf4541e6',
+        'kernel_id': '', 'ramdisk_id': '', 'hostname': 'server-%d' % i,
+        'display_name': u'server-%d' % i, 'display_description': None,
+        'host': 'compute-%d' % (i % 50), 'node': 'compute-%d' % (i % 50),
+        'launch_index': 0, 'key_name': 'key', 'key_data': 'ssh-rsa AAAA',
+        'power_state': 1, 'vm_state': 'active', 'task_state': None,
+        'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20, 'ephemeral_gb': 0,
+        'instance_type_id': 5, 'reservation_id': 'r-abcdefgh',
+        'launched_at': now, 'terminated_at': None, 'scheduled_at': now,
+        'created_at': now, 'updated_at': now, 'deleted_at': None,
+        'deleted': 0, 'locked': False, 'progress': 100,
+        'availability_zone': 'nova', 'access_ip_v4': None,
+        'access_ip_v6': None, 'config_drive': '', 'cell_name': None,
+        'metadata': [{'key': 'k%d' % k, 'value': 'v%d' % k}
+                     for k in range(3)],
+        'system_metadata': [{'key': 'instance_type_%s' % k, 'value': '1'}
+                            for k in ('memory_mb', 'vcpus', 'root_gb',
+                                      'ephemeral_gb', 'flavorid', 'name',
+                                      'swap', 'rxtx_factor', 'vcpu_weight',
+                                      'id')],
+        'info_cache': {'network_info': '[]', 'instance_uuid': i},
+        'security_groups': [{'id': 1, 'name': 'default',
+                             'description': 'default', 'rules': []}],
+    }
+
+
+def network_info():
+    def vif(n):
+        return {
+            'id': 'vif-%d' % n, 'address': 'fa:16:3e:00:00:%02x' % n,
+            'devname': 'tap%d' % n, 'ovs_interfaceid': None,
+            'network': {
+                'id': 'net-%d' % n, 'bridge': 'br100', 'label': 'private',
+                'injected': False,
+                'meta': {'tenant_id': 'fake-project', 'should_create_vlan':
+                         False, 'multi_host': True},
+                'subnets': [{
+                    'cidr': '10.0.%d.0/24' % n, 'version': 4,
+                    'gateway': {'address': '10.0.%d.1' % n, 'type':
+                                'gateway', 'version': 4, 'meta': {}},
+                    'dns': [{'address': '8.8.8.8', 'type': 'dns',
+                             'version': 4, 'meta': {}}],
+                    'routes': [],
+                    'ips': [{'address': '10.0.%d.3' % n, 'type': 'fixed',
+                             'version': 4, 'meta': {},
+                             'floating_ips': [{'address': '172.24.4.%d' % n,
+                                               'type': 'floating',
+                                               'version': 4, 'meta': {}}]}],
+                    'meta': {'dhcp_server': '10.0.%d.1' % n}}]}}
+    return [vif(n) for n in range(2)]
+
+
+def server_list():
+    def server(i):
+        return {
+            'id': '%08d-1111-2222-3333-444444444444' % i,
+            'name': 'server-%d' % i, 'status': 'ACTIVE',
+            'tenant_id': 'fake-project', 'user_id': 'fake-user',
+            'metadata': {'k0': 'v0', 'k1': 'v1'}, 'hostId': 'a' * 56,
+            'image': {'id': '155d900f-4e14-4e4c-a73d-069cbf4541e6',
+                      'links': [{'rel': 'bookmark',
+                                 'href': 'http://localhost/images/1'}]},
+            'flavor': {'id': '1',
+                       'links': [{'rel': 'bookmark',
+                                  'href': 'http://localhost/flavors/1'}]},
+            'created': '2013-05-01T12:00:00Z',
+            'updated': '2013-05-01T12:00:00Z',
+            'addresses': {'private': [{'version': 4, 'addr': '10.0.0.3'}]},
+            'accessIPv4': '', 'accessIPv6': '', 'progress': 100,
+            'links': [{'rel': 'self',
+                       'href': 'http://localhost/v2/servers/%d' % i},
+                      {'rel': 'bookmark',
+                       'href': 'http://localhost/servers/%d' % i}]}
+    return {'servers': [server(i) for i in range(1000)]}
+
+
+def run(name, func, payload):
+    start = time.time()
+    for i in xrange(CONF.count):
+        func(payload)
+    elapsed = time.time() - start
+    print '%-40s %10.3f ms' % (name, 1000 * elapsed / CONF.count)
+
+
+def main():
+    config.parse_args(sys.argv)
+    payloads = [('instance', instance(1)),
+                ('network_info', network_info()),
+                ('1000 servers', server_list())]
+    for name, payload in payloads:
+        run('utils.to_primitive %s' % name, utils.to_primitive, payload)
+        run('jsonutils.to_primitive %s' % name, jsonutils.to_primitive,
+            payload)
+        run('dumps %s' % name, jsonutils.dumps, payload)
+
+
+if __name__ == '__main__':
+    main()
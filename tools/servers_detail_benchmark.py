@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of building the servers/detail response.
+
+The view of a list of servers is built from instances with two ports
+each, and the extended_ips and extended_ips_mac extensions are applied to
+it the way they are on a servers/detail request.  The time per response
+is printed.
+
+Run like:
+
+    ./tools/servers_detail_benchmark.py --servers 1000 --count 10
+"""
+import datetime
+import gettext
+import os
+import sys
+import time
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'nova', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('nova', unicode=1)
+
+from oslo.config import cfg
+
+from nova.api.openstack.compute.contrib import extended_ips
+from nova.api.openstack.compute.contrib import extended_ips_mac
+from nova.api.openstack.compute.views import servers as views_servers
+from nova.api.openstack import wsgi
+from nova import config
+from nova import context
+from nova.openstack.common import jsonutils
+
+benchmark_opts = [
+    cfg.IntOpt('servers',
+               default=1000,
+               help='Number of servers in the response'),
+    cfg.IntOpt('count',
+               default=10,
+               help='Number of times the response is built'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(benchmark_opts)
+
+
+def network_info(i):
+    def vif(n):
+        return {
+            'id': 'vif-%d' % n, 'address': 'fa:16:3e:00:%02x:%02x' % (i % 256,
+                                                                      n),
+            'devname': 'tap%d' % n, 'ovs_interfaceid': None,
+            'network': {
+                'id': 'net-%d' % n, 'bridge': 'br100',
+                'label': 'net-%d' % n, 'injected': False,
+                'meta': {'tenant_id': 'fake-project', 'multi_host': True},
+                'subnets': [{
+                    'cidr': '10.%d.0.0/16' % n, 'version': 4,
+                    'gateway': {'address': '10.%d.0.1' % n, 'type':
+                                'gateway', 'version': 4, 'meta': {}},
+                    'dns': [{'address': '8.8.8.8', 'type': 'dns',
+                             'version': 4, 'meta': {}}],
+                    'routes': [],
+                    'ips': [{'address': '10.%d.%d.%d' % (n, i / 256, i % 256),
+                             'type': 'fixed', 'version': 4, 'meta': {},
+                             'floating_ips': []}],
+                    'meta': {'dhcp_server': '10.%d.0.1' % n}}]}}
+    return jsonutils.dumps([vif(n) for n in range(2)])
+
+
+def instance(i):
+    now = datetime.datetime(2013, 5, 1, 12, 0, 0)
+    return {
+        'id': i, 'uuid': '%08d-1111-2222-3333-444444444444' % i,
+        'user_id': 'fake-user', 'project_id': 'fake-project',
+        'image_ref': '155d900f-4e14-4e4c-a73d-069cbf4541e6',
+        'display_name': u'server-%d' % i, 'host': 'compute-%d' % (i % 50),
+        'vm_state': 'active', 'task_state': None, 'progress': 100,
+        'created_at': now, 'updated_at': now, 'access_ip_v4': None,
+        'access_ip_v6': None,
+        'metadata': [{'key': 'k%d' % k, 'value': 'v%d' % k}
+                     for k in range(3)],
+        'system_metadata': [{'key': 'instance_type_%s' % k, 'value': '1'}
+                            for k in ('memory_mb', 'vcpus', 'root_gb',
+                                      'ephemeral_gb', 'flavorid', 'name',
+                                      'swap', 'rxtx_factor', 'vcpu_weight',
+                                      'id')],
+        'info_cache': {'network_info': network_info(i)},
+    }
+
+
+def build(instances, controllers):
+    req = wsgi.Request.blank('/v2/fake-project/servers/detail',
+                             base_url='http://localhost/v2')
+    ctxt = context.RequestContext('fake-user', 'fake-project',
+                                  is_admin=False)
+    req.environ['nova.context'] = ctxt
+    req.cache_db_instances(instances)
+
+    servers = views_servers.ViewBuilder().detail(req, instances)['servers']
+    for controller in controllers:
+        for server in servers:
+            controller._extend_server(req, server,
+                                      req.get_db_instance(server['id']))
+
+
+def main():
+    config.parse_args(sys.argv)
+    instances = [instance(i) for i in xrange(CONF.servers)]
+    controllers = [extended_ips.ExtendedIpsController(),
+                   extended_ips_mac.ExtendedIpsMacController()]
+    start = time.time()
+    for i in xrange(CONF.count):
+        build(instances, controllers)
+    elapsed = time.time() - start
+    print '%d servers: %.3f ms per response' % (
+            CONF.servers, 1000 * elapsed / CONF.count)
+
+
+if __name__ == '__main__':
+    main()